@@ -4,7 +4,9 @@ from glob import glob
 from urllib.parse import urlparse, urljoin
 
 from .libs.excel_wrapper import ExcelWrapper
-from .libs.md5lines import MD5Parser
+from .libs.md5_index import indexable, parse_manifest
+from .libs.md5lines import MD5Parser, stream_md5file
+from .libs.parse_pool import parse_sheets
 from .resource_metadata import resource_metadata_from_file
 
 
@@ -39,15 +41,36 @@ class BaseMetadata:
         rows = list(wrapper.get_all())
         return rows
 
+    def parse_spreadsheets(self, fnames, metadata_info):
+        """
+        parse each of `fnames`, in parallel. yields (fname, rows), ordered by
+        filename.
+        """
+        return parse_sheets(
+            type(self),
+            [(fname, metadata_info[os.path.basename(fname)]) for fname in fnames],
+            self._logger,
+        )
+
     def parse_md5file_unwrapped(self, fname):
         match = self.md5["match"]
         skip = self.md5["skip"]
         return MD5Parser(fname, match, skip)
 
     def parse_md5file(self, fname):
-        p = self.parse_md5file_unwrapped(fname)
-        for tpl in p.matches:
-            yield tpl
+        if not indexable(fname):
+            yield from stream_md5file(
+                fname,
+                self.md5["match"],
+                self.md5["skip"],
+                on_no_match=lambda tpl: self._logger.error(
+                    "No match for filename: `%s'" % tpl
+                ),
+            )
+            return
+        p = parse_manifest(fname, self.md5["match"], self.md5["skip"])
+        for record in p.records:
+            yield record.path, record.md5, record.groups.copy()
         for tpl in p.no_match:
             self._logger.error("No match for filename: `%s'" % tpl)
 
@@ -1,10 +1,17 @@
 import argparse
+import datetime
 import logging
 import sys
 import os
 
 from .util import make_registration_decorator, make_ckan_api, make_reuploads_cache_path
-from .sync import sync_metadata
+from .sync import (
+    DEFAULT_CHECK_CONCURRENCY,
+    DEFAULT_RESOURCE_CHECK_MODE,
+    DEFAULT_SYNC_CONCURRENCY,
+    RESOURCE_CHECK_MODES,
+    sync_metadata,
+)
 from .schema import generate_schemas
 from .ops import print_accounts, make_organization
 from .dump import dump_state
@@ -12,7 +19,28 @@ from .util import make_logger
 from .genhash import genhash as genhash_fn
 from .projects import ProjectInfo
 from .organizations import ORGANIZATIONS
-from .metadata import DownloadMetadata
+from .metadata import DownloadMetadata, download_metadata_options
+from .libs.fetch_data import DEFAULT_BUFFER_SIZE, DEFAULT_FETCH_CONCURRENCY
+from .libs.excel_wrapper import (
+    DEFAULT_EXCEL_BACKEND,
+    EXCEL_BACKENDS,
+    configure_excel_backend,
+)
+from .libs.http_client import (
+    DEFAULT_CONNECT_TIMEOUT,
+    DEFAULT_HTTP_RETRIES,
+    DEFAULT_READ_TIMEOUT,
+    configure_http,
+    print_http_accounts,
+)
+from .libs.listing import configure_listing_cache
+from .libs.parse_cache import DEFAULT_PARSE_CACHE_SIZE, configure_parse_cache
+from .libs.verification_cache import DEFAULT_VERIFICATION_MAX_AGE
+from .libs.parse_pool import (
+    DEFAULT_PARSE_WORKERS,
+    configure_parse_workers,
+    shutdown_parse_pool,
+)
 
 register_command, command_fns = make_registration_decorator()
 project_info = ProjectInfo()
@@ -67,6 +95,54 @@ def setup_sync(subparser):
     subparser.add_argument(
         "--uploads", type=int, default=4, help="number of parallel uploads"
     )
+    subparser.add_argument(
+        "--sync-concurrency",
+        type=int,
+        default=DEFAULT_SYNC_CONCURRENCY,
+        help="number of packages created, patched or deleted in parallel",
+    )
+    subparser.add_argument(
+        "--check-concurrency",
+        type=int,
+        default=DEFAULT_CHECK_CONCURRENCY,
+        help="number of resources checked in parallel",
+    )
+    subparser.add_argument(
+        "--resource-check-mode",
+        choices=RESOURCE_CHECK_MODES,
+        default=DEFAULT_RESOURCE_CHECK_MODE,
+        help="probe each resource through CKAN, or compare against a listing (inventory) of the uploads on S3",
+    )
+    subparser.add_argument(
+        "--s3-endpoint-url",
+        default=None,
+        help="S3 endpoint to list uploads from, in place of AWS (e.g. a local MinIO)",
+    )
+    subparser.add_argument(
+        "--verification-cache",
+        default=os.path.expanduser("~/.cache/bpaingest/verification.sqlite"),
+        help="where to record the resources which passed their checks",
+    )
+    subparser.add_argument(
+        "--verification-max-age",
+        type=float,
+        default=DEFAULT_VERIFICATION_MAX_AGE.days,
+        help="days for which a verified resource isn't checked again, unless its url or md5 change",
+    )
+    subparser.add_argument(
+        "--no-verification-cache",
+        action="store_const",
+        const=True,
+        default=False,
+        help="check every resource, and don't record the results",
+    )
+    subparser.add_argument(
+        "--trust-ckan-verification",
+        action="store_const",
+        const=True,
+        default=False,
+        help="skip resources whose s3_etag_verified_at in CKAN is recent, if they aren't in the verification cache",
+    )
     subparser.add_argument(
         "--metadata-only",
         "-m",
@@ -149,18 +225,30 @@ def setup_makeschema(subparser):
 @register_command
 def sync(args):
     """sync a project"""
-    ckan = make_ckan_api(args)
+    # packages are synced, and verifications written back, by pools of threads
+    ckan = make_ckan_api(args, max(args.sync_concurrency, args.check_concurrency))
 
     kwargs = {
         "write_reuploads": args.write_reuploads,
         "read_reuploads": args.read_reuploads,
         "reuploads_path": make_reuploads_cache_path(make_cli_logger(args), args),
+        "sync_concurrency": args.sync_concurrency,
+        "check_concurrency": args.check_concurrency,
+        "resource_check_mode": args.resource_check_mode,
+        "s3_endpoint_url": args.s3_endpoint_url,
+        "verification_cache_path": None
+        if args.no_verification_cache
+        else args.verification_cache,
+        "verification_max_age": datetime.timedelta(days=args.verification_max_age),
+        "trust_ckan_verification": args.trust_ckan_verification,
     }
     with DownloadMetadata(
         make_cli_logger(args),
         project_cli_options[args.project_name],
         path=args.download_path,
+        **download_metadata_options(args),
     ) as dlmeta:
+        kwargs["listing_index"] = dlmeta.listing_index
         sync_metadata(
             ckan,
             dlmeta.meta,
@@ -195,6 +283,7 @@ def genhash(args):
         make_cli_logger(args),
         project_cli_options[args.project_name],
         path=args.download_path,
+        **download_metadata_options(args),
     ) as dlmeta:
         genhash_fn(ckan, dlmeta.meta, args.mirror_path, num_threads=4)
         print_accounts()
@@ -244,6 +333,91 @@ def main():
     parser.add_argument(
         "--log-level", required=False, default="INFO", choices=LOG_LEVELS.keys()
     )
+    parser.add_argument(
+        "--fetch-concurrency",
+        type=int,
+        default=DEFAULT_FETCH_CONCURRENCY,
+        help="number of parallel requests when fetching metadata from the archive",
+    )
+    parser.add_argument(
+        "--fetch-buffer-size",
+        type=int,
+        default=DEFAULT_BUFFER_SIZE,
+        help="read and write buffer size (bytes) when downloading metadata files",
+    )
+    parser.add_argument(
+        "--metadata-mirror",
+        action="store_const",
+        const=True,
+        default=False,
+        help="keep the metadata in --download-path as a mirror, fetching only files which have changed",
+    )
+    parser.add_argument(
+        "--listing-cache-ttl",
+        type=int,
+        default=0,
+        help="cache archive directory listings on disk for this many seconds (0 to disable)",
+    )
+    parser.add_argument(
+        "--listing-cache-dir",
+        default=os.path.expanduser("~/.cache/bpaingest/listings"),
+        help="where to keep cached archive directory listings",
+    )
+    parser.add_argument(
+        "--invalidate-listing-cache",
+        action="store_const",
+        const=True,
+        default=False,
+        help="discard all cached archive directory listings before starting",
+    )
+    parser.add_argument(
+        "--no-parse-cache",
+        action="store_const",
+        const=True,
+        default=False,
+        help="parse every spreadsheet afresh, rather than using the parse cache",
+    )
+    parser.add_argument(
+        "--parse-cache-dir",
+        default=os.path.expanduser("~/.cache/bpaingest/parse"),
+        help="where to keep parsed spreadsheets",
+    )
+    parser.add_argument(
+        "--parse-cache-size",
+        type=int,
+        default=DEFAULT_PARSE_CACHE_SIZE // (1 << 20),
+        help="size (MiB) the parse cache is limited to",
+    )
+    parser.add_argument(
+        "--excel-backend",
+        choices=sorted(EXCEL_BACKENDS),
+        default=DEFAULT_EXCEL_BACKEND,
+        help="how to read xlsx metadata: xlrd loads each workbook into memory, openpyxl streams it",
+    )
+    parser.add_argument(
+        "--parse-workers",
+        type=int,
+        default=DEFAULT_PARSE_WORKERS,
+        help="number of processes parsing metadata spreadsheets (1 to parse serially)",
+    )
+    parser.add_argument(
+        "--http-connect-timeout",
+        type=float,
+        default=DEFAULT_CONNECT_TIMEOUT,
+        help="seconds to wait for a connection to the archive or CKAN",
+    )
+    parser.add_argument(
+        "--http-read-timeout",
+        type=float,
+        default=DEFAULT_READ_TIMEOUT,
+        help="seconds to wait for data from the archive or CKAN",
+    )
+    parser.add_argument(
+        "--http-retries",
+        type=int,
+        default=DEFAULT_HTTP_RETRIES,
+        help="times to retry a request after a connection error or server error",
+    )
 
     subparsers = parser.add_subparsers(dest="name")
     for name, fn, setup_fn, help_text in sorted(commands()):
@@ -257,4 +431,35 @@ def main():
     if "func" not in args:
         usage(parser)
     logging.basicConfig(level=LOG_LEVELS[args.log_level])
-    args.func(args)
+    configure_excel_backend(args.excel_backend)
+    parse_cache = configure_parse_cache(
+        args.parse_cache_dir,
+        args.parse_cache_size << 20,
+        enabled=not args.no_parse_cache,
+    )
+    configure_parse_workers(args.parse_workers)
+    configure_http(
+        concurrency=args.fetch_concurrency,
+        connect_timeout=args.http_connect_timeout,
+        read_timeout=args.http_read_timeout,
+        retries=args.http_retries,
+    )
+    listing_cache = configure_listing_cache(
+        args.listing_cache_dir,
+        args.listing_cache_ttl,
+        invalidate=args.invalidate_listing_cache,
+    )
+    try:
+        args.func(args)
+    finally:
+        shutdown_parse_pool()
+    if listing_cache is not None:
+        print(
+            "Listing cache: %d hits, %d misses"
+            % (listing_cache.hits, listing_cache.misses)
+        )
+    if parse_cache is not None:
+        print(
+            "Parse cache: %d hits, %d misses" % (parse_cache.hits, parse_cache.misses)
+        )
+    print_http_accounts()
@@ -3,7 +3,7 @@ import os
 import re
 from collections import defaultdict, Counter
 
-from .metadata import DownloadMetadata
+from .metadata import DownloadMetadata, download_metadata_options
 from .projects import ProjectInfo
 from .resource_metadata import (
     build_raw_resources_from_state_as_file,
@@ -127,6 +127,7 @@ def dump_state(args):
             class_info["cls"],
             path=dlpath,
             has_sql_context=has_sql_context,
+            **download_metadata_options(args),
         ) as dlmeta:
             meta = dlmeta.meta
             data_type = meta.ckan_data_type
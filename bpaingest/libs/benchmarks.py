@@ -0,0 +1,759 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for the hot paths of the ingest. Run them with:
+
+    python -m bpaingest.libs.benchmarks [name ...]
+
+Each benchmark is passed the command line arguments, and returns a dict of
+named variants (callables taking no arguments); the first variant is the one
+in use, and the others are alternatives (usually the implementation it
+replaced) to compare against. A variant may measure itself (e.g. in a
+subprocess) by returning a Measurement.
+
+Results can be saved as JSON with --save; a later run with --compare fails
+(exit status 1) if any variant has become slower by more than --threshold:
+
+    python -m bpaingest.libs.benchmarks --save baseline.json
+    python -m bpaingest.libs.benchmarks --compare baseline.json --threshold 0.25
+"""
+
+import argparse
+import atexit
+import datetime
+import importlib
+import json
+import os
+import platform
+import random
+import re
+import resource
+import sys
+import tempfile
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from glob import glob
+from io import BytesIO, StringIO
+from multiprocessing import get_context
+from urllib.parse import urljoin
+
+import openpyxl
+from bs4 import BeautifulSoup
+
+from bpaingest.util import make_logger, make_registration_decorator
+from . import excel_wrapper, ingest_utils
+from .bpa_constants import BPA_PREFIX
+from .common_resources import bsd_md5_re, linux_md5_re
+from .excel_wrapper import (
+    CompiledFieldSpec,
+    ExcelWrapper,
+    compile_field_spec,
+    make_backend,
+    make_field_definition,
+)
+from .listing import (
+    ListingEntry,
+    exact_size_re,
+    parse_listing,
+    parse_listing_date,
+    size_date_re,
+)
+from .md5lines import md5lines
+from .multihash import _generate_hashes
+from .raw_matcher import make_matcher
+
+
+register_benchmark, benchmark_fns = make_registration_decorator()
+logger = make_logger(__name__)
+
+# `seconds` is wall time, `peak_rss` the peak resident set size in MiB (if known)
+Measurement = namedtuple("Measurement", ["seconds", "peak_rss"])
+
+DEFAULT_REGRESSION_THRESHOLD = 0.25
+
+LISTING_URL = "https://downloads.example.com/bpa/amd/AGRF/"
+LISTING_ENTRIES = 5000
+
+
+def apache_listing(n):
+    rows = [
+        '<tr><td valign="top"><img src="/icons/back.gif" alt="[PARENTDIR]"></td>'
+        '<td><a href="/bpa/amd/">Parent Directory</a></td><td>&nbsp;</td>'
+        '<td align="right">  - </td></tr>'
+    ]
+    for i in range(n):
+        size = str(1000 + i) if i % 2 else "1.2G"
+        rows.append(
+            '<tr><td valign="top"><img src="/icons/unknown.gif" alt="[   ]"></td>'
+            '<td><a href="12345_{0}_R1.fastq.gz">12345_{0}_R1.fastq.gz</a></td>'
+            '<td align="right">2020-04-02 11:16  </td>'
+            '<td align="right">{1}</td></tr>'.format(i, size)
+        )
+    return ("<html><body><table>" + "\n".join(rows) + "</table></body></html>").encode(
+        "utf8"
+    )
+
+
+def nginx_listing(n):
+    lines = ['<html><body><pre><a href="../">../</a>']
+    for i in range(n):
+        lines.append(
+            '<a href="12345_{0}_R1.fastq.gz">12345_{0}_R1.fastq.gz</a>'
+            "                    02-Apr-2020 11:16  {1}".format(i, 1000 + i)
+        )
+    return ("\n".join(lines) + "</pre></body></html>").encode("utf8")
+
+
+def _bs4_text_after(link):
+    row = link.find_parent("tr")
+    if row is not None:
+        return " ".join(td.get_text(" ") for td in row.find_all("td"))
+    parts = []
+    for sibling in link.next_siblings:
+        if getattr(sibling, "name", None) == "a":
+            break
+        parts.append(sibling if isinstance(sibling, str) else sibling.get_text(" "))
+    return "".join(parts)
+
+
+def bs4_parse_listing(url, content):
+    "the BeautifulSoup listing parser which parse_listing replaced"
+    entries = []
+    fetched = set()
+    for link in BeautifulSoup(content, "html.parser").find_all("a"):
+        link_target = link.get("href")
+        if link_target in fetched:
+            continue
+        fetched.add(link_target)
+        size = modified = None
+        m = size_date_re.search(_bs4_text_after(link))
+        if m:
+            modified = parse_listing_date(m.group("date"))
+            if exact_size_re.match(m.group("size")):
+                size = int(m.group("size"))
+        entries.append(
+            ListingEntry(link_target, urljoin(url, link_target), size, modified)
+        )
+    return entries
+
+
+def _listing_variants(content):
+    variants = {
+        "streaming": lambda: parse_listing(LISTING_URL, content),
+        "beautifulsoup": lambda: bs4_parse_listing(LISTING_URL, content),
+    }
+    results = [fn() for fn in variants.values()]
+    assert all(r == results[0] for r in results), "listing parsers disagree"
+    return variants
+
+
+@register_benchmark
+def listing_apache(args):
+    "parse a large Apache (table) autoindex listing"
+    return _listing_variants(apache_listing(LISTING_ENTRIES))
+
+
+@register_benchmark
+def listing_nginx(args):
+    "parse a large nginx (pre) autoindex listing"
+    return _listing_variants(nginx_listing(LISTING_ENTRIES))
+
+
+EXCEL_COLUMNS = 700
+EXCEL_ROWS = 2000
+
+
+def wide_workbook(path, columns, rows):
+    "a workbook shaped like the AMD sample contextual workbook"
+    # not write-only: those workbooks have no <dimension>, which Excel always writes
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = "Sample_metadata"
+    sheet.append(["Column %d" % i for i in range(columns)])
+    for r in range(rows):
+        sheet.append(
+            [
+                "102.100.100/%d" % (r) if i % 3 == 0 else (r * i if i % 3 else None)
+                for i in range(columns)
+            ]
+        )
+    workbook.save(path)
+
+
+def read_all_columns(backend, path, sheet_name):
+    "read every column of `sheet_name` with ExcelWrapper"
+    field_spec = [
+        make_field_definition("c%d" % i, str(name).strip())
+        for i, name in enumerate(make_backend(path, sheet_name, backend).row_values(0))
+        if name != ""
+    ]
+    wrapper = ExcelWrapper(
+        logger,
+        field_spec,
+        path,
+        sheet_name=sheet_name,
+        header_length=1,
+        backend=backend,
+    )
+    for _ in wrapper.get_all():
+        pass
+
+
+def read_workbook(backend, path, sheet_name):
+    "read_all_columns, measuring time and memory"
+    start = time.perf_counter()
+    read_all_columns(backend, path, sheet_name)
+    return Measurement(time.perf_counter() - start, peak_rss())
+
+
+def peak_rss():
+    "peak RSS of this process, in MiB"
+    # ru_maxrss is carried over from the parent of a spawned process, VmHWM is not
+    try:
+        with open("/proc/self/status") as fd:
+            for line in fd:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # KiB on Linux, bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1 << 20 if sys.platform == "darwin" else 1024)
+
+
+def in_subprocess(fn, *args):
+    "run fn(*args) in a fresh process, so that its peak RSS is its own"
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+        return pool.submit(fn, *args).result()
+
+
+@register_benchmark
+def excel_backends(args):
+    """
+    read a large contextual workbook with each Excel backend (--workbook and
+    --sheet, or a synthetic workbook of the same shape as the AMD contextual sheet)
+    """
+    path, sheet_name = args.workbook, args.sheet
+    if path is None:
+        fd, path = tempfile.mkstemp(suffix=".xlsx", prefix="bpaingest-benchmark-")
+        os.close(fd)
+        atexit.register(os.unlink, path)
+        in_subprocess(wide_workbook, path, EXCEL_COLUMNS, EXCEL_ROWS)
+        sheet_name = "Sample_metadata"
+    return {
+        backend: (lambda b=backend: in_subprocess(read_workbook, b, path, sheet_name))
+        for backend in ("openpyxl", "xlrd")
+    }
+
+
+@register_benchmark
+def header_resolution(args):
+    "resolve a 700 field spec (a third of it regular expressions) against its header"
+    header = tuple("column %d (units)" % i for i in range(EXCEL_COLUMNS))
+    field_spec = [
+        make_field_definition(
+            "c%d" % i,
+            re.compile(r"^column %d \(" % i) if i % 3 == 0 else "Column %d (units)" % i,
+        )
+        for i in range(EXCEL_COLUMNS)
+    ]
+    compile_field_spec(field_spec).resolve(header)
+    return {
+        "memoised": lambda: compile_field_spec(field_spec).resolve(header),
+        "unmemoised": lambda: CompiledFieldSpec(field_spec).resolve(header),
+    }
+
+
+DATE_STRINGS = 20000
+
+
+def cold(cached_fn, fn):
+    """
+    run `fn` with the lru_cache of `cached_fn` emptied first, so that every run
+    pays for filling it (a run of the ingest starts with the cache empty)
+    """
+
+    def _cold():
+        cached_fn.cache_clear()
+        return fn()
+
+    return _cold
+
+
+def strptime_date(dt):
+    "_get_date, as it was: each format tried in turn with strptime"
+    for fmt in ingest_utils.DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(dt, fmt).date()
+        except ValueError:
+            pass
+    return None
+
+
+@register_benchmark
+def date_parsing(args):
+    "parse a column of dates in a mix of the supported formats, a few hundred distinct"
+    formats = ("%Y-%m-%d", "%d/%m/%Y", "%Y-%m-%dT%H:%M:%SZ", "%d/%m/%y")
+    dates = [
+        datetime.datetime(2015 + i % 5, i % 12 + 1, i % 28 + 1, i % 24).strftime(
+            formats[i % len(formats)]
+        )
+        for i in range(DATE_STRINGS)
+    ]
+    parse_uncached = ingest_utils._parse_date_string.__wrapped__
+    assert [ingest_utils._parse_date_string(t) for t in dates] == [
+        strptime_date(t) for t in dates
+    ]
+    return {
+        "cold": cold(
+            ingest_utils._parse_date_string,
+            lambda: [ingest_utils._parse_date_string(t) for t in dates],
+        ),
+        "cached": lambda: [ingest_utils._parse_date_string(t) for t in dates],
+        "uncached": lambda: [parse_uncached(t) for t in dates],
+        "strptime": lambda: [strptime_date(t) for t in dates],
+    }
+
+
+ANDS_IDS = 20000
+legacy_ands_id_res = [
+    re.compile(r"^102\.100\.100[/\.](\d+)$"),
+    re.compile(r"^(\d+)$"),
+    re.compile(r"^102\.100\.\.100[/\.](\d+)$"),
+]
+
+
+def legacy_extract_ands_id(logger, s, silent=False):
+    "extract_ands_id, as it was: unmemoised, with a regular expression per form"
+    if isinstance(s, float):
+        s = int(s)
+    if isinstance(s, int):
+        s = str(s)
+    s = s.strip()
+    if s == "" or s.startswith(("e.g. ", "don't use", "missing", "NA")):
+        return None
+    s = s.replace("102.100.100.102.100.100.", "102.100.100/")
+    if "_" in s:
+        s = s.rsplit("_", 1)[0]
+    for ands_re in legacy_ands_id_res:
+        m = ands_re.match(s)
+        if m:
+            return BPA_PREFIX + m.groups()[0]
+    if not silent:
+        logger.warning("unable to parse BPA ID: `%s'" % s)
+    return None
+
+
+@register_benchmark
+def ands_ids(args):
+    "normalise a column of BPA IDs, in the forms found in submission sheets"
+    forms = ("102.100.100/%d", "%d", "102.100.100.%d_1", 0)
+    ids = [
+        float(25000 + i % 500) if not forms[i % 4] else forms[i % 4] % (25000 + i % 500)
+        for i in range(ANDS_IDS)
+    ]
+    extract = ingest_utils.extract_ands_id
+    assert [extract(logger, t) for t in ids] == [
+        legacy_extract_ands_id(logger, t) for t in ids
+    ]
+    return {
+        "cold": cold(
+            ingest_utils._parse_ands_id, lambda: [extract(logger, t) for t in ids]
+        ),
+        "memoised": lambda: [extract(logger, t) for t in ids],
+        "legacy": lambda: [legacy_extract_ands_id(logger, t) for t in ids],
+    }
+
+
+COERCION_ROWS = 20000
+
+
+def repetitive_workbook(path, rows):
+    "a sample sheet with the sort of repetition typical of contextual metadata"
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = "Samples"
+    sheet.append(["Sample ID", "Collection Date", "Depth", "Latitude", "Method"])
+    for r in range(rows):
+        sheet.append(
+            [
+                "102.100.100/%d" % (r // 4),
+                "2016-%02d-%02d" % (r % 12 + 1, r % 28 + 1),
+                r % 50,
+                "-%d.%d" % (30 + r % 7, r % 100),
+                ("Niskin", "Grab", "Core")[r % 3],
+            ]
+        )
+    workbook.save(path)
+
+
+def without_memo(fn):
+    "run `fn` with ExcelWrapper's per-column memoisation turned off"
+
+    def _unmemoised():
+        memo_size = excel_wrapper.COERCE_MEMO_SIZE
+        excel_wrapper.COERCE_MEMO_SIZE = 0
+        try:
+            return fn()
+        finally:
+            excel_wrapper.COERCE_MEMO_SIZE = memo_size
+
+    return _unmemoised
+
+
+def import_object(dotted):
+    module_name, name = dotted.rsplit(".", 1)
+    return getattr(importlib.import_module(module_name), name)
+
+
+@register_benchmark
+def excel_coercion(args):
+    """
+    coerce the rows of a sheet, with and without per-column memoisation. with
+    --contextual (a contextual class, e.g.
+    bpaingest.projects.amdb.contextual.AustralianMicrobiomeSampleContextual) and
+    --metadata-path, the class parses its own metadata; otherwise a synthetic
+    sheet is used.
+    """
+    if args.contextual:
+        cls = import_object(args.contextual)
+
+        def parse():
+            cls(logger, args.metadata_path)
+
+    else:
+        fd, path = tempfile.mkstemp(suffix=".xlsx", prefix="bpaingest-benchmark-")
+        os.close(fd)
+        atexit.register(os.unlink, path)
+        repetitive_workbook(path, COERCION_ROWS)
+        field_spec = [
+            make_field_definition(
+                "sample_id", "Sample ID", coerce=ingest_utils.extract_ands_id
+            ),
+            make_field_definition(
+                "collection_date",
+                "Collection Date",
+                coerce=ingest_utils.get_date_isoformat,
+            ),
+            make_field_definition(
+                "depth", "Depth", coerce=ingest_utils.get_clean_number
+            ),
+            make_field_definition(
+                "latitude", "Latitude", coerce=ingest_utils.get_clean_number
+            ),
+            make_field_definition("method", "Method"),
+        ]
+
+        def parse():
+            wrapper = ExcelWrapper(logger, field_spec, path, header_length=1)
+            return list(wrapper.get_all())
+
+        assert parse() == without_memo(parse)()
+    return {"memoised": parse, "unmemoised": without_memo(parse)}
+
+
+FILENAMES = 20000
+PROJECTS = ("amdb", "ausarg", "gap", "gbr", "omg", "sepsis", "stemcells", "tsi")
+example_filename_re = re.compile(r'"([^" /]+\.[A-Za-z0-9.]+)"')
+
+
+def project_filenames(n):
+    """
+    `n` filenames, made from those in the projects' tests by changing the digits
+    in each: some still match the project's patterns, some no longer do
+    """
+    root = os.path.join(os.path.dirname(os.path.dirname(__file__)), "projects")
+    examples = []
+    for project in PROJECTS:
+        for test_module in glob(os.path.join(root, project, "test_*.py")):
+            with open(test_module) as fd:
+                examples += example_filename_re.findall(fd.read())
+    rng = random.Random(1)
+    return [
+        re.sub(r"\d", lambda m: str(rng.randrange(10)), examples[i % len(examples)])
+        if i >= len(examples)
+        else examples[i]
+        for i in range(n)
+    ]
+
+
+def legacy_matching_regexp(regexps, s):
+    "RawParser._matching_regexp, as it was: every expression is tried"
+    matches = [t for t in [regexp.match(s) for regexp in regexps] if t]
+    if not matches:
+        return None
+    return matches[0]
+
+
+@register_benchmark
+def filename_matching(args):
+    "match filenames against all of the patterns in each project's files.py"
+    filenames = project_filenames(FILENAMES)
+    pattern_lists = [
+        [
+            t
+            for t in vars(
+                importlib.import_module("bpaingest.projects.%s.files" % p)
+            ).values()
+            if isinstance(t, re.Pattern)
+        ]
+        for p in PROJECTS
+    ]
+    matchers = [make_matcher(t) for t in pattern_lists]
+
+    def groups(m):
+        return m.groupdict() if m else None
+
+    for regexps, matcher in zip(pattern_lists, matchers):
+        assert [groups(matcher.match(t)) for t in filenames] == [
+            groups(legacy_matching_regexp(regexps, t)) for t in filenames
+        ]
+    return {
+        "matcher": lambda: [m.match(t) for m in matchers for t in filenames],
+        "all_regexps": lambda: [
+            legacy_matching_regexp(r, t) for r in pattern_lists for t in filenames
+        ],
+    }
+
+
+NUMBERS = 20000
+
+
+@register_benchmark
+def clean_numbers(args):
+    "get_clean_number over a column of numbers, numeric strings and annotated values"
+    values = [
+        (float(i), "%d.%d" % (i, i % 10), "~%d m" % (i), None)[i % 4]
+        for i in range(NUMBERS)
+    ]
+    return {
+        "current": lambda: [ingest_utils.get_clean_number(logger, t) for t in values]
+    }
+
+
+@register_benchmark
+def sample_extraction_ids(args):
+    "fix_sample_extraction_id over a column of extraction ids"
+    values = [
+        (float(25000 + i), "%d_%d" % (25000 + i, i % 3), "%d-1" % (25000 + i))[i % 3]
+        for i in range(NUMBERS)
+    ]
+    return {
+        "current": lambda: [
+            ingest_utils.fix_sample_extraction_id(logger, t) for t in values
+        ]
+    }
+
+
+# (columns, rows) of the workbooks read by excel_get_all
+EXCEL_SHAPES = ((10, 1000), (10, 10000), (100, 1000), (100, 10000))
+
+
+@register_benchmark
+def excel_get_all(args):
+    "ExcelWrapper.get_all on generated workbooks of increasing width and height"
+    variants = {}
+    for columns, rows in EXCEL_SHAPES:
+        fd, path = tempfile.mkstemp(suffix=".xlsx", prefix="bpaingest-benchmark-")
+        os.close(fd)
+        atexit.register(os.unlink, path)
+        wide_workbook(path, columns, rows)
+        variants["%dx%d" % (columns, rows)] = partial(
+            read_all_columns, None, path, "Sample_metadata"
+        )
+    return variants
+
+
+MD5_LINES = 100000
+
+
+def legacy_md5lines(fd):
+    "md5lines, as it was: the BSD expression is tried before the Linux one on every line"
+    for line in fd:
+        line = line.strip()
+        if line == "":
+            continue
+        m = bsd_md5_re.match(line)
+        if m:
+            path, md5 = m.groups()
+            yield md5, path
+            continue
+        m = linux_md5_re.match(line)
+        if m:
+            md5, path = m.groups()
+            yield md5, path
+            continue
+        raise Exception("Could not parse MD5 line: %s" % line)
+
+
+def md5_manifest_lines(dialect):
+    "MD5_LINES lines of a manifest, in the BSD or GNU format or alternating"
+    lines = []
+    for i in range(MD5_LINES):
+        path = "%d_AMD_UNSW_ABCDE_TAAGGCGA-CTCTCTAT_S%d_L001_R%d.fastq.gz" % (
+            25000 + i,
+            i,
+            i % 2 + 1,
+        )
+        digest = "%032x" % (i * 7919)
+        if dialect == "bsd" or (dialect == "mixed" and i % 2):
+            lines.append("MD5 (%s) = %s" % (path, digest))
+        else:
+            lines.append("%s  %s" % (digest, path))
+    return "\n".join(lines) + "\n"
+
+
+def read_md5lines(fn, manifest):
+    return list(fn(StringIO(manifest)))
+
+
+@register_benchmark
+def md5_manifest(args):
+    "md5lines over a large manifest, in the BSD and Linux formats and a mix of both"
+    manifests = {t: md5_manifest_lines(t) for t in ("gnu", "bsd", "mixed")}
+    variants = {
+        name: partial(read_md5lines, md5lines, manifest)
+        for name, manifest in manifests.items()
+    }
+    variants["legacy-gnu"] = partial(read_md5lines, legacy_md5lines, manifests["gnu"])
+    return variants
+
+
+HASH_BUFFER_SIZE = 64 * (1 << 20)
+
+
+@register_benchmark
+def hashing(args):
+    "_generate_hashes (MD5, SHA256 and the S3 ETags) over a large buffer"
+    data = os.urandom(HASH_BUFFER_SIZE)
+    return {"current": lambda: _generate_hashes(BytesIO(data))}
+
+
+def measure_variant(fn, repeat):
+    "the best of `repeat` runs of `fn`"
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        measurement = fn()
+        if not isinstance(measurement, Measurement):
+            measurement = Measurement(time.perf_counter() - start, None)
+        if best is None or measurement.seconds < best.seconds:
+            best = measurement
+    return best
+
+
+def run_benchmarks(args):
+    """
+    run the benchmarks named in `args.names` (or all of them), returning
+    {benchmark: {variant: Measurement}}
+    """
+    results = {}
+    for fn in benchmark_fns:
+        if args.names and fn.__name__ not in args.names:
+            continue
+        variants = fn(args)
+        results[fn.__name__] = {
+            variant: measure_variant(variant_fn, args.repeat)
+            for variant, variant_fn in variants.items()
+        }
+    return results
+
+
+def print_results(results):
+    for name, measurements in results.items():
+        baseline = next(iter(measurements.values()))
+        print(name)
+        for variant, m in measurements.items():
+            line = "  %20s  %9.4fs  %6.2fx" % (
+                variant,
+                m.seconds,
+                m.seconds / baseline.seconds,
+            )
+            if m.peak_rss is not None:
+                line += "  %9.1f MiB peak RSS" % (m.peak_rss)
+            print(line)
+
+
+def results_to_json(results):
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": time.time(),
+        "benchmarks": {
+            name: {variant: m._asdict() for variant, m in measurements.items()}
+            for name, measurements in results.items()
+        },
+    }
+
+
+def find_regressions(results, baseline, threshold):
+    """
+    compare `results` to `baseline` (as saved by --save), returning
+    (benchmark, variant, baseline seconds, seconds) for each variant at least
+    `threshold` (a fraction) slower than it was
+    """
+    regressions = []
+    for name, measurements in results.items():
+        before = baseline["benchmarks"].get(name, {})
+        for variant, m in measurements.items():
+            if variant not in before:
+                continue
+            seconds = before[variant]["seconds"]
+            if m.seconds > seconds * (1 + threshold):
+                regressions.append((name, variant, seconds, m.seconds))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "names",
+        nargs="*",
+        help="benchmarks to run (default: all of %s)"
+        % (", ".join(fn.__name__ for fn in benchmark_fns)),
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="runs of each variant")
+    parser.add_argument(
+        "--workbook",
+        help="workbook for the excel_backends benchmark (e.g. AMD contextual)",
+    )
+    parser.add_argument("--sheet", help="sheet to read from --workbook")
+    parser.add_argument(
+        "--contextual", help="contextual class for the excel_coercion benchmark"
+    )
+    parser.add_argument(
+        "--metadata-path", help="directory holding the metadata for --contextual"
+    )
+    parser.add_argument("--save", help="write the results to this file, as JSON")
+    parser.add_argument(
+        "--compare",
+        help="results saved by an earlier run (--save); fail if any variant is slower",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_REGRESSION_THRESHOLD,
+        help="with --compare, the slow down (as a fraction) that counts as a regression",
+    )
+    args = parser.parse_args(argv)
+    results = run_benchmarks(args)
+    print_results(results)
+    if args.save:
+        with open(args.save, "w") as fd:
+            json.dump(results_to_json(results), fd, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as fd:
+            baseline = json.load(fd)
+        regressions = find_regressions(results, baseline, args.threshold)
+        for name, variant, before, after in regressions:
+            print(
+                "REGRESSION: %s %s: %.4fs, was %.4fs (%+.0f%%)"
+                % (name, variant, after, before, 100 * (after / before - 1))
+            )
+        if regressions:
+            return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
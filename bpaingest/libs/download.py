@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+Download engine for metadata files: streams to a temporary file with large
+buffers, renames into place once complete, resumes interrupted transfers
+with ranged requests, and reports throughput for each file.
+"""
+
+import os
+import time
+from collections import namedtuple
+from hashlib import sha256
+
+import requests
+
+
+class DownloadException(Exception):
+    pass
+
+
+DEFAULT_BUFFER_SIZE = 1 << 20
+DOWNLOAD_RETRY = 3
+
+# `transferred` is the number of bytes sent over the wire (less than `size` if
+# the download was resumed)
+DownloadStats = namedtuple(
+    "DownloadStats", ["size", "transferred", "elapsed", "response"]
+)
+
+
+def transfer_rate(transferred, elapsed):
+    if elapsed <= 0:
+        return 0.0
+    return transferred / elapsed
+
+
+def _resumes_from(response, resume_from):
+    "check that a 206 response starts at the offset we asked for"
+    range_start = response.headers.get("content-range", "").split(" ")[-1]
+    return range_start.startswith("%d-" % (resume_from))
+
+
+def _hash_file(h, path):
+    with open(path, "rb") as fd:
+        while True:
+            data = fd.read(DEFAULT_BUFFER_SIZE)
+            if not data:
+                break
+            h.update(data)
+
+
+def download_file(
+    session,
+    url,
+    path,
+    logger,
+    auth=None,
+    headers=None,
+    resume_validator=None,
+    expected_size=None,
+    expected_sha256=None,
+    buffer_size=DEFAULT_BUFFER_SIZE,
+    on_response=None,
+):
+    """
+    download `url` to `path`. the data is written to `path`.part and renamed into
+    place once complete (and verified against `expected_size` and
+    `expected_sha256`, if given.)
+
+    if a `.part` file exists and `resume_validator` (an ETag or Last-Modified
+    value) is given, the download is resumed with a ranged request. a transfer that
+    is interrupted part way through is resumed in the same way.
+
+    `on_response` is called with each response before its body is read.
+    returns None if the server answered 304 (not modified), otherwise
+    a DownloadStats.
+    """
+    part_file = path + ".part"
+    transferred = 0
+    start = time.time()
+    for attempt in range(DOWNLOAD_RETRY):
+        request_headers = dict(headers or {})
+        resume_from = 0
+        if resume_validator and os.path.exists(part_file):
+            resume_from = os.path.getsize(part_file)
+            request_headers["Range"] = "bytes=%d-" % (resume_from)
+            request_headers["If-Range"] = resume_validator
+        with session.get(
+            url, stream=True, auth=auth, verify=False, headers=request_headers
+        ) as r:
+            if r.status_code == 304:
+                return None
+            if r.status_code not in (200, 206):
+                raise DownloadException(
+                    "status code {} for: {}".format(r.status_code, url)
+                )
+            mode = "wb"
+            if r.status_code == 206:
+                if not _resumes_from(r, resume_from):
+                    # the server gave us something other than what we asked for
+                    os.unlink(part_file)
+                    resume_validator = None
+                    continue
+                logger.info("Resuming {} from byte {}".format(url, resume_from))
+                mode = "ab"
+            if on_response is not None:
+                on_response(r)
+            try:
+                with open(part_file, mode, buffering=buffer_size) as f:
+                    for chunk in r.iter_content(chunk_size=buffer_size):
+                        f.write(chunk)
+                        transferred += len(chunk)
+            except (
+                requests.exceptions.ConnectionError,
+                requests.exceptions.ChunkedEncodingError,
+            ) as e:
+                # resume from where we got to, if the server lets us
+                resume_validator = r.headers.get("etag") or r.headers.get(
+                    "last-modified"
+                )
+                if resume_validator is None or attempt == DOWNLOAD_RETRY - 1:
+                    raise
+                logger.warning("Transfer of {} interrupted: {}".format(url, e))
+                continue
+            response = r
+            break
+    else:
+        raise DownloadException("unable to download: {}".format(url))
+
+    size = os.path.getsize(part_file)
+    if expected_size is not None and size != expected_size:
+        os.unlink(part_file)
+        raise DownloadException(
+            "{}: size is {} bytes, expected {}".format(url, size, expected_size)
+        )
+    if expected_sha256 is not None:
+        h = sha256()
+        _hash_file(h, part_file)
+        if h.hexdigest() != expected_sha256:
+            os.unlink(part_file)
+            raise DownloadException(
+                "{}: SHA256 is {}, expected {}".format(
+                    url, h.hexdigest(), expected_sha256
+                )
+            )
+    os.replace(part_file, path)
+    elapsed = time.time() - start
+    logger.info(
+        "Fetched {}: {} bytes in {:.2f}s ({:.1f} KiB/s)".format(
+            os.path.basename(path),
+            transferred,
+            elapsed,
+            transfer_rate(transferred, elapsed) / 1024,
+        )
+    )
+    return DownloadStats(size, transferred, elapsed, response)
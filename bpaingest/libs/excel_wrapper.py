@@ -12,12 +12,26 @@ as mangled by the provided method.
 """
 
 import datetime
-from collections import namedtuple, Counter, OrderedDict
+import logging
+import threading
+from collections import defaultdict, namedtuple, Counter, OrderedDict
+from contextlib import contextmanager
+from decimal import Decimal
+from functools import lru_cache
+from itertools import islice
 
 import re
 import os
+import posixpath
 import xlrd
 import string
+import zipfile
+from xml.etree import ElementTree
+
+import openpyxl
+from openpyxl.utils import datetime as openpyxl_datetime
+
+from .parse_cache import get_parse_cache, module_fingerprint
 
 SkipColumn = namedtuple("SkipColumn", ["column_name", "skip_all"])
 skip_column_default = SkipColumn("column_name", False)
@@ -29,6 +43,23 @@ field_definition_default = FieldDefinition(
 )
 
 
+# get_all coerces this many rows at a time
+ROW_BLOCK_SIZE = 1024
+# the most distinct values remembered for each column by get_all
+COERCE_MEMO_SIZE = 10000
+# immutable results, which may be shared between cells with the same value
+MEMO_TYPES = (
+    str,
+    int,
+    float,
+    type(None),
+    Decimal,
+    datetime.date,
+    datetime.time,
+    datetime.timedelta,
+)
+
+
 def make_field_definition(attribute, column_name, **kwargs):
     return field_definition_default._replace(
         attribute=attribute, column_name=column_name, **kwargs
@@ -39,6 +70,521 @@ def make_skip_column(column_name, **kwargs):
     return skip_column_default._replace(column_name=column_name, **kwargs)
 
 
+# the outcome of resolving a field spec against a sheet's header. `header` is
+# the header as amended by the resolution (additional columns found by a
+# `find_all` field are renamed), `missing_columns` describes each required
+# column which wasn't found, and `unmapped_columns` lists the header names
+# which aren't mapped to a field.
+ResolvedHeader = namedtuple(
+    "ResolvedHeader",
+    ["header", "column_map", "missing_headers", "missing_columns", "unmapped_columns"],
+)
+
+
+def _is_regex(column_name):
+    # if has the 'match' attribute, it's a regexp
+    return hasattr(column_name, "match")
+
+
+class CompiledFieldSpec:
+    """
+    a field spec, prepared once for resolving against the headers of any number of
+    sheets. literal column names are looked up in a dict, each regular expression
+    is matched against the header once, and skip columns are resolved in the same
+    pass. the resolution of each distinct header is remembered, as the same
+    template is usually parsed many times over.
+    """
+
+    MAX_RESOLVED_HEADERS = 64
+
+    def __init__(self, field_spec):
+        self.field_spec = tuple(field_spec)
+        # (spec, column names to try in turn), with literal names normalised
+        self._plan = []
+        for spec in self.field_spec:
+            names = spec.column_name
+            if not isinstance(names, tuple) or isinstance(spec, SkipColumn):
+                names = (names,)
+            self._plan.append(
+                (spec, tuple(n if _is_regex(n) else n.strip().lower() for n in names))
+            )
+        self._lock = threading.Lock()
+        self._resolved = OrderedDict()
+
+    def resolve(self, header):
+        "resolve against `header`, a tuple of normalised column names"
+        with self._lock:
+            if header in self._resolved:
+                self._resolved.move_to_end(header)
+                return self._resolved[header]
+        resolved = self._resolve(header)
+        with self._lock:
+            self._resolved[header] = resolved
+            while len(self._resolved) > self.MAX_RESOLVED_HEADERS:
+                self._resolved.popitem(last=False)
+        return resolved
+
+    def _resolve(self, header):
+        header = list(header)
+        positions = {}
+        for idx, name in enumerate(header):
+            positions.setdefault(name, []).append(idx)
+        regex_matches = {}
+
+        def find_re(column_name_re):
+            if column_name_re not in regex_matches:
+                regex_matches[column_name_re] = [
+                    idx for idx, name in enumerate(header) if column_name_re.match(name)
+                ]
+            return regex_matches[column_name_re]
+
+        def find_column_as_list(column_name):
+            if _is_regex(column_name):
+                return find_re(column_name)[:1]
+            return positions.get(column_name, [])[:1]
+
+        def find_all_columns_re(column_name_re):
+            if not _is_regex(column_name_re):
+                raise Exception("Column name must be a regex for find all")
+            return list(find_re(column_name_re))
+
+        def rename(idx, name):
+            positions[header[idx]].remove(idx)
+            positions.setdefault(name, []).append(idx)
+            positions[name].sort()
+            header[idx] = name
+            regex_matches.clear()
+
+        cmap = {}
+        skip_columns = set()
+        missing_headers = []
+        missing_columns = []
+        for spec, names in self._plan:
+            if isinstance(spec, SkipColumn):
+                if spec.skip_all:
+                    skip_columns.update(find_all_columns_re(names[0]))
+                else:
+                    skip_columns.update(find_column_as_list(names[0]))
+                continue
+
+            find_fn = find_all_columns_re if spec.find_all else find_column_as_list
+            col_index_list = []
+            for name in names:
+                col_index_list = find_fn(name)
+                if col_index_list:
+                    break
+
+            if not col_index_list:
+                missing_headers.append(spec.column_name)
+                if not spec.optional:
+                    col_descr = spec.column_name
+                    if _is_regex(spec.column_name):
+                        col_descr = spec.column_name.pattern
+                    missing_columns.append(col_descr)
+                cmap[spec.attribute] = None
+            else:
+                for counter, col_index in enumerate(col_index_list):
+                    key_name = spec.attribute
+                    if counter > 0:
+                        key_name += str(counter + 1)
+                        rename(col_index, key_name)
+                    cmap[key_name] = col_index
+
+        mapped_columns = set(cmap.values())
+        unmapped_columns = [
+            s
+            for idx, s in enumerate(header)
+            if s != "" and idx not in mapped_columns and idx not in skip_columns
+        ]
+        return ResolvedHeader(
+            tuple(header), cmap, missing_headers, missing_columns, unmapped_columns
+        )
+
+
+@lru_cache(maxsize=256)
+def _compile_field_spec(field_spec):
+    return CompiledFieldSpec(field_spec)
+
+
+def compile_field_spec(field_spec):
+    "returns the CompiledFieldSpec for `field_spec`, shared by every sheet using it"
+    field_spec = tuple(field_spec)
+    try:
+        return _compile_field_spec(field_spec)
+    except TypeError:
+        # something in the spec can't be hashed, so it can't be shared
+        return CompiledFieldSpec(field_spec)
+
+
+# the workbook cache is bounded by the number of cells held, as a proxy for
+# memory use (xlrd needs in the order of 100 bytes per cell)
+DEFAULT_WORKBOOK_CACHE_CELLS = 10 * 1000 * 1000
+
+
+class WorkbookCache:
+    """
+    process-wide cache of open workbooks, keyed on (path, size, mtime), so that a
+    workbook read by several metadata classes, or for several sheets, is only
+    opened and decompressed once. the least recently used workbooks are dropped
+    once the cache holds more than `max_cells` cells.
+    """
+
+    def __init__(self, max_cells=DEFAULT_WORKBOOK_CACHE_CELLS):
+        self.max_cells = max_cells
+        self.hits = self.misses = 0
+        self._lock = threading.Lock()
+        self._key_locks = defaultdict(threading.Lock)
+        self._workbooks = OrderedDict()
+
+    @staticmethod
+    def key(file_name):
+        st = os.stat(file_name)
+        return (os.path.abspath(file_name), st.st_size, st.st_mtime_ns)
+
+    @staticmethod
+    def cell_count(workbook):
+        # workbook.sheets() would load the sheets not yet asked for
+        total = 0
+        for idx in range(workbook.nsheets):
+            if workbook.sheet_loaded(idx):
+                sheet = workbook.sheet_by_index(idx)
+                total += sheet.nrows * sheet.ncols
+        return total
+
+    def open_workbook(self, file_name):
+        key = self.key(file_name)
+        with self._lock:
+            key_lock = self._key_locks[key]
+        with key_lock:
+            with self._lock:
+                if key in self._workbooks:
+                    self._workbooks.move_to_end(key)
+                    self.hits += 1
+                    return self._workbooks[key]
+                self.misses += 1
+            # with on_demand, sheets in .xls workbooks are only loaded when asked
+            # for (xlrd loads xlsx workbooks in full regardless)
+            workbook = xlrd.open_workbook(file_name, on_demand=True)
+            with self._lock:
+                # drop any earlier version of this workbook, it won't be asked for again
+                for stale in [k for k in self._workbooks if k[0] == key[0]]:
+                    self._workbooks.pop(stale).release_resources()
+                    self._key_locks.pop(stale, None)
+                self._workbooks[key] = workbook
+                self._evict()
+            return workbook
+
+    def _evict(self):
+        total = sum(self.cell_count(wb) for wb in self._workbooks.values())
+        # always keep the most recently used workbook
+        while total > self.max_cells and len(self._workbooks) > 1:
+            key, workbook = self._workbooks.popitem(last=False)
+            self._key_locks.pop(key, None)
+            total -= self.cell_count(workbook)
+            # sheets already loaded can still be read by their backends
+            workbook.release_resources()
+
+    def clear(self):
+        with self._lock:
+            for workbook in self._workbooks.values():
+                workbook.release_resources()
+            self._workbooks.clear()
+            self._key_locks.clear()
+
+
+workbook_cache = WorkbookCache()
+
+
+def merge_redirects(merged_cells):
+    """
+    map each cell covered by a merged range (other than its top-left cell) to the
+    coordinates of the top-left cell, whose value it takes
+    """
+    merge_redirect = {}
+    for crange in merged_cells:
+        rlo, rhi, clo, chi = crange
+        source_coords = (rlo, clo)
+        for rowx in range(rlo, rhi):
+            for colx in range(clo, chi):
+                if rowx == rlo and colx == clo:
+                    continue
+                merge_redirect[(rowx, colx)] = source_coords
+    return merge_redirect
+
+
+class XlrdBackend:
+    """
+    reads a sheet with xlrd, which loads the workbook into memory (xlsx
+    workbooks in full.) workbooks are shared through `workbook_cache`.
+    """
+
+    def __init__(self, file_name, sheet_name=None):
+        workbook = workbook_cache.open_workbook(file_name)
+        if sheet_name is None:
+            self.sheet = workbook.sheet_by_index(0)
+        else:
+            self.sheet = workbook.sheet_by_name(sheet_name)
+        self.sheet_name = self.sheet.name
+        self.datemode = workbook.datemode
+
+    def close(self):
+        "the workbook belongs to `workbook_cache`, which releases it"
+        pass
+
+    def row_values(self, row_idx):
+        return self.sheet.row_values(row_idx)
+
+    def rows(self, start):
+        "yields the rows of the sheet from `start`, as lists of xlrd cells"
+        merge_redirect = merge_redirects(self.sheet.merged_cells)
+        for row_idx in range(start, self.sheet.nrows):
+            row = self.sheet.row(row_idx)
+            merged_row = []
+            for colx, val in enumerate(row):
+                coord = (row_idx, colx)
+                if coord in merge_redirect:
+                    merge_row, merge_col = merge_redirect[coord]
+                    merged_row.append(self.sheet.row(merge_row)[merge_col])
+                else:
+                    merged_row.append(val)
+            yield merged_row
+
+
+RELATIONSHIPS_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+SPREADSHEET_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+OFFICE_RELATIONSHIPS_NS = (
+    "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+)
+
+merge_cell_re = re.compile(rb'<mergeCell[^>]*\sref="([A-Z]+)(\d+):([A-Z]+)(\d+)"')
+openpyxl_error_codes = {v: k for k, v in xlrd.error_text_from_code.items()}
+
+
+def _relationships(archive, part):
+    "maps the id of each relationship of `part` to the part it targets"
+    base, name = posixpath.split(part)
+    rels = ElementTree.fromstring(
+        archive.read(posixpath.join(base, "_rels", name + ".rels"))
+    )
+    targets = {}
+    for rel in rels.iter(RELATIONSHIPS_NS + "Relationship"):
+        target = rel.get("Target")
+        if target.startswith("/"):
+            target = target[1:]
+        else:
+            target = posixpath.normpath(posixpath.join(base, target))
+        targets[rel.get("Id")] = (rel.get("Type"), target)
+    return targets
+
+
+def worksheet_part(archive, title):
+    "the part of the xlsx `archive` (a ZipFile) holding the worksheet `title`"
+    workbook_part = next(
+        target
+        for rel_type, target in _relationships(archive, "").values()
+        if rel_type.endswith("/officeDocument")
+    )
+    targets = _relationships(archive, workbook_part)
+    workbook = ElementTree.fromstring(archive.read(workbook_part))
+    for sheet in workbook.iter(SPREADSHEET_NS + "sheet"):
+        if sheet.get("name") == title:
+            return targets[sheet.get(OFFICE_RELATIONSHIPS_NS + "id")][1]
+    raise xlrd.XLRDError("No sheet named <%r>" % title)
+
+
+def column_index(letters):
+    "zero-based index of the column named `letters` (A, B, ..., AA, ...)"
+    idx = 0
+    for c in letters:
+        idx = idx * 26 + (ord(c) - ord("A") + 1)
+    return idx - 1
+
+
+class OpenpyxlBackend:
+    """
+    streams a sheet from an xlsx workbook with openpyxl in read-only mode, so that
+    only the current row (and the top-left cell of any merged ranges) is held in
+    memory. cells are handed back as xlrd cells, with the same types and values
+    xlrd would give (numbers as floats, dates as Excel serial dates.)
+    """
+
+    def __init__(self, file_name, sheet_name=None):
+        self.file_name = file_name
+        self.workbook = openpyxl.load_workbook(
+            file_name, read_only=True, data_only=True
+        )
+        if sheet_name is None:
+            self.sheet = self.workbook.worksheets[0]
+        else:
+            try:
+                self.sheet = self.workbook[sheet_name]
+            except KeyError:
+                raise xlrd.XLRDError("No sheet named <%r>" % sheet_name)
+        # the <dimension> stored in the sheet is often missing or stale (and
+        # openpyxl drops cells beyond it), so the sheet is measured instead
+        self.sheet.reset_dimensions()
+        self._ncols = None
+        self.sheet_name = self.sheet.title
+        self.datemode = int(
+            getattr(self.workbook, "epoch", None) == openpyxl_datetime.CALENDAR_MAC_1904
+        )
+
+    def close(self):
+        "release the workbook (a read-only workbook holds the file open)"
+        self.workbook.close()
+
+    def ncols(self):
+        "the width of the widest row, to which rows are padded (as xlrd does)"
+        if self._ncols is None:
+            self._ncols = max(
+                (len(row) for row in self.sheet.iter_rows(values_only=True)), default=0
+            )
+        return self._ncols
+
+    def _merged_cells(self):
+        """
+        read-only worksheets don't give us the merged ranges, so we scan the sheet
+        XML for them (in chunks, without parsing it)
+        """
+        merged = []
+        data = b""
+        with zipfile.ZipFile(self.file_name) as archive, archive.open(
+            worksheet_part(archive, self.sheet_name)
+        ) as fd:
+            while True:
+                chunk = fd.read(1 << 20)
+                data += chunk
+                # hold back anything after the last tag opening, it may be cut short
+                end = data.rfind(b"<") if chunk else len(data)
+                for m in merge_cell_re.finditer(data, 0, max(end, 0)):
+                    c1, r1, c2, r2 = m.groups()
+                    merged.append(
+                        (
+                            int(r1) - 1,
+                            int(r2),
+                            column_index(c1.decode()),
+                            column_index(c2.decode()) + 1,
+                        )
+                    )
+                data = data[max(end, 0) :]
+                if not chunk:
+                    break
+        return merged
+
+    def _cell(self, cell):
+        value = cell.value
+        if value is None:
+            return xlrd.sheet.Cell(xlrd.XL_CELL_EMPTY, "")
+        if cell.data_type == "e":
+            return xlrd.sheet.Cell(
+                xlrd.XL_CELL_ERROR, openpyxl_error_codes.get(value, value)
+            )
+        if isinstance(value, bool):
+            return xlrd.sheet.Cell(xlrd.XL_CELL_BOOLEAN, int(value))
+        if isinstance(value, (int, float)):
+            return xlrd.sheet.Cell(xlrd.XL_CELL_NUMBER, float(value))
+        if isinstance(value, str):
+            return xlrd.sheet.Cell(xlrd.XL_CELL_TEXT, value)
+        try:
+            return xlrd.sheet.Cell(xlrd.XL_CELL_DATE, self._xldate(value))
+        except xlrd.xldate.XLDateError:
+            return xlrd.sheet.Cell(xlrd.XL_CELL_TEXT, str(value))
+
+    def _xldate(self, value):
+        if isinstance(value, datetime.datetime):
+            return xlrd.xldate.xldate_from_datetime_tuple(
+                value.timetuple()[:6], self.datemode
+            )
+        if isinstance(value, datetime.date):
+            return xlrd.xldate.xldate_from_date_tuple(
+                value.timetuple()[:3], self.datemode
+            )
+        if isinstance(value, datetime.time):
+            return xlrd.xldate.xldate_from_time_tuple(
+                (value.hour, value.minute, value.second)
+            )
+        if isinstance(value, datetime.timedelta):
+            return value.total_seconds() / 86400
+        raise xlrd.xldate.XLDateError(value)
+
+    def row_values(self, row_idx):
+        for row in self.sheet.iter_rows(min_row=row_idx + 1, max_row=row_idx + 1):
+            values = [self._cell(cell).value for cell in row]
+            return values + [""] * (self.ncols() - len(values))
+        return []
+
+    def rows(self, start):
+        "yields the rows of the sheet from `start`, as lists of xlrd cells"
+        merge_redirect = merge_redirects(self._merged_cells())
+        merge_sources = set(merge_redirect.values())
+        source_cells = {}
+        ncols = self.ncols()
+        empty = xlrd.sheet.Cell(xlrd.XL_CELL_EMPTY, "")
+        for row_idx, row in enumerate(self.sheet.iter_rows()):
+            cells = [self._cell(cell) for cell in row]
+            # pad out short rows, as xlrd does
+            cells += [empty] * (ncols - len(cells))
+            for colx, cell in enumerate(cells):
+                coord = (row_idx, colx)
+                if coord in merge_sources:
+                    source_cells[coord] = cell
+                elif coord in merge_redirect:
+                    cells[colx] = source_cells.get(merge_redirect[coord], empty)
+            if row_idx >= start:
+                yield cells
+
+
+EXCEL_BACKENDS = {"xlrd": XlrdBackend, "openpyxl": OpenpyxlBackend}
+DEFAULT_EXCEL_BACKEND = "xlrd"
+_excel_backend = DEFAULT_EXCEL_BACKEND
+
+
+def configure_excel_backend(name):
+    "set the backend used by ExcelWrapper for xlsx workbooks, for this process"
+    global _excel_backend
+    if name not in EXCEL_BACKENDS:
+        raise Exception("unknown Excel backend: %s" % (name))
+    _excel_backend = name
+
+
+def get_excel_backend():
+    return _excel_backend
+
+
+def make_backend(file_name, sheet_name=None, backend=None):
+    if backend is None:
+        backend = _excel_backend
+    # openpyxl can only read the xlsx format
+    if not file_name.lower().endswith((".xlsx", ".xlsm")):
+        backend = "xlrd"
+    return EXCEL_BACKENDS[backend](file_name, sheet_name)
+
+
+class LogCapture(logging.Handler):
+    "records the messages logged by this thread, while capturing"
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+        self._thread = None
+
+    def emit(self, record):
+        if record.thread == self._thread:
+            self.records.append((record.levelno, record.getMessage()))
+
+    @contextmanager
+    def capturing(self, logger):
+        if logger is None:
+            yield
+            return
+        self._thread = threading.get_ident()
+        logger.addHandler(self)
+        try:
+            yield
+        finally:
+            logger.removeHandler(self)
+
+
 class ExcelWrapper:
     """
     Parse a excel file and yields namedtuples.
@@ -62,6 +608,7 @@ class ExcelWrapper:
         column_name_row_index=0,
         suggest_template=False,
         additional_context=None,
+        backend=None,
     ):
         self._logger = logger
         self._log = []
@@ -73,17 +620,51 @@ class ExcelWrapper:
         self.additional_context = additional_context
         self.suggest_template = suggest_template
 
-        self.workbook = xlrd.open_workbook(file_name)
-        if sheet_name is None:
-            self.sheet = self.workbook.sheet_by_index(0)
+        # a sheet parsed before (with the same workbook contents, field spec and
+        # options) is replayed from the parse cache, without opening the workbook
+        self._parse_cache = get_parse_cache()
+        self._cache_key = self._cached = None
+        if self._parse_cache is not None and hasattr(logger, "addHandler"):
+            self._cache_key = self._parse_cache.key(
+                file_name,
+                (
+                    module_fingerprint(__name__),
+                    sheet_name,
+                    header_length,
+                    column_name_row_index,
+                    suggest_template,
+                ),
+                field_spec,
+                additional_context,
+            )
+        if self._cache_key is not None:
+            self._cached = self._parse_cache.get(self._cache_key)
+
+        if self._cached is not None:
+            self.backend = None
+            self.sheet_name = self._cached["sheet_name"]
+            self.missing_headers = list(self._cached["missing_headers"])
+            self.header = list(self._cached["header"])
+            self.name_to_column_map = dict(self._cached["name_to_column_map"])
+            self._log = list(self._cached["errors"])
         else:
-            self.sheet = self.workbook.sheet_by_name(sheet_name)
-
-        self.missing_headers = []
-        self.header, self.name_to_column_map = self.set_name_to_column_map()
+            self.backend = make_backend(file_name, sheet_name, backend)
+            self.sheet_name = self.backend.sheet_name
+            self.missing_headers = []
+            self.header, self.name_to_column_map = self.set_name_to_column_map()
         self.field_names = self._set_field_names()
         self.name_to_func_map = self.set_name_to_func_map()
 
+    @property
+    def from_cache(self):
+        "true if the sheet is being replayed from the parse cache"
+        return self._cached is not None
+
+    def close(self):
+        "release the workbook; called once get_all has read every row"
+        if self.backend is not None:
+            self.backend.close()
+
     def _error(self, s):
         self._log.append(s)
 
@@ -113,104 +694,30 @@ class ExcelWrapper:
                 return str(s)
             return s.strip()
 
-        header = [
+        header = tuple(
             coerce_header(t).strip().lower()
-            for t in self.sheet.row_values(self.column_name_row_index)
-        ]
-
-        # wrapper for find_column enables consistent return types with `find_all_columns_re`
-        def find_column_as_list(column_name):
-            all_index = []
-            found_index = find_column(column_name)
-            if found_index > -1:
-                all_index.append(found_index)
-            return all_index
-
-        def find_column(column_name):
-            # if has the 'match' attribute, it's a regexp
-            if hasattr(column_name, "match"):
-                return find_column_re(column_name)
-            col_index = -1
-            try:
-                col_index = header.index(column_name.strip().lower())
-            except ValueError:
-                pass
-            return col_index
-
-        def find_column_re(column_name_re):
-            for idx, name in enumerate(header):
-                if column_name_re.match(name):
-                    return idx
-            return -1
-
-        def find_all_columns_re(column_name_re):
-            all_idx = []
-            if not hasattr(column_name_re, "match"):
-                raise Exception("Column name must be a regex for find all")
-            for idx, name in enumerate(header):
-                if column_name_re.match(name):
-                    all_idx.append(idx)
-            return all_idx
-
-        cmap = {}
-        skip_columns = set()
-        missing_columns = False
-        for spec in self.field_spec:
-            if isinstance(spec, SkipColumn):
-                if spec.skip_all:
-                    skip_columns.update(find_all_columns_re(spec.column_name))
-                else:
-                    skip_columns.update(find_column_as_list(spec.column_name))
-                continue
-
-            col_descr = spec.column_name
-            if hasattr(spec.column_name, "match"):
-                col_descr = spec.column_name.pattern
-            find_fn = find_all_columns_re if spec.find_all else find_column_as_list
-            col_index_list = self.get_index(find_fn, spec)
-
-            if not col_index_list:
-                self.missing_headers.append(spec.column_name)
-                if not spec.optional:
-                    self._error(
-                        "E3001: Column `{}' not found in `{}' `{}'".format(
-                            col_descr, os.path.basename(self.file_name), self.sheet.name
-                        )
-                    )
-                    missing_columns = True
-                cmap[spec.attribute] = None
-            else:
-                for counter, col_index in enumerate(col_index_list):
-                    key_name = spec.attribute
-                    if counter > 0:
-                        key_name += str(counter + 1)
-                        header[col_index] = key_name
-                    cmap[key_name] = col_index
-
-        mapped_columns = set(cmap.values())
-        unmapped_columns = []
-        for idx, s in enumerate(header):
-            if s != "" and idx not in mapped_columns and idx not in skip_columns:
-                unmapped_columns.append(idx)
-                self._error(
-                    "E3002: Column `{}` in `{}` `{}` is not mapped to an output field in the codebase.".format(
-                        s, os.path.basename(self.file_name), self.sheet.name
-                    )
+            for t in self.backend.row_values(self.column_name_row_index)
+        )
+        resolved = compile_field_spec(self.field_spec).resolve(header)
+        header = list(resolved.header)
+        self.missing_headers += resolved.missing_headers
+        for col_descr in resolved.missing_columns:
+            self._error(
+                "E3001: Column `{}' not found in `{}' `{}'".format(
+                    col_descr, os.path.basename(self.file_name), self.sheet_name
+                )
+            )
+        for s in resolved.unmapped_columns:
+            self._error(
+                "E3002: Column `{}` in `{}` `{}` is not mapped to an output field in the codebase.".format(
+                    s, os.path.basename(self.file_name), self.sheet_name
                 )
-        if (len(unmapped_columns) > 0 or missing_columns) and self.suggest_template:
+            )
+        if (
+            resolved.unmapped_columns or resolved.missing_columns
+        ) and self.suggest_template:
             self.print_template(header)
-        return header, cmap
-
-    def get_index(self, find_fn, spec):
-        all_index = []
-        if isinstance(spec.column_name, tuple):
-            for c, _name in enumerate(spec.column_name):
-                all_index = find_fn(_name)
-                if all_index:
-                    break
-        else:
-            all_index = find_fn(spec.column_name)
-        return all_index
+        return header, dict(resolved.column_map)
 
     def print_template(self, header):
         acceptable = set(string.ascii_letters + string.digits + "_")
@@ -305,7 +812,7 @@ class ExcelWrapper:
         template.append("]")
         self._error(
             "{} @ {} - suggested template is:\n{}".format(
-                self.file_name, self.sheet.name, "\n".join(template)
+                self.file_name, self.sheet_name, "\n".join(template)
             )
         )
 
@@ -319,41 +826,19 @@ class ExcelWrapper:
         )
 
     def get_date_mode(self):
-        assert self.workbook is not None
-        return self.workbook.datemode
+        return self.backend.datemode
 
     def date_to_string(self, s):
         try:
             date_val = float(s)
-            tpl = xlrd.xldate_as_tuple(date_val, self.workbook.datemode)
+            tpl = xlrd.xldate_as_tuple(date_val, self.get_date_mode())
             return datetime.datetime(*tpl).strftime("%d/%m/%Y")
         except ValueError:
             return s
 
     def _get_rows(self):
         """ Yields sequence of cells """
-
-        merge_redirect = {}
-        for crange in self.sheet.merged_cells:
-            rlo, rhi, clo, chi = crange
-            source_coords = (rlo, clo)
-            for rowx in range(rlo, rhi):
-                for colx in range(clo, chi):
-                    if rowx == rlo and colx == clo:
-                        continue
-                    merge_redirect[(rowx, colx)] = source_coords
-
-        for row_idx in range(self.header_length, self.sheet.nrows):
-            row = self.sheet.row(row_idx)
-            merged_row = []
-            for colx, val in enumerate(row):
-                coord = (row_idx, colx)
-                if coord in merge_redirect:
-                    merge_row, merge_col = merge_redirect[coord]
-                    merged_row.append(self.sheet.row(merge_row)[merge_col])
-                else:
-                    merged_row.append(val)
-            yield merged_row
+        return self.backend.rows(self.header_length)
 
     def get_date_time(self, i, cell):
         """ the cell contains a float and pious hope, get a date, if you dare. """
@@ -376,6 +861,43 @@ class ExcelWrapper:
             )
         return val
 
+    def _coerce_cell(self, i, func, cell):
+        ctype = cell.ctype
+        val = cell.value
+        # convert dates to python dates
+        if ctype == xlrd.XL_CELL_DATE:
+            val = self.get_date_time(i, cell)
+        if ctype == xlrd.XL_CELL_TEXT:
+            val = val.strip()
+        # apply func
+        if func is not None:
+            val = func(self._logger, val)
+        return val
+
+    def _coerce_column(self, rows, i, func, memo):
+        """
+        coerce column `i` of `rows`. spreadsheet columns are very repetitive, so
+        each distinct cell is coerced once and the result remembered in `memo`
+        (which means anything logged about a bad value is logged once.)
+        """
+        # i is None if the column specified was not found, in that case,
+        # set the val to None as well
+        if i is None:
+            return [None] * len(rows)
+        column = []
+        for row in rows:
+            cell = row[i]
+            key = (cell.ctype, cell.value)
+            if key in memo:
+                column.append(memo[key])
+                continue
+            val = self._coerce_cell(i, func, cell)
+            # results which could be modified by the caller can't be shared
+            if len(memo) < COERCE_MEMO_SIZE and isinstance(val, MEMO_TYPES):
+                memo[key] = val
+            column.append(val)
+        return column
+
     def get_all(self, typname="DataRow"):
         """Returns all rows for the sheet as namedtuple instances. Filters out any exact duplicates."""
 
@@ -384,29 +906,60 @@ class ExcelWrapper:
         if self.additional_context is not None:
             typ_attrs += list(self.additional_context.keys())
         typ = namedtuple(typname, typ_attrs)
+        context = []
+        if self.additional_context:
+            context = list(self.additional_context.values())
+
+        if self._cached is not None:
+            yield from self._replay(typ, context)
+            return
+
+        # rows are coerced a column at a time, in blocks so that rows are still
+        # streamed from the sheet
+        columns = [
+            (self.name_to_column_map[name], self.name_to_func_map[name], {})
+            for name in self.field_names
+        ]
+        header_errors = len(self._log)
+        capture = LogCapture()
+        parsed = []
+        rows = self._get_rows()
+        try:
+            while True:
+                block = list(islice(rows, ROW_BLOCK_SIZE))
+                if not block:
+                    break
+                with capture.capturing(self._logger if self._cache_key else None):
+                    values = [
+                        self._coerce_column(block, i, func, memo)
+                        for i, func, memo in columns
+                    ]
+                for tpl in zip(*values):
+                    if self._cache_key is not None:
+                        parsed.append(tpl)
+                    yield typ(*tpl, *context)
+        finally:
+            rows.close()
+            self.close()
+
+        if self._cache_key is not None:
+            self._parse_cache.put(
+                self._cache_key,
+                {
+                    "sheet_name": self.sheet_name,
+                    "missing_headers": self.missing_headers,
+                    "header": self.header,
+                    "name_to_column_map": self.name_to_column_map,
+                    "errors": self._log[:header_errors],
+                    "row_errors": self._log[header_errors:],
+                    "log_records": capture.records,
+                    "rows": parsed,
+                },
+            )
 
-        for row in self._get_rows():
-            tpl = []
-            for name in self.field_names:
-                i = self.name_to_column_map[name]
-                # i is None if the column specified was not found, in that case,
-                # set the val to None as well
-                if i is None:
-                    tpl.append(None)
-                    continue
-                func = self.name_to_func_map[name]
-                cell = row[i]
-                ctype = cell.ctype
-                val = cell.value
-                # convert dates to python dates
-                if ctype == xlrd.XL_CELL_DATE:
-                    val = self.get_date_time(i, cell)
-                if ctype == xlrd.XL_CELL_TEXT:
-                    val = val.strip()
-                # apply func
-                if func is not None:
-                    val = func(self._logger, val)
-                tpl.append(val)
-            if self.additional_context:
-                tpl += list(self.additional_context.values())
-            yield typ(*tpl)
+    def _replay(self, typ, context):
+        self._log += self._cached["row_errors"]
+        for levelno, message in self._cached["log_records"]:
+            self._logger.log(levelno, message)
+        for tpl in self._cached["rows"]:
+            yield typ(*tpl, *context)
@@ -6,20 +6,25 @@ Utility functions to fetch data from web server
 import os
 import re
 import requests
-from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor, wait
 from distutils.dir_util import mkpath
+from functools import partial
 from urllib.parse import urljoin
 
+from .download import DEFAULT_BUFFER_SIZE, DownloadException, download_file
+from .http_client import make_session
+from .listing import get_listing_cache, parse_listing
+from .manifest import Manifest
+
 import requests.packages.urllib3
 
 requests.packages.urllib3.disable_warnings()
 
+# number of directory listings and downloads in flight at once, per crawl
+DEFAULT_FETCH_CONCURRENCY = 8
 
-class MissingCredentialsException(Exception):
-    pass
 
-
-class DownloadException(Exception):
+class MissingCredentialsException(Exception):
     pass
 
 
@@ -51,115 +56,235 @@ def get_env_username(username_variable="BPAINGEST_DOWNLOADS_USERNAME"):
     return os.getenv(username_variable)
 
 
+def compile_patterns(metadata_patterns):
+    "compile `metadata_patterns` once for a crawl, rather than for every link"
+    return tuple(re.compile(pattern) for pattern in metadata_patterns)
+
+
 class Fetcher:
     """ facilitates fetching data from webserver """
 
     recurse_re = re.compile(r"^[A-Za-z0-9_-]+/")
 
-    def __init__(self, logger, target_folder, metadata_source_url, auth=None):
+    def __init__(
+        self,
+        logger,
+        target_folder,
+        metadata_source_url,
+        auth=None,
+        concurrency=DEFAULT_FETCH_CONCURRENCY,
+        executor=None,
+        mirror=False,
+        listing_index=None,
+        listing_cache=None,
+        buffer_size=DEFAULT_BUFFER_SIZE,
+    ):
         self._logger = logger
         self.target_folder = target_folder
         self.metadata_source_url = metadata_source_url
         self.auth = auth
+        self.concurrency = concurrency
+        self.buffer_size = buffer_size
+        # if an executor is passed in it is shared with other fetchers (and owned by
+        # the caller); otherwise each crawl gets a pool of its own
+        self._executor = executor
         self._ensure_target_folder_exists()
+        # when mirroring, files already held locally are revalidated against the
+        # archive rather than downloaded again
+        self.manifest = Manifest.for_folder(target_folder) if mirror else None
+        # everything seen in the directory listings is noted in `listing_index`
+        self.listing_index = listing_index
+        # listings are read from (and written to) the process-wide cache, if set up
+        self.listing_cache = listing_cache or get_listing_cache()
 
     def _ensure_target_folder_exists(self):
         if not os.path.exists(self.target_folder):
             mkpath(self.target_folder)
 
-    def _fetch(self, session, base_url, name):
-        self._logger.info("Fetching {} from {}".format(name, base_url))
+    def _make_session(self):
+        return make_session(self.concurrency)
+
+    def _fetch(self, session, base_url, name, expected_size=None, listed_size=None):
+        """
+        download `name` from `base_url`. `expected_size`, from a listing fetched in
+        this run, is checked. `listed_size`, from a cached listing, may be stale:
+        if the file turns out to differ from it, the listing is dropped from the
+        cache.
+        """
         url = base_url + name
-        with session.get(url, stream=True, auth=self.auth, verify=False) as r:
-            if r.status_code != 200:
-                raise DownloadException(
-                    "status code {} for: {}".format(r.status_code, url)
+        output_file = os.path.join(self.target_folder, name)
+        headers = {}
+        resume_validator = on_response = None
+        if self.manifest is not None:
+            headers = self.manifest.validators(name, url)
+            if not headers:
+                resume_validator = self.manifest.resume_validator(name, url)
+            on_response = partial(self.manifest.set_partial, name, url)
+        self._logger.info("Fetching {} from {}".format(name, base_url))
+        stats = download_file(
+            session,
+            url,
+            output_file,
+            self._logger,
+            auth=self.auth,
+            headers=headers,
+            resume_validator=resume_validator,
+            expected_size=expected_size,
+            buffer_size=self.buffer_size,
+            on_response=on_response,
+        )
+        if stats is None:
+            self._logger.info("{} is unchanged, not downloading".format(name))
+            size = os.path.getsize(output_file)
+        else:
+            size = stats.size
+            if self.manifest is not None:
+                self.manifest.set_complete(name, url, stats.response)
+        if listed_size is not None and size != listed_size:
+            self._logger.info(
+                "{} has changed since the cached listing of {}, dropping it".format(
+                    name, base_url
                 )
-            output_file = self.target_folder + "/" + name
-            with open(output_file, "wb") as f:
-                for chunk in r.iter_content(chunk_size=1024):
-                    if chunk:
-                        f.write(chunk)
-                        f.flush()
+            )
+            self.listing_cache.drop(base_url)
+
+    def _list_folder(self, session, url):
+        """
+        return the entries in the directory listing at `url`, in order, and
+        whether the listing was fetched from the archive (rather than the cache)
+        """
+        entries = None
+        if self.listing_cache is not None:
+            entries = self.listing_cache.get(url)
+        live = entries is None
+        if live:
+            self._logger.info("Fetching folder from {}".format(url))
+            response = session.get(url, stream=True, auth=self.auth, verify=False)
+            if response.status_code != 200:
+                self._logger.error(
+                    "warning: status code %d for url %s" % (response.status_code, url)
+                )
+            entries = parse_listing(url, response.content)
+            if self.listing_cache is not None and response.status_code == 200:
+                self.listing_cache.put(url, entries)
+        if self.listing_index is not None:
+            self.listing_index.add(entries, live=live)
+        return entries, live
 
     def fetch_metadata_from_folder(
-        self,
-        metadata_patterns,
-        metadata_info,
-        url_components,
-        download=True,
-        _target_depth=-1,
-        _url=None,
-        _session=None,
+        self, metadata_patterns, metadata_info, url_components, download=True
     ):
         """
         walk a directory structure, grabbing files matching `metadata_patterns`.
         `url_components` gives an expected minimum level of recursing to find matching files,
         and the names in `url_components` are used to set `metadata_info` for each downloaded file.
+
+        the tree is walked breadth-first: each level of directory listings is fetched
+        in parallel, and matched files are downloaded in the background while the walk
+        continues. `metadata_info` is only ever updated from the calling thread, in
+        the order the listings are walked.
         """
 
         if metadata_patterns is None:
             metadata_patterns = [r"^.*\.(md5|xlsx)$"]
-        if _url is None:
-            _url = self.metadata_source_url
-        if _target_depth == -1:
-            _target_depth = len(url_components)
-        if _session is None:
-            _session = requests.Session()
-        self._logger.info("Fetching folder from {}".format(_url))
-        response = _session.get(_url, stream=True, auth=self.auth, verify=False)
-        if response.status_code != 200:
-            self._logger.error(
-                "warning: status code %d for url %s" % (response.status_code, _url)
+        session = self._make_session()
+        if self._executor is not None:
+            self._walk(
+                self._executor,
+                session,
+                metadata_patterns,
+                metadata_info,
+                url_components,
+                download,
             )
-        fetched = set()
-        for link in BeautifulSoup(response.content, "html.parser").find_all("a"):
-            link_target = link.get("href")
-            if link_target in fetched:
-                continue
-            fetched.add(link_target)
-            # we need to descend directory tree further in order to find all `url_components`
-            if _target_depth > 0:
-                if Fetcher.recurse_re.match(link_target):
-                    self.fetch_metadata_from_folder(
-                        metadata_patterns,
-                        metadata_info,
-                        url_components,
-                        download=download,
-                        _session=_session,
-                        _target_depth=_target_depth - 1,
-                        _url=urljoin(_url, link_target),
-                    )
-            else:
-                # descend anyway, to find whatever is there, but we've already hit target_depth
-                if Fetcher.recurse_re.match(link_target):
-                    self.fetch_metadata_from_folder(
-                        metadata_patterns,
-                        metadata_info,
-                        url_components,
-                        download=download,
-                        _session=_session,
-                        _target_depth=_target_depth,
-                        _url=urljoin(_url, link_target),
-                    )
-                elif not any(
-                    re.compile(pattern).match(link_target)
-                    for pattern in metadata_patterns
-                ):
-                    continue
-                else:
-                    subdir = _url[len(self.metadata_source_url) :].strip("/")
-                    meta_parts = subdir.split("/")[: len(url_components)]
-                    assert len(meta_parts) == len(url_components)
-                    if link_target in metadata_info:
-                        raise DownloadException(
-                            "Legacy archive contains non-unique filename: %s (%s)"
-                            % (link_target, metadata_info[link_target])
+        else:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                self._walk(
+                    executor,
+                    session,
+                    metadata_patterns,
+                    metadata_info,
+                    url_components,
+                    download,
+                )
+
+    def _walk(
+        self,
+        executor,
+        session,
+        metadata_patterns,
+        metadata_info,
+        url_components,
+        download,
+    ):
+        downloads = []
+        patterns = compile_patterns(metadata_patterns)
+        # (url, target_depth): while target_depth is non-zero we need to descend
+        # further to find all `url_components`
+        frontier = [(self.metadata_source_url, len(url_components))]
+        try:
+            while frontier:
+                listings = [
+                    executor.submit(self._list_folder, session, url)
+                    for url, _ in frontier
+                ]
+                next_frontier = []
+                for (url, target_depth), listing in zip(frontier, listings):
+                    entries, live = listing.result()
+                    for entry in entries:
+                        link_target = entry.name
+                        if Fetcher.recurse_re.match(link_target):
+                            # descend anyway once we've hit target_depth, to find
+                            # whatever is there
+                            next_frontier.append(
+                                (urljoin(url, link_target), max(target_depth - 1, 0))
+                            )
+                            continue
+                        if target_depth > 0:
+                            continue
+                        if not any(p.match(link_target) for p in patterns):
+                            continue
+                        self._add_metadata_info(
+                            metadata_info, url_components, url, link_target
                         )
-                    metadata_info[link_target] = dict(
-                        list(zip(url_components, meta_parts))
-                    )
-                    metadata_info[link_target]["base_url"] = _url
-                    # download the actual file
-                    if download:
-                        self._fetch(_session, _url, link_target)
+                        # download the actual file
+                        if download:
+                            sizes = (entry.size, None) if live else (None, entry.size)
+                            downloads.append(
+                                executor.submit(
+                                    self._fetch, session, url, link_target, *sizes
+                                )
+                            )
+                frontier = next_frontier
+        finally:
+            # wait for everything we've started, so that a failure doesn't leave
+            # downloads running in the background
+            wait(downloads)
+        for future in downloads:
+            future.result()
+
+    def _add_metadata_info(self, metadata_info, url_components, url, link_target):
+        subdir = url[len(self.metadata_source_url) :].strip("/")
+        meta_parts = subdir.split("/")[: len(url_components)]
+        assert len(meta_parts) == len(url_components)
+        if link_target in metadata_info:
+            raise DownloadException(
+                "Legacy archive contains non-unique filename: %s (%s)"
+                % (link_target, metadata_info[link_target])
+            )
+        metadata_info[link_target] = dict(list(zip(url_components, meta_parts)))
+        metadata_info[link_target]["base_url"] = url
+
+
+def merge_metadata_info(metadata_info, new_info):
+    """
+    merge `new_info`, gathered by a separate crawl, into `metadata_info`. filenames
+    must be unique across all crawls, just as they are within a single crawl.
+    """
+    for link_target, info in new_info.items():
+        if link_target in metadata_info:
+            raise DownloadException(
+                "Legacy archive contains non-unique filename: %s (%s)"
+                % (link_target, metadata_info[link_target])
+            )
+        metadata_info[link_target] = info
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+Pooled HTTP sessions for talking to the archive and to CKAN.
+
+All sessions handed out by `make_session` share the process-wide settings from
+`configure_http`: connection pools sized to the configured concurrency,
+connect/read timeouts, and retries with exponential backoff on connection
+errors and 5xx responses. Requests made through them are counted per host.
+"""
+
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+
+
+DEFAULT_HTTP_CONCURRENCY = 8
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_READ_TIMEOUT = 120
+DEFAULT_HTTP_RETRIES = 5
+RETRY_BACKOFF_FACTOR = 0.5
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+
+
+class HostStats:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.latency = 0.0
+
+
+_stats_lock = threading.Lock()
+_host_stats = defaultdict(HostStats)
+
+
+def _record(url, elapsed, error, retries):
+    with _stats_lock:
+        stats = _host_stats[urlparse(url).netloc]
+        stats.requests += 1
+        stats.latency += elapsed
+        stats.retries += retries
+        if error:
+            stats.errors += 1
+
+
+def host_stats():
+    "returns a copy of the per-host request counters, keyed on host"
+    with _stats_lock:
+        return {host: vars(stats).copy() for host, stats in _host_stats.items()}
+
+
+def reset_host_stats():
+    with _stats_lock:
+        _host_stats.clear()
+
+
+def print_http_accounts():
+    stats = host_stats()
+    if not stats:
+        return
+    print("HTTP request accounting:")
+    for host in sorted(stats, key=lambda h: stats[h]["requests"]):
+        s = stats[host]
+        print(
+            "  %30s  %6d requests  %4d retries  %4d errors  %.3fs mean latency"
+            % (
+                host,
+                s["requests"],
+                s["retries"],
+                s["errors"],
+                s["latency"] / s["requests"],
+            )
+        )
+
+
+class AccountingHTTPAdapter(HTTPAdapter):
+    """
+    applies a default timeout to each request, and counts requests, retries,
+    errors and latency (time to response headers) per host
+    """
+
+    def __init__(self, timeout, *args, **kwargs):
+        self.timeout = timeout
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        start = time.time()
+        try:
+            response = super().send(request, **kwargs)
+        except requests.exceptions.RequestException:
+            _record(request.url, time.time() - start, True, 0)
+            raise
+        retries = getattr(getattr(response.raw, "retries", None), "history", ())
+        _record(
+            request.url, time.time() - start, response.status_code >= 500, len(retries)
+        )
+        return response
+
+
+_config = {
+    "concurrency": DEFAULT_HTTP_CONCURRENCY,
+    "timeout": (DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT),
+    "retries": DEFAULT_HTTP_RETRIES,
+}
+
+
+def configure_http(
+    concurrency=DEFAULT_HTTP_CONCURRENCY,
+    connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+    read_timeout=DEFAULT_READ_TIMEOUT,
+    retries=DEFAULT_HTTP_RETRIES,
+):
+    "set up the defaults for all sessions subsequently made in this process"
+    _config["concurrency"] = concurrency
+    _config["timeout"] = (connect_timeout, read_timeout)
+    _config["retries"] = retries
+
+
+def make_retry(retries):
+    # only idempotent methods (GET, HEAD, ...) are retried: CKAN actions are POSTs
+    return Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=RETRY_BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUS_CODES,
+        raise_on_status=False,
+    )
+
+
+def make_session(pool_size=None):
+    """
+    returns a requests.Session with a connection pool of `pool_size` connections
+    per host (by default, the configured concurrency)
+    """
+    if pool_size is None:
+        pool_size = _config["concurrency"]
+    session = requests.Session()
+    adapter = AccountingHTTPAdapter(
+        _config["timeout"],
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=make_retry(_config["retries"]),
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
@@ -1,14 +1,22 @@
+import calendar
 import datetime
 import json
 import math
 import re
+from functools import lru_cache
 
 from .bpa_constants import BPA_PREFIX
 
-ands_id_re = re.compile(r"^102\.100\.100[/\.](\d+)$")
-ands_id_abbrev_re = re.compile(r"^(\d+)$")
-# this format of BPA ID has been used in older projects (e.g. BASE)
-ands_id_abbrev_2_re = re.compile(r"^102\.100\.\.100[/\.](\d+)$")
+# a stripped BPA ID, in one pass: either junk (a header row left in, or a note),
+# or the ID with or without its prefix. the prefix may be duplicated (e.g.
+# 102.100.100.102.100.100.25977) or in the 102.100..100 form used in older
+# projects (e.g. BASE), and a sample extraction id may be appended after an
+# underscore
+ands_id_any_re = re.compile(
+    r"^(?:(?P<junk>e\.g\. |don't use|missing|NA)"
+    r"|(?:102\.100\.100\.102\.100\.100\.|102\.100\.\.?100[/\.])?"
+    r"(?P<id>\d+)(?:\n?_[^_]*)?$)"
+)
 # <sample_id>_<extraction>
 sample_extraction_id_re = re.compile(r"^\d{4,6}_\d")
 
@@ -157,44 +165,58 @@ def build_ands_is_for_whitelist(logger, key, value):
     return value
 
 
-def extract_ands_id(logger, s, silent=False):
-    "parse a BPA ID, with or without the prefix, returning with the prefix"
+ANDS_ID_CACHE_SIZE = 65536
+
+
+@lru_cache(maxsize=ANDS_ID_CACHE_SIZE, typed=True)
+def _parse_ands_id(s):
+    """
+    returns (prefixed, short) forms of the BPA ID `s`; (None, None) if
+    it's blank or junk, or (None, s) with `s` tidied up as far as we got,
+    if it can't be parsed
+    """
     if isinstance(s, float):
         s = int(s)
     if isinstance(s, int):
         s = str(s)
-    # if someone has appended extraction number, remove it
     s = s.strip()
     if s == "":
-        return None
-    # header row left in
-    if s.startswith("e.g. "):
-        return None
-    # remove junk
-    if s.startswith("don't use"):
-        return None
-    if s.startswith("missing"):
-        return None
-    if s.startswith("NA"):
-        return None
-
-    # duplicated 102.100.100: e.g. 102.100.100.102.100.100.25977
+        return None, None
+    m = ands_id_any_re.match(s)
+    if m is not None:
+        short = m.group("id")
+        if short is None:
+            return None, None
+        return BPA_PREFIX + short, short
+    # for the warning: the ID as it was tidied up before being matched
     s = s.replace("102.100.100.102.100.100.", "102.100.100/")
-    # handle a sample extraction id tacked on the end with an underscore
     if "_" in s:
         s = s.rsplit("_", 1)[0]
-    m = ands_id_re.match(s)
-    if m:
-        return BPA_PREFIX + m.groups()[0]
-    m = ands_id_abbrev_re.match(s)
-    if m:
-        return BPA_PREFIX + m.groups()[0]
-    m = ands_id_abbrev_2_re.match(s)
-    if m:
-        return BPA_PREFIX + m.groups()[0]
-    if not silent:
-        logger.warning("unable to parse BPA ID: `%s'" % s)
-    return None
+    return None, s
+
+
+_unparsed_ands_ids = set()
+
+
+def ands_id_forms(logger, s, silent=False):
+    """
+    parse a BPA ID, with or without the prefix, returning (prefixed, short),
+    e.g. ("102.100.100/25977", "25977"); (None, None) if it can't be parsed
+    """
+    prefixed, short = _parse_ands_id(s)
+    if prefixed is not None:
+        return prefixed, short
+    if short is not None and not silent:
+        # warn once for each ID
+        if short not in _unparsed_ands_ids:
+            _unparsed_ands_ids.add(short)
+            logger.warning("unable to parse BPA ID: `%s'" % short)
+    return None, None
+
+
+def extract_ands_id(logger, s, silent=False):
+    "parse a BPA ID, with or without the prefix, returning with the prefix"
+    return ands_id_forms(logger, s, silent)[0]
 
 
 def extract_ands_id_silent(logger, s):
@@ -202,7 +224,7 @@ def extract_ands_id_silent(logger, s):
 
 
 def short_ands_id(logger, s):
-    return extract_ands_id(logger, s).split("/")[-1]
+    return ands_id_forms(logger, s)[1]
 
 
 def get_int(logger, val, default=None):
@@ -262,6 +284,104 @@ def get_clean_number(logger, val, default=None):
     return float(matches[0])
 
 
+# the date formats accepted by _get_date, in the order they are tried
+DATE_FORMATS = (
+    "%Y-%m-%d",
+    "%Y-%m",
+    "%Y-%b-%d",
+    "%d/%m/%Y",
+    "%d-%m-%Y",
+    "%m/%Y",
+    "%d/%m/%y",
+    "%Y-%m-%d %H:%M:%S",
+    "%y-%m-%d %H:%M:%S",
+    "%Y-%m-%dT%H:%M:%SZ",
+    "%Y-%m-%dT%H:%MZ",
+)
+DATE_CACHE_SIZE = 65536
+
+# the same expressions strptime uses for each directive, so that the strings
+# accepted (single digit days and months, and so on) are exactly the same
+_date_directive_re = {
+    "d": r"3[0-1]|[1-2]\d|0[1-9]|[1-9]| [1-9]",
+    "m": r"1[0-2]|0[1-9]|[1-9]",
+    "b": "|".join(
+        re.escape(t.lower())
+        for t in sorted(calendar.month_abbr[1:], key=len, reverse=True)
+    ),
+    "y": r"\d\d",
+    "Y": r"\d\d\d\d",
+    "H": r"2[0-3]|[0-1]\d|\d",
+    "M": r"[0-5]\d|\d",
+    "S": r"6[0-1]|[0-5]\d|\d",
+}
+_month_abbr = {t.lower(): i for i, t in enumerate(calendar.month_abbr) if t}
+
+
+def _date_format_re(idx, fmt):
+    def directive(m):
+        return "(?P<%s%d>%s)" % (m.group(1), idx, _date_directive_re[m.group(1)])
+
+    # as with strptime, whitespace in the format matches any run of whitespace
+    pattern = re.sub(r"\\ ", r"\\s+", re.escape(fmt))
+    return "(?P<f%d>%s)" % (idx, re.sub(r"%(\w)", directive, pattern))
+
+
+# one expression, to pick out the first format a string is shaped like
+date_formats_re = re.compile(
+    "|".join(_date_format_re(i, fmt) for i, fmt in enumerate(DATE_FORMATS)),
+    re.IGNORECASE,
+)
+date_format_res = [
+    re.compile(_date_format_re(i, fmt), re.IGNORECASE)
+    for i, fmt in enumerate(DATE_FORMATS)
+]
+
+
+def _build_date(m, idx):
+    "builds the date from a match of format `idx`, as strptime would"
+    g = m.groupdict()
+
+    def field(name, default=0):
+        v = g.get("%s%d" % (name, idx))
+        return default if v is None else int(v)
+
+    if g.get("y%d" % idx) is not None:
+        year = field("y")
+        year += 2000 if year <= 68 else 1900
+    else:
+        year = field("Y")
+    month = g.get("b%d" % idx)
+    month = field("m", 1) if month is None else _month_abbr[month.lower()]
+    # seconds of 60 and 61 are rejected here, as they are by strptime
+    return datetime.datetime(
+        year, month, field("d", 1), field("H"), field("M"), field("S")
+    ).date()
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def _parse_date_string(dt):
+    "the date `dt` is in the first of DATE_FORMATS it is valid in, or None"
+    m = date_formats_re.fullmatch(dt)
+    if m is None:
+        return None
+    idx = int(m.lastgroup[1:])
+    try:
+        return _build_date(m, idx)
+    except ValueError:
+        pass
+    # not a valid date (e.g. 31/02/2020): try any later format it matches
+    for idx in range(idx + 1, len(DATE_FORMATS)):
+        m = date_format_res[idx].fullmatch(dt)
+        if m is None:
+            continue
+        try:
+            return _build_date(m, idx)
+        except ValueError:
+            pass
+    return None
+
+
 def get_date_isoformat(logger, s, silent=False):
     "try to parse the date, if we can, return the date as an ISO format string"
     dt = _get_date(logger, s, silent)
@@ -294,6 +414,8 @@ def _get_date(logger, dt, silent=False):
 
        YYYY-mm (convert to first date of month)
        mm/YYYY (convert to first date of month)
+
+    and the others in DATE_FORMATS.
     
     If conversion fails, returns None.
     """
@@ -322,64 +444,10 @@ def _get_date(logger, dt, silent=False):
     if dt.strip() == "":
         return None
 
-    try:
-        return datetime.datetime.strptime(dt, "%Y-%m-%d").date()
-    except ValueError:
-        pass
-
-    try:
-        return datetime.datetime.strptime(dt, "%Y-%m").date()
-    except ValueError:
-        pass
-
-    try:
-        return datetime.datetime.strptime(dt, "%Y-%b-%d").date()
-    except ValueError:
-        pass
-
-    try:
-        return datetime.datetime.strptime(dt, "%d/%m/%Y").date()
-    except ValueError:
-        pass
-
-    try:
-        return datetime.datetime.strptime(dt, "%d-%m-%Y").date()
-    except ValueError:
-        pass
-
-    try:
-        return datetime.datetime.strptime(dt, "%m/%Y").date()
-    except ValueError:
-        pass
-
-    try:
-        return datetime.datetime.strptime(dt, "%d/%m/%y").date()
-    except ValueError:
-        pass
-
-    try:
-        return datetime.datetime.strptime(dt, "%Y-%m-%d %H:%M:%S").date()
-    except ValueError:
-        pass
-
-    try:
-        return datetime.datetime.strptime(dt, "%y-%m-%d %H:%M:%S").date()
-    except ValueError:
-        pass
-
-    try:
-        return datetime.datetime.strptime(dt, "%Y-%m-%dT%H:%M:%SZ").date()
-    except ValueError:
-        pass
-
-    try:
-        return datetime.datetime.strptime(dt, "%Y-%m-%dT%H:%MZ").date()
-    except ValueError:
-        pass
-
-    if not silent:
+    d = _parse_date_string(dt)
+    if d is None and not silent:
         logger.error("Date `{}` is not in a supported format".format(dt))
-    return None
+    return d
 
 
 def add_spatial_extra(logger, package):
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+Parse Apache/nginx autoindex directory listings, and keep an index of what
+the listings tell us about each file (its size and modification time), so
+that we don't need to ask the archive about each file again.
+"""
+
+import datetime
+import html
+import json
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+from functools import lru_cache
+from hashlib import sha1
+from urllib.parse import urljoin
+
+# `name` is the link as given in the listing, and `url` where it resolves to.
+# `size` is only set if the listing gives an exact byte count; Apache's fancy
+# indexes round sizes (`1.2G`), which are no use to us. autoindex pages list a
+# symlink just as they do the file it points to, so symlink targets can't be
+# recorded here: ApacheArchiveInfo still follows the archive's redirects itself.
+ListingEntry = namedtuple("ListingEntry", ["name", "url", "size", "modified"])
+
+size_date_re = re.compile(
+    r"(?P<date>\d{4}-\d{2}-\d{2} \d{2}:\d{2}(?::\d{2})?|\d{2}-[A-Za-z]{3}-\d{4} \d{2}:\d{2}(?::\d{2})?)"
+    r"\s+(?P<size>\S+)"
+)
+exact_size_re = re.compile(r"^\d+$")
+listing_date_formats = (
+    "%Y-%m-%d %H:%M",
+    "%Y-%m-%d %H:%M:%S",
+    "%d-%b-%Y %H:%M",
+    "%d-%b-%Y %H:%M:%S",
+)
+
+
+@lru_cache(maxsize=4096)
+def parse_listing_date(s):
+    for fmt in listing_date_formats:
+        try:
+            return datetime.datetime.strptime(s, fmt).isoformat()
+        except ValueError:
+            pass
+    return None
+
+
+anchor_re = re.compile(
+    r"""<a\s[^>]*?href\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))[^>]*>""", re.I
+)
+anchor_end_re = re.compile(r"</a\s*>", re.I)
+row_end_re = re.compile(r"</tr\s*>", re.I)
+tag_re = re.compile(r"<[^>]*>")
+# a link to a file or directory alongside the listing, which can simply be
+# appended to the listing URL
+plain_link_re = re.compile(r"^[A-Za-z0-9_-][^/:?#]*/?$")
+
+
+def _join(url, link_target):
+    if url.endswith("/") and plain_link_re.match(link_target):
+        return url + link_target
+    return urljoin(url, link_target)
+
+
+def parse_listing(url, content):
+    """
+    returns a ListingEntry for each unique link in the listing at `url`, in order.
+
+    Apache and nginx autoindex pages are regular enough that we don't need to
+    build a DOM: we scan for anchors, and take the text following each link (up
+    to the next anchor, or the end of the table row) as its date and size columns.
+    """
+    if isinstance(content, bytes):
+        content = content.decode("utf8", "replace")
+    anchors = list(anchor_re.finditer(content))
+    entries = []
+    fetched = set()
+    for idx, m in enumerate(anchors):
+        link_target = html.unescape(m.group(1) or m.group(2) or m.group(3) or "")
+        if link_target in fetched:
+            continue
+        fetched.add(link_target)
+        end = anchors[idx + 1].start() if idx + 1 < len(anchors) else len(content)
+        text = content[m.end() : end]
+        anchor_end = anchor_end_re.search(text)
+        if anchor_end:
+            text = text[anchor_end.end() :]
+        row_end = row_end_re.search(text)
+        if row_end:
+            text = text[: row_end.start()]
+        size = modified = None
+        columns = size_date_re.search(html.unescape(tag_re.sub(" ", text)))
+        if columns:
+            modified = parse_listing_date(columns.group("date"))
+            if exact_size_re.match(columns.group("size")):
+                size = int(columns.group("size"))
+        entries.append(
+            ListingEntry(link_target, _join(url, link_target), size, modified)
+        )
+    return entries
+
+
+class ListingIndex:
+    """
+    index of the files seen in directory listings during a crawl, keyed on the
+    URL of each file. entries from listings fetched from the archive in this run
+    are `live`; those from the listing cache may be stale. the index isn't kept
+    between runs, as only live sizes are trusted.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._live = set()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, entries, live=True):
+        "add the file entries from a directory listing"
+        with self._lock:
+            for entry in entries:
+                if entry.name is None or entry.name.endswith("/"):
+                    continue
+                self._entries[entry.url] = entry
+                if live:
+                    self._live.add(entry.url)
+                else:
+                    self._live.discard(entry.url)
+
+    def get(self, url):
+        with self._lock:
+            return self._entries.get(url)
+
+    def size(self, url):
+        "the size of the file at `url`, or None if the listings can't tell us"
+        entry = self.get(url)
+        if entry is None:
+            return None
+        return entry.size
+
+    def live_size(self, url):
+        "the size of the file at `url`, if a listing fetched in this run gives it"
+        with self._lock:
+            if url not in self._live:
+                return None
+        return self.size(url)
+
+
+class ListingCache:
+    """
+    on-disk cache of directory listings, keyed on the directory URL. listings
+    older than `ttl` seconds are treated as missing.
+    """
+
+    def __init__(self, path, ttl):
+        self.path = path
+        self.ttl = ttl
+        self.hits = self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def _cache_path(self, url):
+        return os.path.join(self.path, sha1(url.encode("utf8")).hexdigest() + ".json")
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, url):
+        "returns the cached entries for the listing at `url`, or None"
+        try:
+            with open(self._cache_path(url), "r") as fd:
+                cached = json.load(fd)
+        except (FileNotFoundError, ValueError):
+            self._count(False)
+            return None
+        if cached["url"] != url or time.time() - cached["fetched_at"] > self.ttl:
+            self._count(False)
+            return None
+        self._count(True)
+        return [ListingEntry(*t) for t in cached["entries"]]
+
+    def put(self, url, entries):
+        cache_path = self._cache_path(url)
+        tmpf = "%s.%d.new" % (cache_path, threading.get_ident())
+        with open(tmpf, "w") as fd:
+            json.dump({"url": url, "fetched_at": time.time(), "entries": entries}, fd)
+        os.replace(tmpf, cache_path)
+
+    def drop(self, url):
+        "discard the cached listing of `url`"
+        try:
+            os.unlink(self._cache_path(url))
+        except FileNotFoundError:
+            pass
+
+    def invalidate(self):
+        "discard everything in the cache"
+        for fname in os.listdir(self.path):
+            if fname.endswith(".json"):
+                os.unlink(os.path.join(self.path, fname))
+
+
+_listing_cache = None
+
+
+def configure_listing_cache(path, ttl, invalidate=False):
+    """
+    set up the listing cache used by all Fetcher instances in this process.
+    a `ttl` of zero disables the cache.
+    """
+    global _listing_cache
+    _listing_cache = None
+    if ttl > 0:
+        _listing_cache = ListingCache(path, ttl)
+        if invalidate:
+            _listing_cache.invalidate()
+    elif invalidate and os.path.isdir(path):
+        ListingCache(path, ttl).invalidate()
+    return _listing_cache
+
+
+def get_listing_cache():
+    return _listing_cache
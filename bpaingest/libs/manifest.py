@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Per-folder manifest of metadata files mirrored from the archive.
+
+The manifest records, for each file, where it came from and the validators the
+archive handed back (ETag, Last-Modified) along with the local size, mtime and
+hash. A local file of the recorded size is only hashed again if its mtime has
+changed.
+Subsequent fetches use it to make conditional requests, and to resume
+interrupted downloads.
+"""
+
+import json
+import os
+import threading
+from hashlib import sha256
+
+
+MANIFEST_FILENAME = ".bpaingest-manifest.json"
+
+
+def file_sha256(path):
+    h = sha256()
+    with open(path, "rb") as fd:
+        while True:
+            data = fd.read(1 << 20)
+            if not data:
+                break
+            h.update(data)
+    return h.hexdigest()
+
+
+class Manifest:
+    _registry = {}
+    _registry_lock = threading.Lock()
+
+    @classmethod
+    def for_folder(cls, folder):
+        """
+        returns the manifest for `folder`. several crawls may write into the same
+        folder, so there is one shared instance per folder in the process.
+        """
+        folder = os.path.abspath(folder)
+        with cls._registry_lock:
+            if folder not in cls._registry:
+                cls._registry[folder] = cls(folder)
+            return cls._registry[folder]
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.path = os.path.join(folder, MANIFEST_FILENAME)
+        self._lock = threading.Lock()
+        self._entries = {}
+        if os.access(self.path, os.R_OK):
+            with open(self.path, "r") as fd:
+                self._entries = json.load(fd)
+
+    def validators(self, name, url):
+        """
+        returns the headers for a conditional request for `name`, or an empty dict
+        if the local copy can't be trusted (missing, changed on disk, or from a
+        different URL)
+        """
+        with self._lock:
+            entry = self._entries.get(name)
+        if entry is None or entry.get("url") != url:
+            return {}
+        local_path = os.path.join(self.folder, name)
+        try:
+            st = os.stat(local_path)
+        except FileNotFoundError:
+            return {}
+        if st.st_size != entry.get("size"):
+            return {}
+        # only hash the file if it has been touched since we wrote it
+        if st.st_mtime_ns != entry.get("mtime_ns"):
+            if file_sha256(local_path) != entry.get("sha256"):
+                return {}
+            with self._lock:
+                entry["mtime_ns"] = st.st_mtime_ns
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def resume_validator(self, name, url):
+        "returns the If-Range validator for a partial download of `name`, if any"
+        with self._lock:
+            partial = self._entries.get(name, {}).get("partial")
+        if partial is None or partial.get("url") != url:
+            return None
+        return partial.get("etag") or partial.get("last_modified")
+
+    def set_partial(self, name, url, response):
+        with self._lock:
+            entry = self._entries.setdefault(name, {})
+            entry["partial"] = {
+                "url": url,
+                "etag": response.headers.get("etag"),
+                "last_modified": response.headers.get("last-modified"),
+            }
+
+    def set_complete(self, name, url, response):
+        local_path = os.path.join(self.folder, name)
+        st = os.stat(local_path)
+        entry = {
+            "url": url,
+            "etag": response.headers.get("etag"),
+            "last_modified": response.headers.get("last-modified"),
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "sha256": file_sha256(local_path),
+        }
+        with self._lock:
+            self._entries[name] = entry
+
+    def prune(self, keep):
+        """
+        remove files (and their manifest entries) which are no longer in the archive.
+        returns the names removed.
+        """
+        with self._lock:
+            removed = sorted(set(self._entries) - set(keep))
+            for name in removed:
+                del self._entries[name]
+                for path in (name, name + ".part"):
+                    try:
+                        os.unlink(os.path.join(self.folder, path))
+                    except FileNotFoundError:
+                        pass
+        return removed
+
+    def save(self):
+        with self._lock:
+            tmpf = self.path + ".new"
+            with open(tmpf, "w") as fd:
+                json.dump(self._entries, fd, sort_keys=True, indent=2)
+            os.replace(tmpf, self.path)
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Cache of parsed MD5 manifests.
+
+Each manifest is parsed once per run into (path, md5, groups, manifest) records,
+keyed on the manifest file and on the match and skip patterns used to parse it.
+The classes of a project often read the same manifests, and most classes read
+them in both `_get_packages` and `_get_resources`: later reads are served from
+the cache. The least recently used manifests are dropped once the cache holds
+more than MD5_INDEX_MAX_RECORDS records.
+"""
+
+import os
+import threading
+from collections import OrderedDict, namedtuple
+
+from .md5lines import stream_md5file
+
+
+# `groups` are the named groups of the pattern which matched the path
+Md5Record = namedtuple("Md5Record", ["path", "md5", "groups", "manifest"])
+ParsedManifest = namedtuple("ParsedManifest", ["records", "no_match", "skipped"])
+
+# larger manifests aren't kept in the cache, but read as a stream each time
+MD5_INDEX_MAX_SIZE = 64 * (1 << 20)
+# the most records kept in the cache, across every manifest
+MD5_INDEX_MAX_RECORDS = 2 * 1000 * 1000
+
+_manifests = OrderedDict()
+_manifests_lock = threading.Lock()
+
+
+def pattern_fingerprint(regexps):
+    "identifies a list of compiled regular expressions, for use in a cache key"
+    if regexps is None:
+        return None
+    return tuple((t.pattern, t.flags) for t in regexps)
+
+
+def indexable(fname):
+    "whether `fname` is small enough to keep in the cache"
+    return os.path.getsize(fname) <= MD5_INDEX_MAX_SIZE
+
+
+def parse_manifest(fname, match, skip):
+    """
+    returns the ParsedManifest of `fname`, parsed with the `match` and `skip`
+    patterns. the result is shared: the caller must not modify it.
+    """
+    st = os.stat(fname)
+    key = (
+        os.path.abspath(fname),
+        st.st_size,
+        st.st_mtime_ns,
+        pattern_fingerprint(match),
+        pattern_fingerprint(skip),
+    )
+    with _manifests_lock:
+        parsed = _manifests.get(key)
+        if parsed is not None:
+            _manifests.move_to_end(key)
+            return parsed
+    no_match = []
+    skipped = []
+    records = [
+        Md5Record(path, md5, groups, fname)
+        for path, md5, groups in stream_md5file(
+            fname, match, skip, no_match.append, skipped.append
+        )
+    ]
+    parsed = ParsedManifest(records, no_match, skipped)
+    with _manifests_lock:
+        parsed = _manifests.setdefault(key, parsed)
+        _evict_manifests()
+        return parsed
+
+
+def _evict_manifests():
+    total = sum(len(t.records) for t in _manifests.values())
+    # always keep the manifest most recently parsed
+    while total > MD5_INDEX_MAX_RECORDS and len(_manifests) > 1:
+        _, parsed = _manifests.popitem(last=False)
+        total -= len(parsed.records)
+
+
+def clear_manifests():
+    "discard all parsed manifests"
+    with _manifests_lock:
+        _manifests.clear()
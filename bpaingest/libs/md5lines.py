@@ -1,37 +1,80 @@
 from bpaingest.libs.common_resources import bsd_md5_re, linux_md5_re
-from bpaingest.libs.raw_matcher import RawParser
+from bpaingest.libs.raw_matcher import RawParser, make_matcher
+
+
+# manifests of archive-wide data run to many megabytes
+MD5_READ_BUFFER_SIZE = 1 << 20
+
+# (regexp, whether the path comes before the md5)
+BSD_DIALECT = (bsd_md5_re, True)
+GNU_DIALECT = (linux_md5_re, False)
 
 
 class MD5Parser(RawParser):
     def _parse(self, fname, match, skip):
-        with open(fname) as f:
-            for md5, path in md5lines(f):
-                match_path = self._match_path(path)
-                if skip is not None and self._matching_regexp(skip, match_path):
-                    self.skipped.append(path)
-                    continue
-                m = self._matching_regexp(match, match_path)
-                if not m:
-                    self.no_match.append(path)
-                    continue
-                self.matches.append((path, md5, m.groupdict()))
+        self.matches.extend(
+            stream_md5file(
+                fname,
+                match,
+                skip,
+                on_no_match=self.no_match.append,
+                on_skipped=self.skipped.append,
+            )
+        )
+
+
+def stream_md5file(fname, match, skip, on_no_match=None, on_skipped=None):
+    """
+    yields (path, md5, groups) for each line of the manifest `fname` whose path
+    matches one of `match`, as the manifest is read. the paths of other lines
+    are passed to `on_skipped` if they match one of `skip`, and otherwise to
+    `on_no_match`.
+    """
+    match = make_matcher(match)
+    if skip is not None:
+        skip = make_matcher(skip)
+    with open(fname, buffering=MD5_READ_BUFFER_SIZE) as f:
+        for md5, path in md5lines(f):
+            match_path = RawParser._match_path(path)
+            if skip is not None and skip.match(match_path):
+                if on_skipped is not None:
+                    on_skipped(path)
+                continue
+            m = match.match(match_path)
+            if not m:
+                if on_no_match is not None:
+                    on_no_match(path)
+                continue
+            yield path, md5, m.groupdict()
+
+
+def detect_dialect(line):
+    "the dialect (BSD or GNU) of a manifest, from its first line"
+    # a GNU line starts with the md5, and 'M' isn't a hex digit
+    if line.startswith("MD5"):
+        return BSD_DIALECT, GNU_DIALECT
+    return GNU_DIALECT, BSD_DIALECT
 
 
 def md5lines(fd):
-    "read MD5 lines from `fd` and yield pairs of (md5, path)"
+    """
+    read MD5 lines from `fd` and yield pairs of (md5, path). lines in the dialect
+    of the first line are matched with one regular expression; the other is only
+    tried if a line doesn't match.
+    """
+    dialects = None
     for line in fd:
         line = line.strip()
         # skip blank lines
         if line == "":
             continue
-        m = bsd_md5_re.match(line)
-        if m:
-            path, md5 = m.groups()
-            yield md5, path
-            continue
-        m = linux_md5_re.match(line)
-        if m:
-            md5, path = m.groups()
-            yield md5, path
-            continue
-        raise Exception("Could not parse MD5 line: %s" % line)
+        if dialects is None:
+            dialects = detect_dialect(line)
+        for regexp, path_first in dialects:
+            m = regexp.match(line)
+            if m:
+                a, b = m.groups()
+                yield (b, a) if path_first else (a, b)
+                break
+        else:
+            raise Exception("Could not parse MD5 line: %s" % line)
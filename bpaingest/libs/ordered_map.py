@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Runs a function over a list of items in a pool of threads, handing back the
+results in the order of the items.
+
+The messages each call logs are held back while it runs, and logged when its
+result is handed back: the log of a parallel run reads as it would have if the
+items had been processed one after the other. Only a few items per thread are
+in flight at once, so that results and held back messages don't pile up ahead
+of the caller.
+"""
+
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
+
+
+# items submitted (running, or finished and waiting to be handed back) per thread
+IN_FLIGHT_PER_THREAD = 2
+
+
+class LogBuffer(logging.Filter):
+    "holds back the records logged by a thread, while it is buffering"
+
+    def __init__(self):
+        super().__init__()
+        self._local = threading.local()
+
+    def filter(self, record):
+        records = getattr(self._local, "records", None)
+        if records is None:
+            return True
+        records.append(record)
+        return False
+
+    @contextmanager
+    def buffering(self):
+        records = self._local.records = []
+        try:
+            yield records
+        finally:
+            self._local.records = None
+
+    @contextmanager
+    def attached(self, loggers):
+        for logger in loggers:
+            logger.addFilter(self)
+        try:
+            yield self
+        finally:
+            for logger in loggers:
+                logger.removeFilter(self)
+
+
+def replay(records):
+    "log `records`, held back by a LogBuffer"
+    for record in records:
+        logging.getLogger(record.name).handle(record)
+
+
+def ordered_map(fn, items, concurrency, loggers=()):
+    """
+    calls fn(item) for each of `items`, in up to `concurrency` threads. yields
+    (item, result, exception) in the order of `items`; an exception raised by one
+    call doesn't stop the others. messages logged to `loggers` by a call are
+    logged just before its result is yielded.
+    """
+    items = list(items)
+    log_buffer = LogBuffer()
+
+    def call(item):
+        with log_buffer.buffering() as records:
+            try:
+                return fn(item), None, records
+            except Exception as e:
+                return None, e, records
+
+    if concurrency <= 1 or len(items) <= 1:
+        for item in items:
+            try:
+                result = fn(item)
+            except Exception as e:
+                yield item, None, e
+            else:
+                yield item, result, None
+        return
+
+    with log_buffer.attached(loggers), ThreadPoolExecutor(
+        max_workers=concurrency
+    ) as executor:
+        to_submit = iter(items)
+        in_flight = deque()
+
+        def submit(n):
+            for item in islice(to_submit, n):
+                in_flight.append((item, executor.submit(call, item)))
+
+        submit(concurrency * IN_FLIGHT_PER_THREAD)
+        try:
+            while in_flight:
+                item, future = in_flight.popleft()
+                result, exception, records = future.result()
+                # keep the threads busy while the caller handles this result
+                submit(1)
+                replay(records)
+                yield item, result, exception
+        finally:
+            for _, future in in_flight:
+                future.cancel()
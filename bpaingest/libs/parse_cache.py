@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+On-disk cache of parsed spreadsheets.
+
+ExcelWrapper stores the coerced rows of each sheet it parses, along with the
+errors and log messages the parse produced, keyed on the workbook's content,
+the sheet and header options, the field spec and the additional context. A
+later parse of the same sheet replays the cached result without opening the
+workbook.
+
+Coerce functions call helpers throughout the package, so the key also holds a
+hash of the source of the whole of bpaingest: any change to it starts afresh.
+"""
+
+import hashlib
+import inspect
+import os
+import pickle
+import sys
+import threading
+import zlib
+from functools import lru_cache
+
+
+DEFAULT_PARSE_CACHE_SIZE = 1 << 30
+# bump to discard everything cached by earlier versions
+PARSE_CACHE_VERSION = 1
+
+
+def _describe_column_name(column_name):
+    if hasattr(column_name, "pattern"):
+        return ("re", column_name.pattern, column_name.flags)
+    if isinstance(column_name, tuple):
+        return tuple(_describe_column_name(t) for t in column_name)
+    return column_name
+
+
+@lru_cache(maxsize=None)
+def module_fingerprint(module_name):
+    "hash of the source of `module_name`, so that cached results follow code changes"
+    module = sys.modules.get(module_name)
+    path = getattr(module, "__file__", None)
+    if path is None:
+        return None
+    with open(path, "rb") as fd:
+        return hashlib.sha1(fd.read()).hexdigest()
+
+
+@lru_cache(maxsize=None)
+def package_fingerprint():
+    "hash of the source of every module in the bpaingest package"
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    h = hashlib.sha1()
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if not filename.endswith(".py"):
+                continue
+            path = os.path.join(dirpath, filename)
+            h.update(os.path.relpath(path, root).encode("utf8"))
+            with open(path, "rb") as fd:
+                h.update(hashlib.sha1(fd.read()).digest())
+    return h.hexdigest()
+
+
+def describe_function(fn):
+    """
+    identifies a coerce function: where it is defined, and the source of the module
+    it comes from (which usually holds any helpers it calls)
+    """
+    if fn is None:
+        return None
+    if hasattr(fn, "func"):
+        # functools.partial
+        return (
+            "partial",
+            describe_function(fn.func),
+            repr(fn.args),
+            repr(sorted(fn.keywords.items())),
+        )
+    fn = inspect.unwrap(fn)
+    code = getattr(fn, "__code__", None)
+    return (
+        getattr(fn, "__module__", None),
+        getattr(fn, "__qualname__", repr(fn)),
+        code.co_firstlineno if code is not None else None,
+        module_fingerprint(getattr(fn, "__module__", None)),
+    )
+
+
+def describe_field_spec(field_spec):
+    description = []
+    for spec in field_spec:
+        d = spec._asdict()
+        d["column_name"] = _describe_column_name(spec.column_name)
+        if "coerce" in d:
+            d["coerce"] = describe_function(spec.coerce)
+        description.append((type(spec).__name__, sorted(d.items())))
+    return description
+
+
+_content_hashes = {}
+_content_hashes_lock = threading.Lock()
+
+
+def content_hash(file_name):
+    "sha256 of the file, remembered for as long as its size and mtime are unchanged"
+    st = os.stat(file_name)
+    stat_key = (os.path.abspath(file_name), st.st_size, st.st_mtime_ns)
+    with _content_hashes_lock:
+        if stat_key in _content_hashes:
+            return _content_hashes[stat_key]
+    h = hashlib.sha256()
+    with open(file_name, "rb") as fd:
+        while True:
+            data = fd.read(1 << 20)
+            if not data:
+                break
+            h.update(data)
+    with _content_hashes_lock:
+        _content_hashes[stat_key] = h.hexdigest()
+    return h.hexdigest()
+
+
+class ParseCache:
+    """
+    cache of parsed sheets, one compressed pickle per sheet. once the entries
+    take up more than `max_size` bytes the least recently used are removed.
+    """
+
+    def __init__(self, path, max_size=DEFAULT_PARSE_CACHE_SIZE):
+        self.path = path
+        self.max_size = max_size
+        self.hits = self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def key(self, file_name, options, field_spec, additional_context):
+        """
+        `options` are the sheet name and header options, as a tuple. returns None
+        if the parse can't be cached (e.g. the field spec can't be described.)
+        """
+        try:
+            description = repr(
+                (
+                    PARSE_CACHE_VERSION,
+                    package_fingerprint(),
+                    content_hash(file_name),
+                    options,
+                    describe_field_spec(field_spec),
+                    None
+                    if additional_context is None
+                    else list(additional_context.items()),
+                )
+            )
+        except (AttributeError, TypeError, OSError):
+            return None
+        return hashlib.sha256(description.encode("utf8")).hexdigest()
+
+    def _cache_path(self, key):
+        return os.path.join(self.path, key + ".pickle.z")
+
+    def count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key):
+        "returns the cached parse for `key`, or None"
+        cache_path = self._cache_path(key)
+        try:
+            with open(cache_path, "rb") as fd:
+                entry = pickle.loads(zlib.decompress(fd.read()))
+        except (OSError, EOFError, zlib.error, pickle.UnpicklingError):
+            self.count(False)
+            return None
+        # note the use, for LRU eviction
+        try:
+            os.utime(cache_path)
+        except OSError:
+            pass
+        self.count(True)
+        return entry
+
+    def put(self, key, entry):
+        try:
+            data = zlib.compress(pickle.dumps(entry, protocol=4))
+        except (pickle.PicklingError, TypeError, AttributeError):
+            # something in the rows can't be stored; just parse it again next time
+            return
+        cache_path = self._cache_path(key)
+        tmpf = "%s.%d.%d.new" % (cache_path, os.getpid(), threading.get_ident())
+        with open(tmpf, "wb") as fd:
+            fd.write(data)
+        os.replace(tmpf, cache_path)
+        self.evict()
+
+    def evict(self):
+        "remove the least recently used entries, until the cache fits in max_size"
+        entries = []
+        for fname in os.listdir(self.path):
+            if not fname.endswith(".pickle.z"):
+                continue
+            try:
+                st = os.stat(os.path.join(self.path, fname))
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, fname))
+        total = sum(size for _, size, _ in entries)
+        for _, size, fname in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.unlink(os.path.join(self.path, fname))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+_parse_cache = None
+
+
+def configure_parse_cache(path, max_size=DEFAULT_PARSE_CACHE_SIZE, enabled=True):
+    "set up the parse cache used by all ExcelWrapper instances in this process"
+    global _parse_cache
+    _parse_cache = None
+    if enabled:
+        _parse_cache = ParseCache(path, max_size)
+    return _parse_cache
+
+
+def get_parse_cache():
+    return _parse_cache
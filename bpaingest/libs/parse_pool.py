@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Parses a project's metadata workbooks in a pool of worker processes.
+
+Parsing a workbook is CPU bound and independent of the other workbooks, so the
+workbooks are fanned out to the pool and their rows handed back in filename
+order. One pool is kept for the whole run, so that the cost of starting the
+workers is paid once.
+
+Field specs often hold lambdas, which can't be sent to a worker: instead the
+worker is sent the metadata class, and reads the `spreadsheet` attribute from it.
+"""
+
+import logging
+import os
+import pickle
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from .excel_wrapper import (
+    ExcelWrapper,
+    LogCapture,
+    configure_excel_backend,
+    get_excel_backend,
+)
+from .parse_cache import configure_parse_cache, get_parse_cache
+
+
+DEFAULT_PARSE_WORKERS = min(8, os.cpu_count() or 1)
+
+# `rows` are plain tuples, with the attribute names in `fields`: the namedtuple
+# type of each row is made again in the parent
+ParsedSheet = namedtuple(
+    "ParsedSheet", ["file_name", "fields", "rows", "errors", "log_records", "cached"]
+)
+
+_parse_workers = DEFAULT_PARSE_WORKERS
+_parse_pool = None
+
+# messages logged while parsing are captured, and logged again by the caller
+_worker_logger = logging.getLogger("%s.worker" % (__name__))
+_worker_logger.propagate = False
+
+
+def configure_parse_workers(workers):
+    "set the number of processes used to parse workbooks (1 to parse in this process)"
+    global _parse_workers
+    shutdown_parse_pool()
+    _parse_workers = max(1, workers)
+
+
+def _init_worker(excel_backend, parse_cache):
+    configure_excel_backend(excel_backend)
+    if parse_cache is None:
+        configure_parse_cache(None, enabled=False)
+    else:
+        configure_parse_cache(*parse_cache)
+
+
+def get_parse_pool():
+    "returns the process pool, starting it if needed; None if parsing is serial"
+    global _parse_pool
+    if _parse_workers <= 1:
+        return None
+    if _parse_pool is None:
+        parse_cache = get_parse_cache()
+        _parse_pool = ProcessPoolExecutor(
+            max_workers=_parse_workers,
+            initializer=_init_worker,
+            initargs=(
+                get_excel_backend(),
+                None
+                if parse_cache is None
+                else (parse_cache.path, parse_cache.max_size),
+            ),
+        )
+    return _parse_pool
+
+
+def shutdown_parse_pool():
+    global _parse_pool
+    if _parse_pool is not None:
+        _parse_pool.shutdown()
+        _parse_pool = None
+
+
+def parse_sheet(metadata_class, file_name, additional_context):
+    "parse `file_name` with the spreadsheet definition of `metadata_class`"
+    spreadsheet = metadata_class.spreadsheet
+    capture = LogCapture()
+    with capture.capturing(_worker_logger):
+        wrapper = ExcelWrapper(
+            _worker_logger,
+            spreadsheet["fields"],
+            file_name,
+            additional_context=additional_context,
+            suggest_template=True,
+            **spreadsheet["options"],
+        )
+        errors = wrapper.get_errors()
+        rows = list(wrapper.get_all())
+    return ParsedSheet(
+        file_name,
+        rows[0]._fields if rows else None,
+        [tuple(t) for t in rows],
+        errors,
+        capture.records,
+        wrapper.from_cache,
+    )
+
+
+def _can_send(metadata_class):
+    try:
+        pickle.dumps(metadata_class)
+    except (pickle.PicklingError, AttributeError, TypeError):
+        return False
+    return True
+
+
+def parse_sheets(metadata_class, jobs, logger):
+    """
+    `jobs` is a list of (file_name, additional_context). yields (file_name, rows)
+    for each, ordered by file name. errors and messages from the parse of each
+    workbook are logged to `logger` before its rows are yielded.
+    """
+    jobs = sorted(jobs, key=lambda job: job[0])
+    pool = None
+    if len(jobs) > 1 and _can_send(metadata_class):
+        pool = get_parse_pool()
+    if pool is None:
+        results = (parse_sheet(metadata_class, *job) for job in jobs)
+    else:
+        futures = [pool.submit(parse_sheet, metadata_class, *job) for job in jobs]
+        results = (future.result() for future in futures)
+
+    parse_cache = get_parse_cache()
+    for parsed in results:
+        for error in parsed.errors:
+            logger.error(error)
+        for levelno, message in parsed.log_records:
+            logger.log(levelno, message)
+        if pool is not None and parse_cache is not None:
+            # the cache was consulted in the worker; keep the counts here
+            parse_cache.count(parsed.cached)
+        rows = []
+        if parsed.fields is not None:
+            typ = namedtuple("DataRow", parsed.fields)
+            rows = [typ(*t) for t in parsed.rows]
+        yield parsed.file_name, rows
@@ -1,6 +1,90 @@
+import re
+from functools import lru_cache
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
 from bpaingest.libs.common_resources import bsd_md5_re, linux_md5_re
 
 
+# literals shorter than this aren't worth checking for
+MIN_LITERAL_LENGTH = 3
+
+
+def _literal_runs(parsed, runs, current):
+    """
+    walk the top level of a parsed regular expression, adding to `runs` each
+    sequence of literal characters which every match must contain
+    """
+    for op, av in parsed:
+        if op is sre_parse.LITERAL:
+            current.append(chr(av))
+            continue
+        if op is sre_parse.SUBPATTERN:
+            _group, add_flags, _del_flags, p = av
+            if not add_flags & re.IGNORECASE:
+                # a group is matched in sequence, so its literals run on from ours
+                _literal_runs(p, runs, current)
+                continue
+        if current:
+            runs.append("".join(current))
+            current.clear()
+
+
+def required_literals(regexp):
+    "returns the literal strings that any string `regexp` matches must contain"
+    if regexp.flags & re.IGNORECASE:
+        return []
+    try:
+        parsed = sre_parse.parse(regexp.pattern, regexp.flags)
+    except Exception:
+        return []
+    runs = []
+    current = []
+    _literal_runs(parsed, runs, current)
+    if current:
+        runs.append("".join(current))
+    return [t for t in runs if len(t) >= MIN_LITERAL_LENGTH]
+
+
+class FilenameMatcher:
+    """
+    matches filenames against a list of regular expressions, in order, returning
+    the first match. each expression is only tried if the filename contains the
+    longest literal text it requires (e.g. a `.fastq.gz` suffix, or `_MGE_`).
+    """
+
+    def __init__(self, regexps):
+        self.regexps = list(regexps)
+        self._tests = [
+            (max(required_literals(t), key=len, default=""), t.match)
+            for t in self.regexps
+        ]
+
+    def match(self, s):
+        "return the match of the first of the regular expressions to match `s`"
+        for literal, match in self._tests:
+            if literal in s:
+                m = match(s)
+                if m:
+                    return m
+        return None
+
+
+@lru_cache(maxsize=None)
+def _compile_matcher(regexps):
+    return FilenameMatcher(regexps)
+
+
+def make_matcher(regexps):
+    "returns a FilenameMatcher for `regexps`, shared with other users of the same list"
+    if isinstance(regexps, FilenameMatcher):
+        return regexps
+    return _compile_matcher(tuple(regexps))
+
+
 class RawParser:
     def __init__(self, name, match, skip):
         self.skipped = []
@@ -11,22 +95,22 @@ class RawParser:
     @classmethod
     def _matching_regexp(cls, regexps, s):
         "return the first matching regular expression from `regexps`"
-        matches = [t for t in [regexp.match(s) for regexp in regexps] if t]
-        if not matches:
-            return None
-        return matches[0]
+        return make_matcher(regexps).match(s)
 
     @classmethod
     def _match_path(cls, s):
         return s.split("/")[-1]
 
     def _parse(self, list_name, match, skip):
+        match = make_matcher(match)
+        if skip is not None:
+            skip = make_matcher(skip)
         for path in list_name:
             match_path = self._match_path(path)
-            if skip is not None and self._matching_regexp(skip, match_path):
+            if skip is not None and skip.match(match_path):
                 self.skipped.append(path)
                 continue
-            m = self._matching_regexp(match, match_path)
+            m = match.match(match_path)
             if not m:
                 self.no_match.append(path)
                 continue
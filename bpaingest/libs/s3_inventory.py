@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Inventory of the resources uploaded to S3.
+
+Re-uploaded resources are stored under `<destination>/resources/<id>/<filename>`.
+Listing that prefix gives the size and etag of every uploaded resource in a few
+hundred requests, where probing each resource through the CKAN download link
+takes two requests per resource.
+"""
+
+import re
+import threading
+from collections import namedtuple
+from urllib.parse import unquote
+
+import boto3
+
+
+InventoryEntry = namedtuple("InventoryEntry", ["size", "etag", "key"])
+
+# the download link CKAN gives an uploaded resource
+ckan_download_re = re.compile(r"/resource/(?P<id>[^/]+)/download/(?P<filename>[^/]+)$")
+
+
+def resource_key(url):
+    "the (resource id, filename) of a CKAN download link, or None"
+    m = ckan_download_re.search(url or "")
+    if not m:
+        return None
+    return m.group("id"), unquote(m.group("filename"))
+
+
+class S3Inventory:
+    """
+    the size and etag of each object under `prefix` in `bucket`, keyed on
+    (resource id, filename)
+    """
+
+    def __init__(self, bucket, prefix, client=None, endpoint_url=None):
+        self.bucket = bucket
+        self.prefix = prefix
+        if client is None:
+            client = boto3.client("s3", endpoint_url=endpoint_url)
+        self._client = client
+        self._entries = {}
+        self.pages = 0
+        self.hits = self.misses = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_destination(cls, destination, **kwargs):
+        "inventory of the resources uploaded to `destination` (bucket/path)"
+        bucket, _, path = destination.partition("/")
+        prefix = "resources/" if not path else path.rstrip("/") + "/resources/"
+        return cls(bucket, prefix, **kwargs)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def load(self):
+        "list the prefix, replacing anything already loaded"
+        entries = {}
+        paginator = self._client.get_paginator("list_objects_v2")
+        self.pages = 0
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            self.pages += 1
+            for obj in page.get("Contents", []):
+                parts = obj["Key"][len(self.prefix) :].split("/")
+                if len(parts) != 2:
+                    continue
+                entries[tuple(parts)] = InventoryEntry(
+                    obj["Size"], obj.get("ETag"), obj["Key"]
+                )
+        self._entries = entries
+        return self
+
+    def get(self, url):
+        "the InventoryEntry for the CKAN download link `url`, or None"
+        key = resource_key(url)
+        entry = self._entries.get(key) if key is not None else None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def s3_url(self, entry):
+        return "s3://%s/%s" % (self.bucket, entry.key)
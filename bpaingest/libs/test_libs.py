@@ -1,8 +1,60 @@
+import datetime
+import logging
+import logging.handlers
+import os
+import re
+import threading
+import zipfile
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
 from io import BytesIO
+from types import SimpleNamespace
+from urllib.parse import urlparse
 
-from .ingest_utils import get_clean_number
-from .multihash import _generate_hashes
+import boto3
+import openpyxl
+import pytest
+import requests
+from botocore.stub import Stubber
+
+from . import md5_index
+from .benchmarks import Measurement, find_regressions
+from .download import download_file
+from .excel_wrapper import (
+    EXCEL_BACKENDS,
+    ExcelWrapper,
+    WorkbookCache,
+    compile_field_spec,
+    make_field_definition,
+    make_skip_column,
+)
+from .fetch_data import DownloadException, Fetcher
+from .http_client import configure_http, host_stats, make_session, reset_host_stats
+from .ingest_utils import (
+    DATE_FORMATS,
+    _get_date,
+    ands_id_forms,
+    extract_ands_id,
+    get_clean_number,
+)
+from .listing import ListingCache, ListingEntry, ListingIndex, parse_listing
+from .manifest import Manifest
+from .md5_index import parse_manifest
+from .md5lines import stream_md5file
+from .ordered_map import ordered_map
+from .parse_cache import ParseCache
+from .parse_pool import DEFAULT_PARSE_WORKERS, configure_parse_workers, parse_sheets
+from .raw_matcher import FilenameMatcher, required_literals
+from .s3_inventory import S3Inventory, resource_key
+from .verification_cache import VerificationCache
+from .multihash import S3_HASH_FIELDS, _generate_hashes
+from bpaingest.abstract import BaseMetadata
 from bpaingest.libs.common_resources import bsd_md5_re, linux_md5_re
+from bpaingest.metadata import ContextualStore, link_folder
+from bpaingest.ops import CKANArchiveInfo, ResourceProbe, check_resource
+from bpaingest.sync import check_resources
 from bpaingest.util import make_logger
 
 
@@ -27,6 +79,81 @@ def test_get_clean_number():
     assert get_clean_number(logger, None) is None
 
 
+def test_extract_ands_id(caplog):
+    ids = {
+        "102.100.100/25977": ("102.100.100/25977", "25977"),
+        " 102.100.100.25977 ": ("102.100.100/25977", "25977"),
+        "102.100.100.102.100.100.25977": ("102.100.100/25977", "25977"),
+        "102.100..100/25977": ("102.100.100/25977", "25977"),
+        "25977_1": ("102.100.100/25977", "25977"),
+        25977.0: ("102.100.100/25977", "25977"),
+        25977: ("102.100.100/25977", "25977"),
+        "": (None, None),
+        "e.g. 102.100.100/1": (None, None),
+        "NA": (None, None),
+        "102.100.100/25977_1_2": (None, None),
+        "sample 7": (None, None),
+    }
+    with caplog.at_level(logging.WARNING, logger=logger.name):
+        for s, forms in ids.items():
+            assert ands_id_forms(logger, s) == forms, s
+        assert extract_ands_id(logger, "sample 7") is None
+    warnings = [r.getMessage() for r in caplog.records if r.name == logger.name]
+    # each unparsable ID is warned about once
+    assert warnings == [
+        "unable to parse BPA ID: `102.100.100/25977_1'",
+        "unable to parse BPA ID: `sample 7'",
+    ]
+
+
+def strptime_date(dt):
+    "the date parsing _get_date did before it sniffed formats"
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(dt, fmt).date()
+        except ValueError:
+            pass
+    return None
+
+
+def test_get_date():
+    dates = [
+        "2016-03-01",
+        "2016-3-1",
+        "2016-03",
+        "2016-mar-01",
+        "2016-MAR-1",
+        "01/03/2016",
+        " 1/3/2016",
+        "01-03-2016",
+        "3/2016",
+        "01/03/16",
+        "01/03/69",
+        "2016-03-01 10:11:12",
+        "2016-03-01  1:2:3",
+        "16-03-01 10:11:12",
+        "2016-03-01T10:11:12Z",
+        "2016-03-01t10:11z",
+        "2016-02-30",
+        "31/02/2016",
+        "2016-03-01 10:11:60",
+        "2016-13-01",
+        "0000-01-01",
+        "2016-03-01 ",
+        "2016/03/01",
+        "1 March 2016",
+    ]
+    for fmt in DATE_FORMATS:
+        dates += [
+            datetime.datetime(2000 + i, i % 12 + 1, i % 31 + 1, i % 24, i).strftime(fmt)
+            for i in range(0, 60, 7)
+        ]
+    for dt in dates:
+        assert _get_date(logger, dt, silent=True) == strptime_date(dt), dt
+    assert _get_date(logger, "unknown") is None
+    assert _get_date(logger, datetime.date(2016, 3, 1)) == datetime.date(2016, 3, 1)
+
+
 def test_multihash_empty():
     result = _generate_hashes(BytesIO(b""))
     assert result == {
@@ -79,6 +206,28 @@ def test_multihash_huge_chunks():
     }
 
 
+def test_filename_matcher():
+    novaseq_re = re.compile(
+        r"""
+        (?P<id>\d{4,6})_
+        MGE_
+        (?P<flowcell>\w{9})_
+        (?P<read>R[1|2])_001\.fastq\.gz
+    """,
+        re.VERBOSE,
+    )
+    any_fastq_re = re.compile(r"^(?P<id>\d+)_.*(?:\.FASTQ)\.gz$", re.IGNORECASE)
+    assert required_literals(novaseq_re) == ["_MGE_", "_001.fastq.gz"]
+    assert required_literals(any_fastq_re) == []
+
+    matcher = FilenameMatcher([novaseq_re, any_fastq_re])
+    m = matcher.match("12345_MGE_HLCH5DSXY_R1_001.fastq.gz")
+    assert m.re is novaseq_re
+    assert m.groupdict() == {"id": "12345", "flowcell": "HLCH5DSXY", "read": "R1"}
+    assert matcher.match("12345_MGE_HLCH5DSXY_R1.FASTQ.GZ").re is any_fastq_re
+    assert matcher.match("12345_MGE_HLCH5DSXY_R1_001.fastq") is None
+
+
 def test_md5lines():
     filenames = [
         "MD5 (24721-24724_and_24726-24729_SC_MA_Bio21-GCMS-001_857_PCA_median_normalised.png) = 8f819a7635f192212300cd64d1e34f10",
@@ -100,3 +249,1053 @@ def test_md5lines2():
     ]
     for filename in filenames:
         assert linux_md5_re.match(filename) is not None
+
+
+def write_manifest(path, lines):
+    with open(path, "w") as fd:
+        fd.write("".join(line + "\n" for line in lines))
+    return str(path)
+
+
+def test_stream_md5file(tmp_path):
+    match = [re.compile(r"^(?P<sample_id>\d+)_R[12]\.fastq\.gz$")]
+    skip = [re.compile(r"^.*\.xlsx$")]
+    bsd = "MD5 (%s) = %s"
+    gnu = "%s  %s"
+    expected = [
+        ("1234_R1.fastq.gz", "a" * 32, {"sample_id": "1234"}),
+        ("1234_R2.fastq.gz", "b" * 32, {"sample_id": "1234"}),
+    ]
+    manifests = {
+        "bsd": [
+            bsd % ("1234_R1.fastq.gz", "a" * 32),
+            bsd % ("1234_R2.fastq.gz", "b" * 32),
+        ],
+        "gnu": [
+            gnu % ("a" * 32, "1234_R1.fastq.gz"),
+            "",
+            gnu % ("b" * 32, "1234_R2.fastq.gz"),
+        ],
+        # lines in the other dialect fall back to its regular expression
+        "bsd_mixed": [
+            bsd % ("1234_R1.fastq.gz", "a" * 32),
+            gnu % ("b" * 32, "1234_R2.fastq.gz"),
+        ],
+        "gnu_mixed": [
+            gnu % ("a" * 32, "1234_R1.fastq.gz"),
+            bsd % ("1234_R2.fastq.gz", "b" * 32),
+        ],
+    }
+    for name, lines in manifests.items():
+        fname = write_manifest(tmp_path / (name + ".md5"), lines)
+        assert list(stream_md5file(fname, match, skip)) == expected, name
+
+    fname = write_manifest(
+        tmp_path / "other.md5",
+        [
+            gnu % ("c" * 32, "metadata.xlsx"),
+            gnu % ("a" * 32, "1234_R1.fastq.gz"),
+            bsd % ("unexpected.txt", "d" * 32),
+        ],
+    )
+    no_match = []
+    skipped = []
+    assert (
+        list(stream_md5file(fname, match, skip, no_match.append, skipped.append))
+        == expected[:1]
+    )
+    assert (no_match, skipped) == (["unexpected.txt"], ["metadata.xlsx"])
+    # without callbacks, other lines are passed over
+    assert list(stream_md5file(fname, match, None)) == expected[:1]
+
+    fname = write_manifest(tmp_path / "bad.md5", [gnu % ("a" * 32, "x"), "oops"])
+    with pytest.raises(Exception, match="Could not parse MD5 line: oops"):
+        list(stream_md5file(fname, match, skip))
+
+
+def test_parse_md5file_streaming(tmp_path, monkeypatch):
+    meta = BaseMetadata(logger)
+    meta.md5 = {
+        "match": [re.compile(r"^(?P<sample_id>\d+)_R[12]\.fastq\.gz$")],
+        "skip": [re.compile(r"^.*\.xlsx$")],
+    }
+    fname = write_manifest(
+        tmp_path / "checksums.md5",
+        [
+            "%s  1234_R1.fastq.gz" % ("a" * 32),
+            "%s  metadata.xlsx" % ("c" * 32),
+            "%s  unexpected.txt" % ("d" * 32),
+        ],
+    )
+    handler = logging.handlers.BufferingHandler(100)
+    logger.addHandler(handler)
+    try:
+        indexed = list(meta.parse_md5file(fname))
+        # above the size limit, the manifest is streamed rather than indexed
+        monkeypatch.setattr("bpaingest.libs.md5_index.MD5_INDEX_MAX_SIZE", 0)
+        monkeypatch.setattr("bpaingest.abstract.parse_manifest", None)
+        streamed = list(meta.parse_md5file(fname))
+    finally:
+        logger.removeHandler(handler)
+    assert (
+        indexed == streamed == [("1234_R1.fastq.gz", "a" * 32, {"sample_id": "1234"})]
+    )
+    assert [t.getMessage() for t in handler.buffer] == [
+        "No match for filename: `unexpected.txt'"
+    ] * 2
+
+
+def test_parse_manifest(tmp_path, monkeypatch):
+    match = [re.compile(r"^(?P<sample_id>\d+)_(?P<flow_id>\w{5})_R[12]\.fastq\.gz$")]
+    skip = [re.compile(r"^.*\.xlsx$")]
+    manifests = []
+    for ticket, flow_id in (("BPAM-1", "AAAAA"), ("BPAM-2", "BBBBB")):
+        fname = str(tmp_path / ("%s_%s_checksums.md5" % (ticket, flow_id)))
+        with open(fname, "w") as fd:
+            fd.write("%s  1234_%s_R1.fastq.gz\n" % ("a" * 32, flow_id))
+            fd.write("MD5 (1234_%s_R2.fastq.gz) = %s\n" % (flow_id, "b" * 32))
+            fd.write("%s  metadata.xlsx\n" % ("c" * 32))
+            fd.write("%s  unexpected.txt\n" % ("d" * 32))
+        manifests.append(fname)
+
+    parsed = parse_manifest(manifests[0], match, skip)
+    assert [(t.path, t.md5) for t in parsed.records] == [
+        ("1234_AAAAA_R1.fastq.gz", "a" * 32),
+        ("1234_AAAAA_R2.fastq.gz", "b" * 32),
+    ]
+    assert parsed.records[0].groups == {"sample_id": "1234", "flow_id": "AAAAA"}
+    assert parsed.records[0].manifest == manifests[0]
+    assert parsed.no_match == ["unexpected.txt"]
+    assert parsed.skipped == ["metadata.xlsx"]
+
+    # each manifest is parsed once, for a given set of patterns
+    monkeypatch.setattr("bpaingest.libs.md5_index.stream_md5file", None)
+    assert parse_manifest(manifests[0], match, skip) is parsed
+
+    # the least recently used manifests are dropped once the cache is full
+    monkeypatch.setattr("bpaingest.libs.md5_index._manifests", OrderedDict())
+    monkeypatch.setattr("bpaingest.libs.md5_index.MD5_INDEX_MAX_RECORDS", 2)
+    monkeypatch.setattr("bpaingest.libs.md5_index.stream_md5file", stream_md5file)
+    for fname in manifests:
+        parse_manifest(fname, match, skip)
+    assert [k[0] for k in md5_index._manifests] == manifests[1:]
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def send_response(self, code, message=None):
+        self.server.responses.append((self.path, code))
+        super().send_response(code, message)
+
+    def do_GET(self):
+        if self.server.failures > 0:
+            self.server.failures -= 1
+            self.send_error(503)
+            return
+        super().do_GET()
+
+
+class CKANDownloadHandler(QuietHandler):
+    """
+    answers HEAD of a CKAN download link with a redirect to S3, and ranged GETs
+    on S3 with the first byte, as CKAN and S3 do
+    """
+
+    def do_HEAD(self):
+        self.send_response(302)
+        self.send_header(
+            "Location",
+            "http://%s:%d/s3%s" % (*self.server.server_address, self.path),
+        )
+        self.end_headers()
+
+    def do_GET(self):
+        fname = os.path.join(self.directory, os.path.basename(self.path))
+        size = os.path.getsize(fname)
+        assert self.headers["Range"] == "bytes=0-0"
+        self.send_response(206)
+        self.send_header("Content-Range", "bytes 0-0/%d" % (size))
+        self.send_header("Content-Length", "1")
+        self.send_header("ETag", '"etag-%d"' % (size))
+        self.end_headers()
+        with open(fname, "rb") as fd:
+            self.wfile.write(fd.read(1))
+
+
+@contextmanager
+def serve_directory(path, responses=None, failures=0, handler=QuietHandler):
+    """
+    serve `path` over HTTP on localhost, yielding the base URL. the first
+    `failures` GET requests are answered with a 503 error.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(handler, directory=path))
+    server.responses = responses if responses is not None else []
+    server.failures = failures
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield "http://127.0.0.1:%d/" % (server.server_address[1])
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def make_archive(root, tickets):
+    for facility, ticket, fname in tickets:
+        ticket_dir = os.path.join(root, facility, ticket)
+        os.makedirs(ticket_dir, exist_ok=True)
+        with open(os.path.join(ticket_dir, fname), "w") as fd:
+            fd.write(fname)
+
+
+def test_fetch_metadata_from_folder(tmp_path):
+    archive = str(tmp_path / "archive")
+    target = str(tmp_path / "target")
+    tickets = [
+        ("AGRF", "ticket-%d" % (i), "sheet_%d.xlsx" % (i)) for i in range(20)
+    ] + [("UNSW", "ticket-x", "checksums.md5"), ("UNSW", "ticket-x", "data.fastq.gz")]
+    make_archive(archive, tickets)
+    metadata_info = {}
+    with serve_directory(archive) as url:
+        fetcher = Fetcher(logger, target, url, concurrency=4)
+        fetcher.fetch_metadata_from_folder(None, metadata_info, ["facility", "ticket"])
+    assert sorted(metadata_info) == sorted(t[2] for t in tickets[:-1])
+    assert metadata_info["checksums.md5"] == {
+        "facility": "UNSW",
+        "ticket": "ticket-x",
+        "base_url": url + "UNSW/ticket-x/",
+    }
+    for _, _, fname in tickets[:-1]:
+        with open(os.path.join(target, fname)) as fd:
+            assert fd.read() == fname
+
+
+def test_fetch_metadata_from_folder_non_unique(tmp_path):
+    archive = str(tmp_path / "archive")
+    make_archive(
+        archive, [("AGRF", "ticket-1", "a.xlsx"), ("AGRF", "ticket-2", "a.xlsx")]
+    )
+    with serve_directory(archive) as url:
+        fetcher = Fetcher(logger, str(tmp_path / "target"), url)
+        with pytest.raises(DownloadException):
+            fetcher.fetch_metadata_from_folder(
+                None, {}, ["facility", "ticket"], download=False
+            )
+
+
+def test_fetch_metadata_mirror(tmp_path):
+    archive = str(tmp_path / "archive")
+    target = str(tmp_path / "target")
+    make_archive(
+        archive, [("AGRF", "ticket-1", "a.xlsx"), ("AGRF", "ticket-2", "b.xlsx")]
+    )
+    for fname in ("AGRF/ticket-1/a.xlsx", "AGRF/ticket-2/b.xlsx"):
+        os.utime(os.path.join(archive, fname), (1500000000, 1500000000))
+
+    responses = []
+
+    def fetch():
+        del responses[:]
+        fetcher = Fetcher(logger, target, url, mirror=True)
+        fetcher.fetch_metadata_from_folder(None, {}, ["facility", "ticket"])
+        fetcher.manifest.save()
+        return sorted((p, c) for (p, c) in responses if not p.endswith("/"))
+
+    a, b = "/AGRF/ticket-1/a.xlsx", "/AGRF/ticket-2/b.xlsx"
+    with serve_directory(archive, responses) as url:
+        assert fetch() == [(a, 200), (b, 200)]
+        assert fetch() == [(a, 304), (b, 304)]
+        with open(os.path.join(archive, "AGRF/ticket-2/b.xlsx"), "w") as fd:
+            fd.write("changed")
+        assert fetch() == [(a, 304), (b, 200)]
+        with open(os.path.join(target, "b.xlsx")) as fd:
+            assert fd.read() == "changed"
+        # a locally damaged file is not trusted
+        with open(os.path.join(target, "a.xlsx"), "w") as fd:
+            fd.write("damaged")
+        assert fetch() == [(a, 200), (b, 304)]
+        # a same-sized change is caught by the hash, once the mtime differs
+        with open(os.path.join(target, "a.xlsx"), "w") as fd:
+            fd.write("A.xlsx")
+        os.utime(os.path.join(target, "a.xlsx"), (1500000000, 1500000000))
+        assert fetch() == [(a, 200), (b, 304)]
+        # a touched but unchanged file is still trusted
+        os.utime(os.path.join(target, "a.xlsx"), (1500000000, 1500000000))
+        assert fetch() == [(a, 304), (b, 304)]
+    assert Manifest(target).prune(["a.xlsx"]) == ["b.xlsx"]
+    assert not os.path.exists(os.path.join(target, "b.xlsx"))
+
+
+def test_download_file(tmp_path):
+    archive = tmp_path / "archive"
+    archive.mkdir()
+    data = os.urandom(100000)
+    (archive / "a.xlsx").write_bytes(data)
+    path = str(tmp_path / "a.xlsx")
+
+    with serve_directory(str(archive)) as url, requests.Session() as session:
+        stats = download_file(
+            session, url + "a.xlsx", path, logger, expected_size=len(data)
+        )
+        assert stats.size == stats.transferred == len(data)
+        with open(path, "rb") as fd:
+            assert fd.read() == data
+        assert not os.path.exists(path + ".part")
+        with pytest.raises(DownloadException):
+            download_file(session, url + "a.xlsx", path, logger, expected_size=1)
+        assert not os.path.exists(path + ".part")
+
+
+def test_http_retries(tmp_path):
+    (tmp_path / "a.txt").write_text("hello")
+    reset_host_stats()
+    configure_http(retries=2)
+    try:
+        with serve_directory(str(tmp_path), failures=1) as url:
+            response = make_session().get(url + "a.txt")
+    finally:
+        configure_http()
+    assert response.status_code == 200
+    assert response.text == "hello"
+    stats = host_stats()[urlparse(url).netloc]
+    assert stats["requests"] == 1
+    assert stats["retries"] == 1
+    assert stats["errors"] == 0
+
+
+APACHE_TABLE_LISTING = b"""<html><body><table>
+<tr><th valign="top"><img src="/icons/blank.gif" alt="[ICO]"></th><th><a href="?C=N;O=D">Name</a></th><th><a href="?C=M;O=A">Last modified</a></th><th><a href="?C=S;O=A">Size</a></th></tr>
+<tr><td valign="top"><img src="/icons/back.gif" alt="[PARENTDIR]"></td><td><a href="/bpa/">Parent Directory</a></td><td>&nbsp;</td><td align="right">  - </td></tr>
+<tr><td valign="top"><img src="/icons/folder.gif" alt="[DIR]"></td><td><a href="AGRF/">AGRF/</a></td><td align="right">2020-04-01 10:15  </td><td align="right">  - </td></tr>
+<tr><td valign="top"><img src="/icons/unknown.gif" alt="[   ]"></td><td><a href="a.fastq.gz">a.fastq.gz</a></td><td align="right">2020-04-02 11:16  </td><td align="right">1.2G</td></tr>
+<tr><td valign="top"><img src="/icons/unknown.gif" alt="[   ]"></td><td><a href="b.md5">b.md5</a></td><td align="right">2020-04-03 12:17  </td><td align="right">1234</td></tr>
+</table></body></html>"""
+
+NGINX_LISTING = b"""<html><body><h1>Index of /bpa/</h1><hr><pre><a href="../">../</a>
+<a href="AGRF/">AGRF/</a>                                              01-Apr-2020 10:15       -
+<a href="a.fastq.gz">a.fastq.gz</a>                                   02-Apr-2020 11:16  1288490188
+<a href="b.md5">b.md5</a>                                             03-Apr-2020 12:17        1234
+</pre><hr></body></html>"""
+
+
+def test_parse_listing_apache():
+    url = "https://example.com/bpa/"
+    entries = parse_listing(url, APACHE_TABLE_LISTING)
+    by_name = {t.name: t for t in entries}
+    assert by_name["AGRF/"].url == url + "AGRF/"
+    assert by_name["a.fastq.gz"].size is None
+    assert by_name["a.fastq.gz"].modified == "2020-04-02T11:16:00"
+    assert by_name["b.md5"] == ListingEntry(
+        "b.md5", url + "b.md5", 1234, "2020-04-03T12:17:00"
+    )
+
+
+def test_parse_listing_nginx():
+    url = "https://example.com/bpa/"
+    entries = parse_listing(url, NGINX_LISTING)
+    assert [t.name for t in entries] == ["../", "AGRF/", "a.fastq.gz", "b.md5"]
+    index = ListingIndex()
+    index.add(entries)
+    assert len(index) == 2
+    assert index.size(url + "a.fastq.gz") == 1288490188
+    assert index.get(url + "b.md5").modified == "2020-04-03T12:17:00"
+    assert index.size(url + "AGRF/") is None
+    assert index.live_size(url + "a.fastq.gz") == 1288490188
+    # sizes from a cached listing aren't trusted to be current
+    cached = ListingIndex()
+    cached.add(entries, live=False)
+    assert cached.size(url + "a.fastq.gz") == 1288490188
+    assert cached.live_size(url + "a.fastq.gz") is None
+
+
+def test_parse_listing_markup():
+    url = "https://example.com/bpa/"
+    content = b"""<PRE><A HREF='a&amp;b.md5'>a&amp;b.md5</A>  03-Apr-2020 12:17  12
+<a class="x" href=c.xlsx>c.xlsx</a> <a href="?C=M;O=A">sort</a>
+<a href="https://other.example.com/d.xlsx">d.xlsx</a></PRE>"""
+    entries = parse_listing(url, content)
+    assert entries == [
+        ListingEntry("a&b.md5", url + "a&b.md5", 12, "2020-04-03T12:17:00"),
+        ListingEntry("c.xlsx", url + "c.xlsx", None, None),
+        ListingEntry("?C=M;O=A", url + "?C=M;O=A", None, None),
+        ListingEntry(
+            "https://other.example.com/d.xlsx",
+            "https://other.example.com/d.xlsx",
+            None,
+            None,
+        ),
+    ]
+
+
+def test_listing_cache(tmp_path):
+    archive = str(tmp_path / "archive")
+    make_archive(archive, [("AGRF", "ticket-1", "a.xlsx")])
+    cache = ListingCache(str(tmp_path / "cache"), ttl=3600)
+    responses = []
+    with serve_directory(archive, responses) as url:
+        for _ in range(2):
+            metadata_info = {}
+            fetcher = Fetcher(
+                logger, str(tmp_path / "target"), url, listing_cache=cache
+            )
+            fetcher.fetch_metadata_from_folder(
+                None, metadata_info, ["facility", "ticket"], download=False
+            )
+            assert metadata_info["a.xlsx"]["base_url"] == url + "AGRF/ticket-1/"
+        # the second crawl is served entirely from the cache
+        assert len(responses) == 3
+        assert (cache.hits, cache.misses) == (3, 3)
+
+        # a file which has changed since it was listed is still fetched, and the
+        # stale listing is dropped
+        folder = url + "AGRF/ticket-1/"
+        cache.put(folder, [ListingEntry("a.xlsx", folder + "a.xlsx", 999, None)])
+        fetcher = Fetcher(logger, str(tmp_path / "target"), url, listing_cache=cache)
+        fetcher.fetch_metadata_from_folder(None, {}, ["facility", "ticket"])
+        assert (tmp_path / "target" / "a.xlsx").read_text() == "a.xlsx"
+        assert cache.get(folder) is None
+    cache.invalidate()
+    assert cache.get(url) is None
+
+
+def test_link_folder(tmp_path):
+    source = tmp_path / "store"
+    target = tmp_path / "download"
+    source.mkdir()
+    target.mkdir()
+    for name in ("a.xlsx", "b.xlsx"):
+        (source / name).write_text(name)
+    (target / "mine.txt").write_text("not ours")
+    link_folder(str(source), str(target), ["a.xlsx", "b.xlsx"])
+    assert (target / "b.xlsx").read_text() == "b.xlsx"
+    # only files we linked are removed when they drop out
+    link_folder(str(source), str(target), ["a.xlsx"])
+    assert sorted(t.name for t in target.iterdir() if not t.name.startswith(".")) == [
+        "a.xlsx",
+        "mine.txt",
+    ]
+
+
+def test_contextual_store_for_mirror(tmp_path):
+    store = ContextualStore.for_download(str(tmp_path / "download") + "/", True)
+    assert store.root == str(tmp_path / "download" / ".bpaingest-contextual")
+    assert ContextualStore.for_download(str(tmp_path / "download"), True) is store
+
+
+def make_workbook(path, sheets):
+    workbook = openpyxl.Workbook()
+    workbook.remove(workbook.active)
+    for name, rows in sheets.items():
+        sheet = workbook.create_sheet(name)
+        for row in rows:
+            sheet.append(row)
+    workbook.save(path)
+
+
+def test_workbook_cache(tmp_path, monkeypatch):
+    path = str(tmp_path / "contextual.xlsx")
+    make_workbook(
+        path,
+        {
+            "Soil": [["Sample ID", "Depth"], ["102.100.100/1", 0.1]],
+            "Marine": [["Sample ID", "Depth"], ["102.100.100/2", 5]],
+        },
+    )
+    cache = WorkbookCache()
+    monkeypatch.setattr("bpaingest.libs.excel_wrapper.workbook_cache", cache)
+    field_spec = [
+        make_field_definition("sample_id", "sample id"),
+        make_field_definition("depth", "depth"),
+    ]
+    rows = []
+    for sheet_name in ("Soil", "Marine"):
+        wrapper = ExcelWrapper(
+            logger, field_spec, path, sheet_name=sheet_name, header_length=1
+        )
+        rows += [(t.sample_id, t.depth) for t in wrapper.get_all()]
+    assert rows == [("102.100.100/1", 0.1), ("102.100.100/2", 5.0)]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # a changed workbook is opened again
+    make_workbook(path, {"Soil": [["Sample ID", "Depth"], ["102.100.100/3", 1]]})
+    os.utime(path, ns=(0, 0))
+    wrapper = ExcelWrapper(logger, field_spec, path, sheet_name="Soil", header_length=1)
+    assert [t.sample_id for t in wrapper.get_all()] == ["102.100.100/3"]
+    assert cache.misses == 2
+    assert len(cache._workbooks) == 1
+
+    # the cache is bounded, but always holds the workbook last opened
+    other_path = str(tmp_path / "other.xlsx")
+    make_workbook(other_path, {"Soil": [["Sample ID", "Depth"]]})
+    cache.max_cells = 1
+    ExcelWrapper(logger, field_spec, other_path)
+    assert [k[0] for k in cache._workbooks] == [other_path]
+    assert list(cache._key_locks) == list(cache._workbooks)
+
+
+def test_excel_backends(tmp_path):
+    path = str(tmp_path / "samples.xlsx")
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = "Samples"
+    sheet.append(["Sample ID", "Depth", "Count", "Collected", "Time", "Flag", "Site"])
+    sheet.append(
+        [
+            "102.100.100/1",
+            0.25,
+            3,
+            datetime.datetime(2020, 4, 2, 11, 16),
+            datetime.time(9, 30),
+            True,
+            "Bay",
+        ]
+    )
+    sheet.append(["102.100.100/2", None, 4, datetime.date(2019, 1, 31)])
+    sheet.append(["102.100.100/3", "=1/0"])
+    sheet["B4"].value = "#DIV/0!"
+    sheet["B4"].data_type = "e"
+    sheet.merge_cells("G2:G4")
+    workbook.save(path)
+    # as written by some other tools, the stored dimension is stale
+    with zipfile.ZipFile(path) as archive:
+        parts = {t: archive.read(t) for t in archive.namelist()}
+    sheet_xml = parts["xl/worksheets/sheet1.xml"]
+    assert b'<dimension ref="A1:G4" />' in sheet_xml
+    parts["xl/worksheets/sheet1.xml"] = sheet_xml.replace(b"A1:G4", b"A1:B2")
+    with zipfile.ZipFile(path, "w") as archive:
+        for name, data in parts.items():
+            archive.writestr(name, data)
+
+    def read(backend):
+        wrapper = ExcelWrapper(
+            logger,
+            [make_field_definition("sample_id", "sample id")],
+            path,
+            header_length=1,
+            backend=backend,
+        )
+        assert wrapper.sheet_name == "Samples"
+        return [[(c.ctype, c.value) for c in row] for row in wrapper._get_rows()]
+
+    results = {backend: read(backend) for backend in EXCEL_BACKENDS}
+    assert results["openpyxl"] == results["xlrd"]
+    assert results["xlrd"][2][6] == (1, "Bay")
+
+    # the openpyxl workbook is closed once every row has been read
+    wrapper = ExcelWrapper(
+        logger,
+        [make_field_definition("sample_id", "sample id")],
+        path,
+        header_length=1,
+        backend="openpyxl",
+    )
+    assert len(list(wrapper.get_all())) == 3
+    with pytest.raises(ValueError):
+        wrapper.backend.row_values(0)
+
+
+def test_excel_header_resolution(tmp_path):
+    path = str(tmp_path / "samples.xlsx")
+    make_workbook(
+        path,
+        {
+            "S": [
+                ["Sample ID", "Depth (m)", "Note 1", "Note 2", "note 3", "Extra"]
+                + ["Internal", "Depth (m)", "", "Lat", 5],
+                ["a", 1, "x", "y", "z", "e", "i", 2, "", 3, 4],
+            ]
+        },
+    )
+    field_spec = [
+        make_field_definition("sample_id", ("bpa id", "sample id")),
+        make_field_definition("depth", "depth (m)"),
+        make_field_definition("note", re.compile(r"^note \d"), find_all=True),
+        make_field_definition("note3", "note 3"),
+        make_field_definition("missing", "not there"),
+        make_field_definition("optional", "also not there", optional=True),
+        make_field_definition("latitude", re.compile(r"^lat")),
+        make_skip_column("internal"),
+        make_skip_column(re.compile(r"^ext"), skip_all=True),
+    ]
+    for _ in range(2):
+        wrapper = ExcelWrapper(logger, field_spec, path, header_length=1)
+        assert wrapper.header == [
+            "sample id",
+            "depth (m)",
+            "note 1",
+            "note2",
+            "note3",
+            "extra",
+            "internal",
+            "depth (m)",
+            "",
+            "lat",
+            "5.0",
+        ]
+        assert wrapper.name_to_column_map == {
+            "sample_id": 0,
+            "depth": 1,
+            "note": 2,
+            "note2": 3,
+            "note3": None,
+            "missing": None,
+            "optional": None,
+            "latitude": 9,
+        }
+        assert wrapper.missing_headers == ["note 3", "not there", "also not there"]
+        assert wrapper.get_errors() == [
+            "header is not a string: <class 'float'> `5.0'",
+            "E3001: Column `note 3' not found in `samples.xlsx' `S'",
+            "E3001: Column `not there' not found in `samples.xlsx' `S'",
+            "E3002: Column `note3` in `samples.xlsx` `S` is not mapped to an output field in the codebase.",
+            "E3002: Column `depth (m)` in `samples.xlsx` `S` is not mapped to an output field in the codebase.",
+            "E3002: Column `5.0` in `samples.xlsx` `S` is not mapped to an output field in the codebase.",
+        ]
+    assert len(compile_field_spec(field_spec)._resolved) == 1
+
+
+def test_excel_coercion_memo(tmp_path):
+    path = str(tmp_path / "samples.xlsx")
+    make_workbook(
+        path, {"S": [["Method", "Sites"]] + [["Grab", "a, b"], ["Core", "a, b"]] * 3}
+    )
+    calls = []
+
+    def count_calls(logger, val):
+        calls.append(val)
+        return val.upper()
+
+    def to_list(logger, val):
+        return val.split(", ")
+
+    field_spec = [
+        make_field_definition("method", "method", coerce=count_calls),
+        make_field_definition("sites", "sites", coerce=to_list),
+    ]
+    wrapper = ExcelWrapper(logger, field_spec, path, header_length=1)
+    rows = list(wrapper.get_all())
+    assert [t.method for t in rows] == ["GRAB", "CORE"] * 3
+    assert calls == ["Grab", "Core"]
+    # mutable results are not shared between cells
+    rows[0].sites.append("c")
+    assert [t.sites for t in rows[1:]] == [["a", "b"]] * 5
+
+
+def test_parse_cache(tmp_path, monkeypatch, caplog):
+    cache = ParseCache(str(tmp_path / "cache"))
+    monkeypatch.setattr("bpaingest.libs.excel_wrapper.get_parse_cache", lambda: cache)
+    path = str(tmp_path / "samples.xlsx")
+    make_workbook(
+        path, {"S": [["Sample ID", "Depth"], ["1", "deep"], ["2", 3], ["3", "deep"]]}
+    )
+    parse_logger = logging.getLogger("test_parse_cache")
+
+    def get_depth(logger, val):
+        if isinstance(val, str):
+            logger.warning("bad depth: %s", val)
+            return None
+        return val
+
+    field_spec = [
+        make_field_definition("sample_id", "sample id"),
+        make_field_definition("depth", "depth", coerce=get_depth),
+        make_field_definition("missing", "missing"),
+    ]
+
+    def parse():
+        caplog.clear()
+        wrapper = ExcelWrapper(
+            parse_logger, field_spec, path, header_length=1, additional_context={"a": 1}
+        )
+        rows = list(wrapper.get_all())
+        messages = [r.getMessage() for r in caplog.records]
+        return wrapper, (rows, wrapper.get_errors(), messages)
+
+    with caplog.at_level(logging.INFO, logger="test_parse_cache"):
+        wrapper, parsed = parse()
+        assert wrapper.backend is not None
+        assert parsed[0][1] == ("2", 3.0, None, 1)
+        assert parsed[1] == ["E3001: Column `missing' not found in `samples.xlsx' `S'"]
+        assert parsed[2] == ["bad depth: deep"]
+        wrapper, cached = parse()
+        assert wrapper.backend is None
+        assert cached == parsed
+        assert (cache.hits, cache.misses) == (1, 1)
+
+        # as is any change to the source of the package
+        monkeypatch.setattr(
+            "bpaingest.libs.parse_cache.package_fingerprint", lambda: "changed"
+        )
+        wrapper, _ = parse()
+        assert wrapper.backend is not None
+
+        # any change to the field spec is a different parse
+        field_spec[2] = make_field_definition("missing", "missing", optional=True)
+        wrapper, parsed = parse()
+        assert wrapper.backend is not None
+        assert parsed[1] == []
+
+
+def coerce_depth(logger, val):
+    if isinstance(val, str):
+        logger.warning("bad depth: %s", val)
+        return None
+    return val
+
+
+class SampleSheetMetadata:
+    spreadsheet = {
+        "fields": [
+            make_field_definition("sample_id", "sample id"),
+            make_field_definition("depth", "depth", coerce=coerce_depth),
+        ],
+        "options": {"header_length": 1},
+    }
+
+
+def test_parse_sheets(tmp_path, caplog):
+    jobs = []
+    for i in (3, 1, 2):
+        path = str(tmp_path / ("samples_%d.xlsx" % (i)))
+        make_workbook(path, {"S": [["Sample ID", "Depth"], [str(i), i], ["x", "deep"]]})
+        jobs.append((path, {"n": i}))
+    parse_logger = logging.getLogger("test_parse_sheets")
+
+    def parse(workers):
+        configure_parse_workers(workers)
+        caplog.clear()
+        try:
+            parsed = [
+                (os.path.basename(fname), rows)
+                for fname, rows in parse_sheets(SampleSheetMetadata, jobs, parse_logger)
+            ]
+        finally:
+            configure_parse_workers(DEFAULT_PARSE_WORKERS)
+        messages = [
+            r.getMessage() for r in caplog.records if r.name == "test_parse_sheets"
+        ]
+        return parsed, messages
+
+    with caplog.at_level(logging.INFO, logger="test_parse_sheets"):
+        serial = parse(1)
+        assert [fname for fname, _ in serial[0]] == [
+            "samples_1.xlsx",
+            "samples_2.xlsx",
+            "samples_3.xlsx",
+        ]
+        assert serial[0][1][1][0].sample_id == "2"
+        assert serial[0][1][1][0].n == 2
+        assert serial[1] == ["bad depth: deep"] * 3
+        assert parse(2) == serial
+
+
+def test_ordered_map():
+    map_logger = make_logger("bpaingest.libs.test_ordered_map")
+    release = threading.Event()
+
+    def fn(n):
+        # later items finish first
+        if n == 0:
+            release.wait(5)
+        if n == 3:
+            release.set()
+            raise ValueError("three")
+        map_logger.info("item %d" % n)
+        return n * n
+
+    handler = logging.handlers.BufferingHandler(100)
+    map_logger.addHandler(handler)
+    try:
+        results = list(ordered_map(fn, range(6), 4, [map_logger]))
+    finally:
+        map_logger.removeHandler(handler)
+    assert [(item, result) for item, result, _ in results] == [
+        (0, 0),
+        (1, 1),
+        (2, 4),
+        (3, None),
+        (4, 16),
+        (5, 25),
+    ]
+    assert [str(e) for _, _, e in results if e is not None] == ["three"]
+    # logged in item order
+    assert [r.getMessage() for r in handler.buffer] == [
+        "item %d" % n for n in (0, 1, 2, 4, 5)
+    ]
+    assert list(ordered_map(fn, [1, 2], 1)) == [(1, 1, None), (2, 4, None)]
+
+    # only a few items per thread are submitted ahead of the caller
+    started = []
+    results = ordered_map(started.append, range(100), 4)
+    next(results)
+    assert len(started) <= 4 * 2 + 1
+    assert len(list(results)) == 99
+    assert sorted(started) == list(range(100))
+
+
+def test_s3_inventory():
+    client = boto3.client(
+        "s3",
+        region_name="ap-southeast-2",
+        aws_access_key_id="test",
+        aws_secret_access_key="test",
+    )
+    stubber = Stubber(client)
+    listing = {"Bucket": "bpa-ckan-prod", "Prefix": "prodenv/resources/"}
+    stubber.add_response(
+        "list_objects_v2",
+        {
+            "Contents": [
+                {
+                    "Key": "prodenv/resources/r1/a_R1.fastq.gz",
+                    "Size": 10,
+                    "ETag": '"e1"',
+                },
+                {"Key": "prodenv/resources/r1/extra/stray", "Size": 1, "ETag": '"e"'},
+            ],
+            "IsTruncated": True,
+            "NextContinuationToken": "next",
+        },
+        listing,
+    )
+    stubber.add_response(
+        "list_objects_v2",
+        {
+            "Contents": [
+                {"Key": "prodenv/resources/r2/b c.xlsx", "Size": 20, "ETag": '"e2"'}
+            ],
+            "IsTruncated": False,
+        },
+        dict(listing, ContinuationToken="next"),
+    )
+    with stubber:
+        inventory = S3Inventory.from_destination(
+            "bpa-ckan-prod/prodenv", client=client
+        ).load()
+    stubber.assert_no_pending_responses()
+
+    assert inventory.pages == 2
+    assert len(inventory) == 2
+    url = "https://data.bioplatforms.com/dataset/p1/resource/%s/download/%s"
+    entry = inventory.get(url % ("r2", "b%20c.xlsx"))
+    assert (entry.size, entry.etag) == (20, '"e2"')
+    assert inventory.s3_url(entry) == "s3://bpa-ckan-prod/prodenv/resources/r2/b c.xlsx"
+    assert inventory.get(url % ("r3", "a_R1.fastq.gz")) is None
+    assert inventory.get("https://downloads.bioplatforms.com/amd/a_R1.fastq.gz") is None
+    assert (inventory.hits, inventory.misses) == (1, 2)
+    assert resource_key(url % ("r1", "a_R1.fastq.gz")) == ("r1", "a_R1.fastq.gz")
+
+
+VERIFIED_AT = "2020-01-01T00:00:00"
+
+
+def test_verification_cache(tmp_path):
+    path = str(tmp_path / "cache" / "verification.sqlite")
+    resource = {"id": "r1", "url": "https://ckan/r1/download/a.gz", "md5": "m1"}
+    verified_at = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+    with VerificationCache(path, datetime.timedelta(days=7)) as cache:
+        assert not cache.is_verified(resource)
+        cache.record(resource, 10, 10, '"e"', VERIFIED_AT)
+
+    with VerificationCache(path, datetime.timedelta(days=7)) as cache:
+        now = verified_at + datetime.timedelta(days=1)
+        assert cache.is_verified(resource, now=now)
+        assert not cache.is_verified(dict(resource, md5="m2"), now=now)
+        assert not cache.is_verified(dict(resource, url="https://ckan/b"), now=now)
+        assert not cache.is_verified(resource, now=now + datetime.timedelta(days=7))
+        assert (cache.hits, cache.misses) == (1, 3)
+        cache.forget("r1")
+        assert not cache.is_verified(resource, now=now)
+        # the verification recorded in CKAN isn't trusted by default
+        ckan_verified = dict(resource, id="r2", s3_etag_verified_at=VERIFIED_AT)
+        assert not cache.is_verified(ckan_verified, now=now)
+
+    with VerificationCache(path, datetime.timedelta(days=7), trust_ckan=True) as cache:
+        # failing the check overrides the verification recorded in CKAN
+        assert not cache.is_verified(dict(ckan_verified, id="r1"), now=now)
+        # for resources not in the cache, a recent verification in CKAN is trusted
+        assert cache.is_verified(ckan_verified, now=now)
+        assert not cache.is_verified(
+            ckan_verified, now=now + datetime.timedelta(days=7)
+        )
+        assert not cache.is_verified(dict(ckan_verified, s3_etag_verified_at=""))
+        assert (cache.hits, cache.ckan_hits, cache.misses) == (1, 1, 3)
+
+
+def test_ckan_archive_probe(tmp_path):
+    with open(tmp_path / "a_R1.fastq.gz", "w") as fd:
+        fd.write("x" * 10)
+    responses = []
+    with serve_directory(
+        str(tmp_path), responses, handler=CKANDownloadHandler
+    ) as base_url:
+        ckan = SimpleNamespace(address=base_url, apikey="key")
+        info = CKANArchiveInfo(ckan)
+        url = base_url + "dataset/p1/resource/r1/download/a_R1.fastq.gz"
+        assert (
+            check_resource(
+                info, StubApacheArchiveInfo(None), url, "legacy", ["etag-10"]
+            )
+            is None
+        )
+        # one request to resolve the download link, and one ranged GET on S3
+        assert responses == [
+            ("/dataset/p1/resource/r1/download/a_R1.fastq.gz", 302),
+            ("/s3/dataset/p1/resource/r1/download/a_R1.fastq.gz", 206),
+        ]
+        assert info.get_size(url) == 10
+        assert info.get_etag(url) == '"etag-10"'
+        assert info.probe(url).resolved_url == (
+            base_url + "s3/dataset/p1/resource/r1/download/a_R1.fastq.gz"
+        )
+    assert len(responses) == 2
+
+
+class StubCKANArchiveInfo:
+    "probes resources from `sizes`, with the first resource finishing last"
+
+    sizes = {}
+    release = None
+
+    def __init__(self, ckan, inventory=None, pool_size=None):
+        pass
+
+    def on_ckan(self, url):
+        return url.startswith("https://ckan/")
+
+    def probe(self, url):
+        if url.endswith("/r0"):
+            self.release.wait(5)
+        elif url.endswith("/r3"):
+            self.release.set()
+        if url.endswith("/broken"):
+            raise ValueError("probe failed")
+        return ResourceProbe(self.sizes[url], '"e"', url)
+
+
+class StubApacheArchiveInfo:
+    def __init__(self, auth, listing_index=None, pool_size=None):
+        pass
+
+    def get_size(self, url):
+        return 10
+
+
+def test_check_resources_order(monkeypatch):
+    monkeypatch.setattr("bpaingest.sync.CKANArchiveInfo", StubCKANArchiveInfo)
+    monkeypatch.setattr("bpaingest.sync.ApacheArchiveInfo", StubApacheArchiveInfo)
+    resources = []
+    for n, (host, size) in enumerate(
+        [("ckan", 10), ("ckan", 11), ("elsewhere", 10)] + [("ckan", 10)] * 3
+    ):
+        url = "https://%s/r%d" % (host, n)
+        StubCKANArchiveInfo.sizes[url] = size
+        obj = {"id": "r%d" % n, "url": url}
+        obj.update((t, "e") for t in S3_HASH_FIELDS)
+        resources.append(obj)
+    legacy_urls = {t["id"]: "https://legacy/" + t["id"] for t in resources}
+
+    def check(concurrency):
+        StubCKANArchiveInfo.release = threading.Event()
+        if concurrency == 1:
+            StubCKANArchiveInfo.release.set()
+        return check_resources(None, resources, legacy_urls, None, concurrency)
+
+    serial = check(1)
+    assert [(t["id"], url) for t, url in serial] == [
+        ("r1", "https://legacy/r1"),
+        ("r2", "https://legacy/r2"),
+    ]
+    assert check(4) == serial
+
+    # an exception in a worker isn't swallowed
+    resources[4]["url"] = "https://ckan/broken"
+    with pytest.raises(ValueError, match="probe failed"):
+        check(4)
+
+
+def test_check_resources_verified(tmp_path, monkeypatch):
+    monkeypatch.setattr("bpaingest.sync.CKANArchiveInfo", StubCKANArchiveInfo)
+    monkeypatch.setattr("bpaingest.sync.ApacheArchiveInfo", StubApacheArchiveInfo)
+    StubCKANArchiveInfo.release = threading.Event()
+    StubCKANArchiveInfo.release.set()
+    resources = []
+    for n, (package_id, size) in enumerate(
+        [("p1", 10), ("p1", 11), ("p2", 10), ("p2", 10), ("p3", 10)]
+    ):
+        url = "https://ckan/r%d" % n
+        StubCKANArchiveInfo.sizes[url] = size
+        obj = {"id": "r%d" % n, "url": url, "md5": "m%d" % n, "package_id": package_id}
+        obj.update((t, "e") for t in S3_HASH_FIELDS)
+        resources.append(obj)
+    legacy_urls = {t["id"]: "https://legacy/" + t["id"] for t in resources}
+    # verified in CKAN long ago, and fails its check
+    resources[1]["s3_etag_verified_at"] = "2020-01-01T00:00:00"
+
+    revisions = []
+
+    def package_revise(match, **kwargs):
+        revisions.append((match["id"], kwargs))
+        if match["id"] == "p3":
+            raise ValueError("revise failed")
+
+    ckan = SimpleNamespace(action=SimpleNamespace(package_revise=package_revise))
+    path = str(tmp_path / "verification.sqlite")
+    with VerificationCache(path) as cache:
+        to_reupload = check_resources(
+            ckan, resources, legacy_urls, None, 1, verification_cache=cache
+        )
+    assert [t["id"] for t, _ in to_reupload] == ["r1"]
+    # one package_revise per package, which also clears verified_at on failure
+    assert [(package_id, sorted(t)) for package_id, t in revisions] == [
+        ("p1", ["update__resources__r0", "update__resources__r1"]),
+        ("p2", ["update__resources__r2", "update__resources__r3"]),
+        ("p3", ["update__resources__r4"]),
+    ]
+    assert revisions[0][1]["update__resources__r1"] == {"s3_etag_verified_at": ""}
+    assert revisions[0][1]["update__resources__r0"]["s3_etag_verified_at"]
+
+    # a second check skips the resources verified, and only those
+    revisions.clear()
+    StubCKANArchiveInfo.sizes.clear()
+    resources[1]["s3_etag_verified_at"] = ""
+    StubCKANArchiveInfo.sizes.update(
+        (t["url"], 10) for t in (resources[1], resources[4])
+    )
+    with VerificationCache(path) as cache:
+        assert (
+            check_resources(
+                ckan, resources, legacy_urls, None, 1, verification_cache=cache
+            )
+            == []
+        )
+        # r4 was checked again, as its verification couldn't be written to CKAN
+        assert [package_id for package_id, _ in revisions] == ["p1", "p3"]
+        assert (cache.hits, cache.misses) == (3, 2)
+        assert cache.is_verified(resources[1])
+
+
+def test_benchmark_regressions():
+    baseline = {
+        "benchmarks": {
+            "date_parsing": {
+                "cached": {"seconds": 1.0, "peak_rss": None},
+                "strptime": {"seconds": 4.0, "peak_rss": None},
+            }
+        }
+    }
+    results = {
+        "date_parsing": {
+            "cached": Measurement(1.2, None),
+            "strptime": Measurement(5.0, None),
+            "uncached": Measurement(9.0, None),
+        },
+        "ands_ids": {"memoised": Measurement(1.0, None)},
+    }
+    assert find_regressions(results, baseline, 0.25) == []
+    assert find_regressions(results, baseline, 0.1) == [
+        ("date_parsing", "cached", 1.0, 1.2),
+        ("date_parsing", "strptime", 4.0, 5.0),
+    ]
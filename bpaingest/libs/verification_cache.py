@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent record of resource verifications.
+
+Each resource which passes its check is recorded in a SQLite file, along with
+the CKAN `url` and `md5` it had, the sizes on the legacy archive and on S3, and
+its etag. A later sync skips the check of a resource verified recently enough,
+so long as its `url` and `md5` are unchanged.
+
+The time of each verification is also written back to the resource in CKAN, as
+`s3_etag_verified_at`. bpa-ingest clears it when it changes the `url` or `md5`
+of a resource, re-uploads it, or the resource fails its check; but CKAN doesn't
+record which `url` and `md5` were verified, and a resource changed by other
+means keeps its timestamp. So it is only trusted, for resources not in the
+SQLite file (e.g. on another machine), if `trust_ckan` is set.
+"""
+
+import datetime
+import os
+import sqlite3
+import threading
+
+
+DEFAULT_VERIFICATION_MAX_AGE = datetime.timedelta(days=7)
+# the format of the `s3_etag_verified_at` resource field
+VERIFIED_AT_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+
+def verified_at_now():
+    return datetime.datetime.now(datetime.timezone.utc).strftime(VERIFIED_AT_FORMAT)
+
+
+def parse_verified_at(verified_at):
+    "the datetime of a `s3_etag_verified_at` value, or None if it isn't set"
+    if not verified_at:
+        return None
+    try:
+        return datetime.datetime.strptime(verified_at, VERIFIED_AT_FORMAT).replace(
+            tzinfo=datetime.timezone.utc
+        )
+    except ValueError:
+        return None
+
+
+class VerificationCache:
+    "verifications of resources, kept in a SQLite file at `path`"
+
+    def __init__(self, path, max_age=DEFAULT_VERIFICATION_MAX_AGE, trust_ckan=False):
+        self.path = path
+        self.max_age = max_age
+        self.trust_ckan = trust_ckan
+        # `ckan_hits` are the hits taken from `s3_etag_verified_at`
+        self.hits = self.misses = self.ckan_hits = 0
+        self._lock = threading.Lock()
+        dirname = os.path.dirname(path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS verification (
+                resource_id TEXT PRIMARY KEY,
+                url TEXT,
+                md5 TEXT,
+                legacy_size INTEGER,
+                s3_size INTEGER,
+                etag TEXT,
+                verified_at TEXT
+            )"""
+        )
+        self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.commit()
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def is_verified(self, ckan_obj, now=None):
+        """
+        whether `ckan_obj` (a CKAN resource) was verified within max_age, with
+        the `url` and `md5` it has now. with `trust_ckan`, a resource not in the
+        cache is taken to be verified when its `s3_etag_verified_at` says so.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT url, md5, verified_at FROM verification WHERE resource_id = ?",
+                (ckan_obj["id"],),
+            ).fetchone()
+        from_ckan = row is None and self.trust_ckan
+        if row is None:
+            verified_at = None
+            if from_ckan:
+                verified_at = parse_verified_at(ckan_obj.get("s3_etag_verified_at"))
+            unchanged = True
+        else:
+            url, md5, verified_at = row
+            verified_at = parse_verified_at(verified_at)
+            unchanged = url == ckan_obj.get("url") and md5 == ckan_obj.get("md5")
+        if now is None:
+            now = datetime.datetime.now(datetime.timezone.utc)
+        verified = (
+            verified_at is not None and unchanged and now - verified_at < self.max_age
+        )
+        with self._lock:
+            if verified:
+                self.hits += 1
+                if from_ckan:
+                    self.ckan_hits += 1
+            else:
+                self.misses += 1
+        return verified
+
+    def record(self, ckan_obj, legacy_size, s3_size, etag, verified_at):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO verification VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    ckan_obj["id"],
+                    ckan_obj.get("url"),
+                    ckan_obj.get("md5"),
+                    legacy_size,
+                    s3_size,
+                    etag,
+                    verified_at,
+                ),
+            )
+
+    def forget(self, resource_id):
+        "the resource failed its check: it isn't verified, whatever CKAN says"
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO verification (resource_id) VALUES (?)",
+                (resource_id,),
+            )
+
+    def commit(self):
+        with self._lock:
+            self._db.commit()
@@ -1,12 +1,138 @@
+import atexit
 import tempfile
 import shutil
 import json
 import os
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import suppress
+from hashlib import sha256
 
-import requests as requests
+from .libs.fetch_data import (
+    DEFAULT_BUFFER_SIZE,
+    DEFAULT_FETCH_CONCURRENCY,
+    Fetcher,
+    get_password,
+    get_env_username,
+    merge_metadata_info,
+)
+from .libs.http_client import make_session
+from .libs.listing import ListingIndex
+from .libs.manifest import Manifest
 
-from .libs.fetch_data import Fetcher, get_password, get_env_username
+
+def download_metadata_options(args):
+    "keyword arguments for DownloadMetadata, from the command line arguments"
+    return {
+        "fetch_concurrency": args.fetch_concurrency,
+        "fetch_buffer_size": args.fetch_buffer_size,
+        "mirror": args.metadata_mirror,
+    }
+
+
+# lists the files link_folder has linked into a folder
+LINKED_FILENAME = ".bpaingest-linked.json"
+
+
+def link_folder(source_path, target_path, names):
+    """
+    hard link (or, failing that, copy) the files `names` from `source_path` into
+    `target_path`. files linked by an earlier call which aren't in `names` are
+    removed; anything else in `target_path` is left alone.
+    """
+    linked_path = os.path.join(target_path, LINKED_FILENAME)
+    previously_linked = []
+    with suppress(FileNotFoundError, ValueError):
+        with open(linked_path, "r") as fd:
+            previously_linked = json.load(fd)
+    for fname in set(previously_linked) - set(names):
+        with suppress(FileNotFoundError):
+            os.unlink(os.path.join(target_path, os.path.basename(fname)))
+    for fname in names:
+        source = os.path.join(source_path, fname)
+        target = os.path.join(target_path, fname)
+        with suppress(FileNotFoundError):
+            if os.path.samefile(source, target):
+                # already linked; renaming another link over it would be a no-op
+                continue
+        tmpf = target + ".new"
+        with suppress(FileNotFoundError):
+            os.unlink(tmpf)
+        try:
+            os.link(source, tmpf)
+        except OSError:
+            shutil.copyfile(source, tmpf)
+        os.replace(tmpf, target)
+    tmpf = linked_path + ".new"
+    with open(tmpf, "w") as fd:
+        json.dump(sorted(names), fd)
+    os.replace(tmpf, linked_path)
+
+
+class ContextualStore:
+    """
+    contextual metadata is shared between many project classes (e.g. every AMD,
+    BASE and MM class uses the AMD sample contextual workbook.) it is fetched once
+    per process into the store, keyed on the contextual class and its
+    `metadata_urls`, and linked from there into each download directory.
+    """
+
+    _stores = {}
+    _stores_lock = threading.Lock()
+
+    @classmethod
+    def for_download(cls, path, mirror):
+        """
+        a metadata mirror keeps a persistent store within it, so that the store
+        is revalidated rather than fetched afresh on each run. otherwise, one
+        temporary store is shared by the whole process.
+        """
+        root = None
+        if mirror:
+            root = os.path.join(os.path.abspath(path), ".bpaingest-contextual")
+        with cls._stores_lock:
+            if root not in cls._stores:
+                cls._stores[root] = cls(root)
+            return cls._stores[root]
+
+    def __init__(self, root=None):
+        if root is None:
+            root = tempfile.mkdtemp(prefix="bpaingest-contextual-")
+            atexit.register(shutil.rmtree, root, True)
+        self.root = root
+        self._lock = threading.Lock()
+        self._key_locks = defaultdict(threading.Lock)
+        self._fetched = {}
+
+    @classmethod
+    def key(cls, contextual_cls):
+        identity = "\n".join(
+            [contextual_cls.__module__, contextual_cls.__qualname__]
+            + list(contextual_cls.metadata_urls)
+        )
+        return sha256(identity.encode("utf8")).hexdigest()
+
+    def get(self, logger, contextual_cls, fetch_fn):
+        """
+        returns (path, metadata_info) for `contextual_cls`, calling
+        fetch_fn(path, contextual_cls) to fetch it if this is the first request
+        for it in this process
+        """
+        key = self.key(contextual_cls)
+        with self._lock:
+            key_lock = self._key_locks[key]
+        with key_lock:
+            if key not in self._fetched:
+                path = os.path.join(self.root, key)
+                os.makedirs(path, exist_ok=True)
+                self._fetched[key] = (path, fetch_fn(path, contextual_cls))
+            else:
+                logger.info(
+                    "contextual metadata already fetched: %s"
+                    % (contextual_cls.metadata_urls)
+                )
+            return self._fetched[key]
 
 
 class DownloadMetadata:
@@ -18,12 +144,19 @@ class DownloadMetadata:
         force_fetch=False,
         metadata_info=None,
         has_sql_context=False,
+        fetch_concurrency=DEFAULT_FETCH_CONCURRENCY,
+        fetch_buffer_size=DEFAULT_BUFFER_SIZE,
+        mirror=False,
     ):
         self.cleanup = True
         self.fetch = True
         self._logger = logger
+        self.fetch_concurrency = fetch_concurrency
+        self.fetch_buffer_size = fetch_buffer_size
+        self.mirror = mirror
         self._set_path(path)
         self._set_auth(project_class)
+        self.contextual_store = ContextualStore.for_download(self.path, mirror)
 
         if metadata_info is None:
             metadata_info = {}
@@ -44,6 +177,9 @@ class DownloadMetadata:
             (os.path.join(self.path, c.name), c) for c in schema_classes
         ]
 
+        # sizes from the listings crawled by this run; if the download is
+        # reused, there are none and the resource checks ask the archive
+        self.listing_index = ListingIndex()
         if self.fetch or force_fetch:
             self._fetch_metadata(project_class, self.contextual, metadata_info)
 
@@ -65,19 +201,15 @@ class DownloadMetadata:
         return self.project_class(logger, self.path, **meta_kwargs)
 
     def _fetch_metadata(self, project_class, contextual, metadata_info):
-        for metadata_url in project_class.metadata_urls:
-            self._logger.info(
-                "fetching submission metadata: %s" % (project_class.metadata_urls)
-            )
-            fetcher = Fetcher(self._logger, self.path, metadata_url, self.auth)
-            fetcher.fetch_metadata_from_folder(
-                getattr(project_class, "metadata_patterns", None),
-                metadata_info,
-                getattr(project_class, "metadata_url_components", []),
-            )
+        self._logger.info(
+            "fetching submission metadata: %s" % (project_class.metadata_urls)
+        )
+        crawls = [
+            (self.path, metadata_url, project_class)
+            for metadata_url in project_class.metadata_urls
+        ]
 
-        with suppress(FileExistsError):
-            os.mkdir(self.path)
+        os.makedirs(self.path, exist_ok=True)
 
         for contextual_path, contextual_cls in contextual:
             if not os.path.isdir(contextual_path):
@@ -88,24 +220,92 @@ class DownloadMetadata:
                         contextual_path
                     )
                 )
-            self._logger.info(
-                "fetching contextual metadata: %s" % (contextual_cls.metadata_urls)
-            )
-            for metadata_url in contextual_cls.metadata_urls:
+
+        # each crawl is driven from its own thread, but all listings and downloads
+        # are run on one shared pool, bounding the number of requests in flight
+        with ThreadPoolExecutor(max_workers=self.fetch_concurrency) as executor:
+
+            def crawl(target_folder, metadata_url, cls):
+                crawl_info = {}
                 fetcher = Fetcher(
-                    self._logger, contextual_path, metadata_url, self.auth
+                    self._logger,
+                    target_folder,
+                    metadata_url,
+                    self.auth,
+                    concurrency=self.fetch_concurrency,
+                    executor=executor,
+                    mirror=self.mirror,
+                    listing_index=self.listing_index,
+                    buffer_size=self.fetch_buffer_size,
                 )
                 fetcher.fetch_metadata_from_folder(
-                    getattr(contextual_cls, "metadata_patterns", None),
-                    metadata_info,
-                    getattr(contextual_cls, "metadata_url_components", []),
+                    getattr(cls, "metadata_patterns", None),
+                    crawl_info,
+                    getattr(cls, "metadata_url_components", []),
+                )
+                return crawl_info
+
+            def crawl_contextual(store_path, contextual_cls):
+                self._logger.info(
+                    "fetching contextual metadata: %s" % (contextual_cls.metadata_urls)
                 )
+                contextual_info = {}
+                try:
+                    for metadata_url in contextual_cls.metadata_urls:
+                        merge_metadata_info(
+                            contextual_info,
+                            crawl(store_path, metadata_url, contextual_cls),
+                        )
+                    if self.mirror:
+                        self._prune_mirror(store_path, contextual_info)
+                finally:
+                    if self.mirror:
+                        Manifest.for_folder(store_path).save()
+                return contextual_info
+
+            def fetch_contextual(contextual_path, contextual_cls):
+                store_path, contextual_info = self.contextual_store.get(
+                    self._logger, contextual_cls, crawl_contextual
+                )
+                link_folder(store_path, contextual_path, contextual_info)
+                return contextual_info
+
+            try:
+                with ThreadPoolExecutor(
+                    max_workers=max(len(crawls) + len(contextual), 1)
+                ) as drivers:
+                    results = [drivers.submit(crawl, *t) for t in crawls]
+                    results += [
+                        drivers.submit(fetch_contextual, *t) for t in contextual
+                    ]
+                    # merge in a fixed order, so that metadata_info is deterministic
+                    project_info = {}
+                    for idx, result in enumerate(results):
+                        crawl_info = result.result()
+                        if idx < len(crawls):
+                            project_info.update(crawl_info)
+                        merge_metadata_info(metadata_info, crawl_info)
+                if self.mirror:
+                    self._prune_mirror(self.path, project_info)
+            finally:
+                # keep track of partial downloads, even if the crawl failed
+                if self.mirror:
+                    Manifest.for_folder(self.path).save()
+
         self.init_schema_classes(project_class, metadata_info)
         tmpf = self.info_json + ".new"
         with open(tmpf, "w") as fd:
             json.dump(metadata_info, fd)
         os.replace(tmpf, self.info_json)
 
+    def _prune_mirror(self, target_folder, names):
+        for name in Manifest.for_folder(target_folder).prune(names):
+            self._logger.info(
+                "removed from mirror (no longer in archive): {}".format(
+                    os.path.join(target_folder, name)
+                )
+            )
+
     def init_schema_classes(self, project_class, metadata_info):
         if not self.schema_definitions:
             self._logger.info(
@@ -123,9 +323,10 @@ class DownloadMetadata:
             self._logger.info(
                 "fetching schema definitions metadata: %s" % (schema_cls.metadata_urls)
             )
+            session = make_session()
             for metadata_url in schema_cls.metadata_urls:
                 local_filename = metadata_url.split("/")[-1]
-                response = requests.get(url=metadata_url, timeout=10, stream=True)
+                response = session.get(url=metadata_url, stream=True)
                 error_message = f"Unable to download: {metadata_url}"
                 try:
                     if response is None or not response.ok:
@@ -156,10 +357,16 @@ class DownloadMetadata:
         # if we have a user-specified target directory, don't clean up at the end
         self.cleanup = path is None
         if path is None:
+            if self.mirror:
+                raise Exception("A metadata mirror requires download_path to be set.")
             path = tempfile.mkdtemp(prefix="bpaingest-metadata-")
         self.path = path
         self.info_json = os.path.join(path, "bpa-ingest.json")
-        if os.access(self.info_json, os.R_OK):
+        if self.mirror:
+            self._logger.info(
+                "updating metadata mirror in directory `%s' (changed files only)" % path
+            )
+        elif os.access(self.info_json, os.R_OK):
             self._logger.info(
                 "skipping metadata download, complete download in directory `%s' exists"
                 % path
@@ -1,13 +1,14 @@
 import subprocess
 import tempfile
+import threading
 import urllib
 
-import requests
 import ckanapi
 import os
 from urllib.parse import urlparse
-from collections import defaultdict
+from collections import defaultdict, namedtuple
 
+from .libs.http_client import make_session
 from .libs.ingest_utils import ApiFqBuilder
 from .util import make_logger
 
@@ -25,6 +26,7 @@ def sizeof_fmt(num, suffix="B"):
 
 
 method_stats = defaultdict(int)
+_method_stats_lock = threading.Lock()
 
 
 def ckan_method(ckan, object_type, method):
@@ -35,21 +37,19 @@ def ckan_method(ckan, object_type, method):
     fn = getattr(ckan.action, object_type + "_" + method)
 
     def _proxy_fn(*args, **kwargs):
-        method_stats[(object_type, method)] += 1
+        with _method_stats_lock:
+            method_stats[(object_type, method)] += 1
         return fn(*args, **kwargs)
 
     return _proxy_fn
 
 
 def print_accounts():
+    with _method_stats_lock:
+        stats = dict(method_stats)
     print("API call accounting:")
-    for object_type, method in sorted(method_stats, key=lambda x: method_stats[x]):
-        print(
-            (
-                "  %14s  %6s  %d"
-                % (object_type, method, method_stats[(object_type, method)])
-            )
-        )
+    for object_type, method in sorted(stats, key=lambda x: stats[x]):
+        print(("  %14s  %6s  %d" % (object_type, method, stats[(object_type, method)])))
 
 
 def diff_objects(obj1, obj2, desc, skip_differences=None):
@@ -114,7 +114,22 @@ def make_organization(ckan, organization_obj):
 
 class BaseArchiveInfo:
     def __init__(self):
+        # shared by the threads checking resources
         self._size_cache = {}
+        self._size_cache_lock = threading.Lock()
+
+    def cached_size(self, url):
+        "returns (found, size) from the size cache"
+        with self._size_cache_lock:
+            if url in self._size_cache:
+                return True, self._size_cache[url]
+        return False, None
+
+    def cache_size(self, size, *urls):
+        with self._size_cache_lock:
+            for url in urls:
+                self._size_cache[url] = size
+        return size
 
     def check_status_code(self, response):
         if response.status_code in (403, 401):
@@ -132,6 +147,10 @@ class BaseArchiveInfo:
             return int(response.headers["content-length"])
 
 
+# what one request for a resource on CKAN tells us
+ResourceProbe = namedtuple("ResourceProbe", ["size", "etag", "resolved_url"])
+
+
 def same_netloc(u1, u2):
     n1 = urlparse(u1).netloc
     n2 = urlparse(u2).netloc
@@ -139,9 +158,14 @@ def same_netloc(u1, u2):
 
 
 class CKANArchiveInfo(BaseArchiveInfo):
-    def __init__(self, ckan):
+    def __init__(self, ckan, inventory=None, pool_size=None):
         self.ckan = ckan
-        self.session = requests.Session()
+        # `pool_size` is the number of threads sharing the session
+        self.session = make_session(pool_size)
+        # an S3Inventory of uploaded resources, consulted before probing
+        self.inventory = inventory
+        self._probe_cache = {}
+        self._probe_cache_lock = threading.Lock()
         super().__init__()
 
     def on_ckan(self, url):
@@ -161,43 +185,64 @@ class CKANArchiveInfo(BaseArchiveInfo):
         # we have to do a range request for the first byte, as S3 doesn't let us head
         # with an authorization token. however, we can still get the full size from the
         # content-range header
-        return requests.get(url, headers={"Range": "bytes=0-0"})
-
-    def get_etag(self, url):
-        if not url:
-            return None
-        # a URL on S3 with auth token
-        resolved = self.resolve_url(url)
-        if resolved is None:
-            return None
-        response = self.s3_simulated_head(resolved)
-        self.check_status_code(response)
-        if response.status_code not in (200, 206):
-            return None
-        return response.headers.get("etag")
+        return self.session.get(url, headers={"Range": "bytes=0-0"})
 
-    def get_size(self, url):
+    def probe(self, url):
+        """
+        returns the ResourceProbe of `url`: from the inventory, if it lists `url`,
+        and otherwise from the one ranged GET of the resolved S3 link (its
+        content-range carries the size, and its headers the etag)
+        """
         if not url:
             return None
-        if url not in self._size_cache:
+        with self._probe_cache_lock:
+            if url in self._probe_cache:
+                return self._probe_cache[url]
+        entry = None
+        if self.inventory is not None:
+            entry = self.inventory.get(url)
+        if entry is not None:
+            probe = ResourceProbe(entry.size, entry.etag, self.inventory.s3_url(entry))
+        else:
             # a URL on S3 with auth token
             resolved = self.resolve_url(url)
             if resolved is None:
                 return None
-            # we have to do a range request for the first byte, as S3 doesn't let us head
-            # with an authorization token. however, we can still get the full size from the
-            # content-range header
             response = self.s3_simulated_head(resolved)
-            self._size_cache[url] = self._size_cache[
-                resolved
-            ] = self.size_from_response(response)
-        return self._size_cache[url]
+            size = self.size_from_response(response)
+            etag = None
+            if response.status_code in (200, 206):
+                etag = response.headers.get("etag")
+            probe = ResourceProbe(size, etag, resolved)
+        self.cache_size(probe.size, url, probe.resolved_url)
+        with self._probe_cache_lock:
+            self._probe_cache[url] = probe
+        return probe
+
+    def get_etag(self, url):
+        probe = self.probe(url)
+        if probe is None:
+            return None
+        return probe.etag
+
+    def get_size(self, url):
+        if not url:
+            return None
+        found, size = self.cached_size(url)
+        if found:
+            return size
+        probe = self.probe(url)
+        if probe is None:
+            return None
+        return probe.size
 
 
 class ApacheArchiveInfo(BaseArchiveInfo):
-    def __init__(self, auth):
+    def __init__(self, auth, listing_index=None, pool_size=None):
         self.auth = auth
-        self.session = requests.Session()
+        self.session = make_session(pool_size)
+        # sizes harvested from the archive's directory listings, where available
+        self.listing_index = listing_index
         super().__init__()
 
     def head(self, url):
@@ -222,14 +267,21 @@ class ApacheArchiveInfo(BaseArchiveInfo):
     def get_size(self, url):
         if not url:
             return None
-        if url not in self._size_cache:
-            resolved = self.resolve_url(url)
-            if resolved is None:
-                return None
-            self._size_cache[url] = self._size_cache[
-                resolved
-            ] = self.size_from_response(self.head(resolved))
-        return self._size_cache[url]
+        found, size = self.cached_size(url)
+        if found:
+            return size
+        if self.listing_index is not None:
+            # sizes from cached listings may be stale, and a stale size would
+            # have us upload the file again
+            listed_size = self.listing_index.live_size(url)
+            if listed_size is not None:
+                return self.cache_size(listed_size, url)
+        resolved = self.resolve_url(url)
+        if resolved is None:
+            return None
+        return self.cache_size(
+            self.size_from_response(self.head(resolved)), url, resolved
+        )
 
 
 def check_resource(
@@ -254,8 +306,9 @@ def check_resource(
         logger.error("error getting size of: %s" % (legacy_url))
         return "error-getting-size"
 
-    # determine the URL of the proxied s3 resource, and then its size
-    current_size = ckan_archive_info.get_size(current_url)
+    # determine the URL of the proxied s3 resource, and then its size and etag
+    probe = ckan_archive_info.probe(current_url)
+    current_size = probe.size if probe is not None else None
     if current_size is None:
         logger.error("error getting size of: %s" % (current_url))
         return "error-getting-size"
@@ -268,7 +321,7 @@ def check_resource(
         return "wrong-size"
 
     # if we have a pre-calculated s3etag in metadata, check it matches
-    current_etag = ckan_archive_info.get_etag(current_url)
+    current_etag = probe.etag
     logger.info(f"current etag is {current_etag}")
     if current_etag and current_etag.strip('"') not in metadata_etags:
         if None in metadata_etags:
@@ -356,6 +409,8 @@ def reupload_resource(ckan, ckan_obj, legacy_url, parent_destination, auth=None)
                 url=resource_url,
                 url_type="upload",
                 size=os.path.getsize(path),
+                # the new upload hasn't been checked
+                s3_etag_verified_at="",
             )
         else:
             logger.error("upload failed: status {}".format(status))
@@ -1,5 +1,6 @@
 from ...util import make_logger
 from ...libs.md5lines import md5lines
+from ...libs.raw_matcher import make_matcher
 import re
 
 
@@ -278,11 +279,12 @@ mm_metagenomics_filename_v2_re = re.compile(
 
 
 def parse_md5_file(md5_file, regexps):
+    matcher = make_matcher(regexps)
     with open(md5_file) as f:
         for md5, path in md5lines(f):
-            matches = [_f for _f in [t.match(path) for t in regexps] if _f]
-            if matches:
-                yield path, md5, matches[0].groupdict()
+            m = matcher.match(path)
+            if m:
+                yield path, md5, m.groupdict()
             else:
                 yield path, md5, None
 
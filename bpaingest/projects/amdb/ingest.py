@@ -289,13 +289,15 @@ class BASEAmpliconsMetadata(AMDFullIngestMetadata):
 
         self._logger.info("Ingesting BASE Amplicon metadata from {0}".format(self.path))
         packages = []
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info(
                 "Processing BASE Amplicon metadata file {0}".format(
                     os.path.basename(fname)
                 )
             )
-            for row in self.parse_spreadsheet(fname, self.metadata_info):
+            for row in rows:
                 track_meta = self.track_meta.get(row.ticket)
                 flow_id = get_flow_id(fname)
 
@@ -754,16 +756,16 @@ class BASEMetagenomicsMetadata(AMDFullIngestMetadata):
         # the generated package IDs will have duplicates, due to data issues in the pilot data
         # we simply skip over the duplicates, which don't have any significant data differences
         generated_packages = set()
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, sheet_rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info(
                 "Processing BASE Metagenomics metadata file {0}".format(
                     os.path.basename(fname)
                 )
             )
             # unique the rows, duplicates in some of the sheets
-            uniq_rows = set(
-                t for t in self.parse_spreadsheet(fname, self.metadata_info)
-            )
+            uniq_rows = set(t for t in sheet_rows)
             xlsx_info = self.metadata_info[os.path.basename(fname)]
             for row in uniq_rows:
                 track_meta = self.track_meta.get(row.ticket)
@@ -1103,7 +1105,9 @@ class MarineMicrobesAmpliconsMetadata(AMDFullIngestMetadata):
             "Ingesting Marine Microbes metadata from {0}".format(self.path)
         )
         packages = []
-        for fname in unique_spreadsheets(glob(self.path + "/*.xlsx")):
+        for fname, rows in self.parse_spreadsheets(
+            unique_spreadsheets(glob(self.path + "/*.xlsx")), self.metadata_info
+        ):
             base_fname = os.path.basename(fname)
             self._logger.info(
                 "Processing Marine Microbes metadata file {0}".format(
@@ -1115,7 +1119,7 @@ class MarineMicrobesAmpliconsMetadata(AMDFullIngestMetadata):
             use_index_linkage = base_fname in self.index_linkage_spreadsheets
             # the GOSHIP data has flowcells in the comments field
             use_flowid_from_comment = base_fname in self.flowcell_comment_spreadsheets
-            for row in self.parse_spreadsheet(fname, self.metadata_info):
+            for row in rows:
                 sample_id = row.sample_id
                 if sample_id is None:
                     continue
@@ -1401,13 +1405,15 @@ class MarineMicrobesMetagenomicsMetadata(BaseMarineMicrobesMetadata):
             "Ingesting Marine Microbes metadata from {0}".format(self.path)
         )
         packages = []
-        for fname in unique_spreadsheets(glob(self.path + "/*.xlsx")):
+        for fname, rows in self.parse_spreadsheets(
+            unique_spreadsheets(glob(self.path + "/*.xlsx")), self.metadata_info
+        ):
             self._logger.info(
                 "Processing Marine Microbes metadata file {0}".format(
                     os.path.basename(fname)
                 )
             )
-            for row in self.parse_spreadsheet(fname, self.metadata_info):
+            for row in rows:
                 sample_id = row.sample_id
                 if sample_id is None:
                     continue
@@ -1549,13 +1555,15 @@ class MarineMicrobesMetatranscriptomeMetadata(BaseMarineMicrobesMetadata):
         # duplicate rows are an issue in this project. we filter them out by uniquifying
         # this is harmless as they have to precisly match, and sample_id is the primary key
         all_rows = set()
-        for fname in unique_spreadsheets(glob(self.path + "/*.xlsx")):
+        for fname, rows in self.parse_spreadsheets(
+            unique_spreadsheets(glob(self.path + "/*.xlsx")), self.metadata_info
+        ):
             self._logger.info(
                 "Processing Marine Microbes Transcriptomics metadata file {0}".format(
                     os.path.basename(fname)
                 )
             )
-            for row in self.parse_spreadsheet(fname, self.metadata_info):
+            for row in rows:
                 all_rows.add(row)
         for row in all_rows:
             sample_id = row.sample_id
@@ -1708,13 +1716,15 @@ class AustralianMicrobiomeMetagenomicsNovaseqMetadata(AMDFullIngestMetadata):
                 raise Exception("unable to find flowcell for filename: `%s'" % (fname))
             return m.groups()[0]
 
-        for fname in unique_spreadsheets(glob(self.path + "/*.xlsx")):
+        for fname, rows in self.parse_spreadsheets(
+            unique_spreadsheets(glob(self.path + "/*.xlsx")), self.metadata_info
+        ):
             self._logger.info(
                 "Processing Australian Microbiome metadata file {0}".format(
                     os.path.basename(fname)
                 )
             )
-            for row in self.parse_spreadsheet(fname, self.metadata_info):
+            for row in rows:
                 sample_id = row.sample_id
                 if sample_id is None:
                     continue
@@ -1951,7 +1961,9 @@ class AustralianMicrobiomeAmpliconsMetadata(AMDFullIngestMetadata):
             "Ingesting Australian Microbiome metadata from {0}".format(self.path)
         )
         packages = []
-        for fname in unique_spreadsheets(glob(self.path + "/*.xlsx")):
+        for fname, rows in self.parse_spreadsheets(
+            unique_spreadsheets(glob(self.path + "/*.xlsx")), self.metadata_info
+        ):
             base_fname = os.path.basename(fname)
             self._logger.info(
                 "Processing Australian Microbiome metadata file {0}".format(
@@ -1959,7 +1971,7 @@ class AustralianMicrobiomeAmpliconsMetadata(AMDFullIngestMetadata):
                 )
             )
             flow_id = get_flow_id(fname)
-            for row in self.parse_spreadsheet(fname, self.metadata_info):
+            for row in rows:
                 sample_id = row.sample_id
                 if sample_id is None:
                     continue
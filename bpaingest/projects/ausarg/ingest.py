@@ -169,12 +169,13 @@ class AusargIlluminaFastqMetadata(AusargBaseMetadata):
     def _get_packages(self):
         self._logger.info("Ingesting AusARG metadata from {0}".format(self.path))
         packages = []
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info("Processing AusARG metadata file {0}".format(fname))
             metadata_sheet_flowcell_id = re.match(
                 r"^.*_([^_]+)_metadata.*\.xlsx", fname
             ).groups()[0]
-            rows = self.parse_spreadsheet(fname, self.metadata_info)
             xlsx_info = self.metadata_info[os.path.basename(fname)]
             ticket = xlsx_info["ticket"]
             track_meta = self.google_track_meta.get(ticket)
@@ -377,9 +378,10 @@ class AusargONTPromethionMetadata(AusargBaseMetadata):
     def _get_packages(self):
         self._logger.info("Ingesting AusARG metadata from {0}".format(self.path))
         packages = []
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info("Processing AusARG metadata file {0}".format(fname))
-            rows = self.parse_spreadsheet(fname, self.metadata_info)
 
             def track_get(k):
                 if track_meta is None:
@@ -574,7 +576,9 @@ class AusargPacbioHifiMetadata(AusargBaseMetadata):
         filename_re = files.pacbio_hifi_metadata_sheet_re
 
         objs = []
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info(
                 "Processing AusARG metadata file {0}".format(os.path.basename(fname))
             )
@@ -587,7 +591,6 @@ class AusargPacbioHifiMetadata(AusargBaseMetadata):
                 if f in metadata_sheet_dict:
                     metadata_sheet_flowcell_ids.append(metadata_sheet_dict[f])
 
-            rows = self.parse_spreadsheet(fname, self.metadata_info)
             xlsx_info = self.metadata_info[os.path.basename(fname)]
             ticket = xlsx_info["ticket"]
             track_meta = self.google_track_meta.get(ticket)
@@ -829,11 +832,13 @@ class AusargExonCaptureMetadata(AusargBaseMetadata):
     def _get_packages(self):
         self._logger.info("Ingesting AusARG metadata from {0}".format(self.path))
         packages = []
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info(
                 "Processing AusARG metadata file {0}".format(os.path.basename(fname))
             )
-            for row in self.parse_spreadsheet(fname, self.metadata_info):
+            for row in rows:
                 track_meta = self.track_meta.get(row.ticket)
 
                 def track_get(k):
@@ -1070,9 +1075,10 @@ class AusargHiCMetadata(AusargBaseMetadata):
     def _get_packages(self):
         self._logger.info("Ingesting AusARG metadata from {0}".format(self.path))
         packages = []
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info("Processing AusARG metadata file {0}".format(fname))
-            rows = self.parse_spreadsheet(fname, self.metadata_info)
             xlsx_info = self.metadata_info[os.path.basename(fname)]
             ticket = xlsx_info["ticket"]
             track_meta = self.google_track_meta.get(ticket)
@@ -111,10 +111,11 @@ class GAPIlluminaShortreadMetadata(BaseMetadata):
     def _get_packages(self):
         self._logger.info("Ingesting GAP metadata from {0}".format(self.path))
         packages = []
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info("Processing GAP metadata file {0}".format(fname))
             flow_cell_id = re.match(r"^.*_([^_]+)_metadata.*\.xlsx", fname).groups()[0]
-            rows = self.parse_spreadsheet(fname, self.metadata_info)
             xlsx_info = self.metadata_info[os.path.basename(fname)]
             ticket = xlsx_info["ticket"]
             track_meta = self.google_track_meta.get(ticket)
@@ -256,9 +257,10 @@ class GAPONTMinionMetadata(BaseMetadata):
     def _get_packages(self):
         self._logger.info("Ingesting GAP metadata from {0}".format(self.path))
         packages = []
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info("Processing GAP metadata file {0}".format(fname))
-            rows = self.parse_spreadsheet(fname, self.metadata_info)
             xlsx_info = self.metadata_info[os.path.basename(fname)]
             ticket = xlsx_info["ticket"]
             track_meta = self.google_track_meta.get(ticket)
@@ -386,9 +388,10 @@ class GAPONTPromethionMetadata(BaseMetadata):
     def _get_packages(self):
         self._logger.info("Ingesting GAP metadata from {0}".format(self.path))
         packages = []
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info("Processing GAP metadata file {0}".format(fname))
-            rows = self.parse_spreadsheet(fname, self.metadata_info)
             xlsx_info = self.metadata_info[os.path.basename(fname)]
             ticket = xlsx_info["ticket"]
             track_meta = self.google_track_meta.get(ticket)
@@ -504,10 +507,11 @@ class GAPGenomics10XMetadata(BaseMetadata):
     def _get_packages(self):
         self._logger.info("Ingesting GAP metadata from {0}".format(self.path))
         packages = []
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info("Processing GAP metadata file {0}".format(fname))
             flow_cell_id = re.match(r"^.*_([^_]+)_metadata.xlsx", fname).groups()[0]
-            rows = self.parse_spreadsheet(fname, self.metadata_info)
             xlsx_info = self.metadata_info[os.path.basename(fname)]
             ticket = xlsx_info["ticket"]
             track_meta = self.google_track_meta.get(ticket)
@@ -693,13 +697,15 @@ class GAPGenomicsDDRADMetadata(BaseMetadata):
 
         self._logger.info("Ingesting GAP metadata from {0}".format(self.path))
         packages = []
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info(
                 "Processing GAP metadata file {0}".format(os.path.basename(fname))
             )
             flow_id = get_flow_id(fname)
             objs = defaultdict(list)
-            for row in self.parse_spreadsheet(fname, self.metadata_info):
+            for row in rows:
                 obj = row._asdict()
                 if not obj["dataset_id"] or not obj["flowcell_id"]:
                     continue
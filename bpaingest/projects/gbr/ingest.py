@@ -75,9 +75,11 @@ class GbrPacbioMetadata(BaseMetadata):
 
     def _get_packages(self):
         packages = []
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info("Processing Pacbio metadata file {0}".format(fname))
-            for row in self.parse_spreadsheet(fname, self.metadata_info):
+            for row in rows:
                 xlsx_info = self.metadata_info[os.path.basename(fname)]
                 sample_id = row.sample_id
                 if sample_id is None:
@@ -196,11 +198,13 @@ class GbrAmpliconsMetadata(BaseMetadata):
 
     def _get_packages(self):
         packages = []
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info(
                 "Processing Stemcells Transcriptomics metadata file {0}".format(fname)
             )
-            for row in self.parse_spreadsheet(fname, self.metadata_info):
+            for row in rows:
                 sample_id = row.sample_id
                 if sample_id is None:
                     continue
@@ -164,11 +164,13 @@ class OMG10XRawIlluminaMetadata(OMGBaseMetadata):
         # glomp together the spreadsheet rows by filename
         fname_rows = defaultdict(list)
 
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info(
                 "Processing OMG metadata file {0}".format(os.path.basename(fname))
             )
-            for row in self.parse_spreadsheet(fname, self.metadata_info):
+            for row in rows:
                 fname_rows[(get_flow_id(fname), row.file, fname)].append(row)
 
         packages = []
@@ -353,7 +355,9 @@ class OMG10XRawMetadata(OMGBaseMetadata):
     def _get_packages(self):
         self._logger.info("Ingesting OMG metadata from {0}".format(self.path))
         packages = []
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info(
                 "Processing OMG metadata file {0}".format(os.path.basename(fname))
             )
@@ -361,9 +365,7 @@ class OMG10XRawMetadata(OMGBaseMetadata):
             # for this tech, each spreadsheet will only have a single BPA ID and flow cell
             # we grab the common values in the spreadsheet, then apply the flow cell ID
             # from the filename
-            obj = common_values(
-                [t._asdict() for t in self.parse_spreadsheet(fname, self.metadata_info)]
-            )
+            obj = common_values([t._asdict() for t in rows])
             file_info = files.tenx_raw_xlsx_filename_re.match(
                 os.path.basename(fname)
             ).groupdict()
@@ -544,11 +546,13 @@ class OMG10XProcessedIlluminaMetadata(OMGBaseMetadata):
 
         self._logger.info("Ingesting OMG metadata from {0}".format(self.path))
         packages = []
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info(
                 "Processing OMG metadata file {0}".format(os.path.basename(fname))
             )
-            for row in self.parse_spreadsheet(fname, self.metadata_info):
+            for row in rows:
                 track_meta = self.track_meta.get(row.ticket)
                 flow_id = get_flow_id(fname)
 
@@ -749,11 +753,13 @@ class OMGExonCaptureMetadata(OMGBaseMetadata):
     def _get_packages(self):
         self._logger.info("Ingesting OMG metadata from {0}".format(self.path))
         packages = []
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info(
                 "Processing OMG metadata file {0}".format(os.path.basename(fname))
             )
-            for row in self.parse_spreadsheet(fname, self.metadata_info):
+            for row in rows:
                 track_meta = self.track_meta.get(row.ticket)
 
                 def track_get(k):
@@ -996,11 +1002,13 @@ class OMGWholeGenomeMetadata(OMGBaseMetadata):
     def _get_packages(self):
         self._logger.info("Ingesting OMG metadata from {0}".format(self.path))
         packages = []
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info(
                 "Processing OMG metadata file {0}".format(os.path.basename(fname))
             )
-            for row in self.parse_spreadsheet(fname, self.metadata_info):
+            for row in rows:
                 track_meta = self.track_meta.get(row.ticket)
 
                 def track_get(k):
@@ -1208,11 +1216,13 @@ class OMGGenomicsNovaseqMetadata(OMGBaseMetadata):
     def _get_packages(self):
         self._logger.info("Ingesting OMG metadata from {0}".format(self.path))
         packages = []
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info(
                 "Processing OMG metadata file {0}".format(os.path.basename(fname))
             )
-            for row in self.parse_spreadsheet(fname, self.metadata_info):
+            for row in rows:
                 track_meta = self.track_meta.get(row.ticket)
 
                 def track_get(k):
@@ -1383,14 +1393,16 @@ class OMGGenomicsHiSeqMetadata(OMGBaseMetadata):
 
         self._logger.info("Ingesting OMG metadata from {0}".format(self.path))
         packages = []
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info(
                 "Processing OMG metadata file {0}".format(os.path.basename(fname))
             )
             flow_id = get_flow_id(fname)
 
             objs = defaultdict(list)
-            for row in self.parse_spreadsheet(fname, self.metadata_info):
+            for row in rows:
                 obj = row._asdict()
                 obj.pop("file")
                 objs[obj["bpa_sample_id"]].append(obj)
@@ -1613,13 +1625,15 @@ class OMGGenomicsDDRADMetadata(OMGBaseMetadata):
 
         self._logger.info("Ingesting OMG metadata from {0}".format(self.path))
         packages = []
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info(
                 "Processing OMG metadata file {0}".format(os.path.basename(fname))
             )
             flow_id = get_flow_id(fname)
             objs = defaultdict(list)
-            for row in self.parse_spreadsheet(fname, self.metadata_info):
+            for row in rows:
                 obj = row._asdict()
                 obj.pop("file")
                 if not obj["bpa_dataset_id"] or not obj["flowcell_id"]:
@@ -1795,16 +1809,16 @@ class OMGGenomicsPacbioMetadata(OMGBaseMetadata):
         filename_re = re.compile(r"^OMG_.*_(\d{8})_metadata\.xlsx")
         objs = []
         # this is a folder-oriented ingest, so we crush each xlsx down into a single row
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info(
                 "Processing OMG metadata file {0}".format(os.path.basename(fname))
             )
 
             xlsx_date = filename_re.match(os.path.basename(fname)).groups()[0]
 
-            fname_obj = common_values(
-                t._asdict() for t in self.parse_spreadsheet(fname, self.metadata_info)
-            )
+            fname_obj = common_values(t._asdict() for t in rows)
             fname_obj["run_date"] = xlsx_date
             objs.append((fname, fname_obj))
 
@@ -1991,9 +2005,10 @@ class OMGONTPromethionMetadata(OMGBaseMetadata):
     def _get_packages(self):
         self._logger.info("Ingesting OMG metadata from {0}".format(self.path))
         packages = []
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info("Processing OMG metadata file {0}".format(fname))
-            rows = self.parse_spreadsheet(fname, self.metadata_info)
 
             def track_get(k):
                 if track_meta is None:
@@ -2170,13 +2185,15 @@ class OMGTranscriptomicsNextseq(OMGBaseMetadata):
 
         self._logger.info("Ingesting OMG metadata from {0}".format(self.path))
         packages = []
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info(
                 "Processing OMG metadata file {0}".format(os.path.basename(fname))
             )
             flow_id = get_flow_id(fname)
             objs = defaultdict(list)
-            for row in self.parse_spreadsheet(fname, self.metadata_info):
+            for row in rows:
                 obj = row._asdict()
                 obj.pop("file")
                 objs[(obj["bpa_library_id"], obj["flowcell_id"])].append(obj)
@@ -2352,13 +2369,14 @@ class OMGGenomicsPacBioGenomeAssemblyMetadata(SecondaryMetadata):
         self._logger.info("Ingesting secondary OMG metadata from {0}".format(self.path))
         packages = []
 
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info(
                 "Processing Secondary (Genome assembly) metadata file {0}".format(
                     os.path.basename(fname)
                 )
             )
-            rows = self.parse_spreadsheet(fname, self.metadata_info)
             xlsx_info = self.metadata_info[os.path.basename(fname)]
             ticket = xlsx_info["ticket"]
             track_meta = self.google_track_meta.get(ticket)
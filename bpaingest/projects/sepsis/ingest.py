@@ -126,6 +126,10 @@ class BaseSepsisMetadata(BaseMetadata):
     def parse_spreadsheet(self, *args, **kwargs):
         return map_taxon_strain_rows(super().parse_spreadsheet(*args, **kwargs))
 
+    def parse_spreadsheets(self, *args, **kwargs):
+        for fname, rows in super().parse_spreadsheets(*args, **kwargs):
+            yield fname, map_taxon_strain_rows(rows)
+
 
 class SepsisGenomicsMiseqMetadata(BaseSepsisMetadata):
     contextual_classes = [SepsisBacterialContextual, SepsisGenomicsContextual]
@@ -173,11 +177,12 @@ class SepsisGenomicsMiseqMetadata(BaseSepsisMetadata):
             "Ingesting Sepsis Genomics Miseq metadata from {0}".format(self.path)
         )
         packages = []
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info(
                 "Processing Sepsis Genomics metadata file {0}".format(fname)
             )
-            rows = self.parse_spreadsheet(fname, self.metadata_info)
             xlsx_info = self.metadata_info[os.path.basename(fname)]
             ticket = xlsx_info["ticket"]
             google_track_meta = self.google_track_meta.get(ticket)
@@ -310,11 +315,12 @@ class SepsisGenomicsPacbioMetadata(BaseSepsisMetadata):
             "Ingesting Sepsis Genomics Pacbio metadata from {0}".format(self.path)
         )
         packages = []
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info(
                 "Processing Sepsis Genomics metadata file {0}".format(fname)
             )
-            rows = self.parse_spreadsheet(fname, self.metadata_info)
             xlsx_info = self.metadata_info[os.path.basename(fname)]
             ticket = xlsx_info["ticket"]
             google_track_meta = self.google_track_meta.get(ticket)
@@ -446,12 +452,13 @@ class SepsisTranscriptomicsHiseqMetadata(BaseSepsisMetadata):
         # Should be an uncommon case, only in AGRF data.
 
         sample_id_info = defaultdict(list)
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info(
                 "Processing Sepsis Transcriptomics metadata file {0}".format(fname)
             )
 
-            rows = self.parse_spreadsheet(fname, self.metadata_info)
             xlsx_info = self.metadata_info[os.path.basename(fname)]
             ticket = xlsx_info["ticket"]
             google_track_meta = self.google_track_meta.get(ticket)
@@ -605,11 +612,12 @@ class SepsisMetabolomicsGCMSMetadata(BaseSepsisMetadata):
 
     def _get_packages(self):
         packages = []
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info(
                 "Processing Sepsis Metabolomics GCMS metadata file {0}".format(fname)
             )
-            rows = self.parse_spreadsheet(fname, self.metadata_info)
             xlsx_info = self.metadata_info[os.path.basename(fname)]
             ticket = xlsx_info["ticket"]
             google_track_meta = self.google_track_meta.get(ticket)
@@ -735,11 +743,12 @@ class SepsisMetabolomicsLCMSMetadata(BaseSepsisMetadata):
 
     def _get_packages(self):
         packages = []
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info(
                 "Processing Sepsis Metabolomics LCMS metadata file {0}".format(fname)
             )
-            rows = self.parse_spreadsheet(fname, self.metadata_info)
             xlsx_info = self.metadata_info[os.path.basename(fname)]
             ticket = xlsx_info["ticket"]
             google_track_meta = self.google_track_meta.get(ticket)
@@ -891,13 +900,14 @@ class SepsisProteomicsMS1QuantificationMetadata(BaseSepsisMetadata):
 
     def _get_packages(self):
         packages = []
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info(
                 "Processing Sepsis Proteomics MS1Quantification metadata file {0}".format(
                     fname
                 )
             )
-            rows = self.parse_spreadsheet(fname, self.metadata_info)
             xlsx_info = self.metadata_info[os.path.basename(fname)]
             ticket = xlsx_info["ticket"]
             google_track_meta = self.google_track_meta.get(ticket)
@@ -1032,11 +1042,12 @@ class SepsisProteomicsSwathMSBaseSepsisMetadata(BaseSepsisMetadata):
         """
         package_data = {}
         file_data = {}
-        for fname in glob(self.path + "/*_metadata.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*_metadata.xlsx"), self.metadata_info
+        ):
             self._logger.info(
                 "Processing Sepsis Proteomics SwathMS metadata file {0}".format(fname)
             )
-            rows = self.parse_spreadsheet(fname, self.metadata_info)
             xlsx_info = self.metadata_info[os.path.basename(fname)]
             ticket = xlsx_info["ticket"]
             google_track_meta = self.google_track_meta.get(ticket)
@@ -1251,14 +1262,16 @@ class SepsisProteomicsSwathMSCombinedSampleMetadata(BaseSepsisMetadata):
         # we have one package per Zip of analysed data, and we take the common
         # meta-data for each bpa-id
         folder_rows = defaultdict(list)
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info("Processing Sepsis metadata file {0}".format(fname))
             xlsx_info = self.metadata_info[os.path.basename(fname)]
             ticket = xlsx_info["ticket"]
             if not ticket:
                 continue
             folder_name = self.google_track_meta.get(ticket).folder_name
-            for row in self.parse_spreadsheet(fname, self.metadata_info):
+            for row in rows:
                 folder_rows[(ticket, folder_name)].append(row)
         packages = []
         for (ticket, folder_name), rows in list(folder_rows.items()):
@@ -1398,14 +1411,16 @@ class SepsisProteomics2DLibraryMetadata(BaseSepsisMetadata):
         # we have one package per Zip of analysed data, and we take the common
         # meta-data for each bpa-id
         folder_rows = defaultdict(list)
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info("Processing Sepsis metadata file {0}".format(fname))
             xlsx_info = self.metadata_info[os.path.basename(fname)]
             ticket = xlsx_info["ticket"]
             if not ticket:
                 continue
             folder_name = self.google_track_meta.get(ticket).folder_name
-            for row in self.parse_spreadsheet(fname, self.metadata_info):
+            for row in rows:
                 folder_rows[(ticket, folder_name)].append(row)
         packages = []
         for (ticket, folder_name), rows in list(folder_rows.items()):
@@ -1654,14 +1669,16 @@ class SepsisProteomicsAnalysedMetadata(BaseSepsisAnalysedMetadata):
         # we have one package per Zip of analysed data, and we take the common
         # meta-data for each bpa-id
         folder_rows = defaultdict(list)
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info("Processing Sepsis metadata file {0}".format(fname))
             xlsx_info = self.metadata_info[os.path.basename(fname)]
             ticket = xlsx_info["ticket"]
             if not ticket:
                 continue
             folder_name = self.google_track_meta.get(ticket).folder_name
-            for row in self.parse_spreadsheet(fname, self.metadata_info):
+            for row in rows:
                 folder_rows[(ticket, folder_name)].append(row)
         packages = []
         for (ticket, folder_name), rows in list(folder_rows.items()):
@@ -1829,13 +1846,15 @@ class SepsisTranscriptomicsAnalysedMetadata(BaseSepsisAnalysedMetadata):
         # we have one package per Zip of analysed data, and we take the common
         # meta-data for each bpa-id
         ticket_rows = defaultdict(list)
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info("Processing Sepsis metadata file {0}".format(fname))
             xlsx_info = self.metadata_info[os.path.basename(fname)]
             ticket = xlsx_info["ticket"]
             if not ticket:
                 continue
-            for row in self.parse_spreadsheet(fname, self.metadata_info):
+            for row in rows:
                 ticket_rows[ticket].append(row)
         packages = []
         for ticket, rows in list(ticket_rows.items()):
@@ -1985,14 +2004,16 @@ class SepsisMetabolomicsAnalysedMetadata(BaseSepsisAnalysedMetadata):
         # we have one package per Zip of analysed data, and we take the common
         # meta-data for each bpa-id
         folder_rows = defaultdict(list)
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info("Processing Sepsis metadata file {0}".format(fname))
             xlsx_info = self.metadata_info[os.path.basename(fname)]
             ticket = xlsx_info["ticket"]
             if not ticket:
                 continue
             folder_name = self.google_track_meta.get(ticket).folder_name
-            for row in self.parse_spreadsheet(fname, self.metadata_info):
+            for row in rows:
                 folder_rows[(ticket, folder_name)].append(row)
         packages = []
         for (ticket, folder_name), rows in list(folder_rows.items()):
@@ -2156,14 +2177,16 @@ class SepsisGenomicsAnalysedMetadata(BaseSepsisAnalysedMetadata):
         # we have one package per Zip of analysed data, and we take the common
         # meta-data for each bpa-id
         folder_rows = defaultdict(list)
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info("Processing Sepsis metadata file {0}".format(fname))
             xlsx_info = self.metadata_info[os.path.basename(fname)]
             ticket = xlsx_info["ticket"]
             if not ticket:
                 continue
             folder_name = self.google_track_meta.get(ticket).folder_name
-            for row in self.parse_spreadsheet(fname, self.metadata_info):
+            for row in rows:
                 folder_rows[(ticket, folder_name)].append(row)
         packages = []
         for (ticket, folder_name), rows in list(folder_rows.items()):
@@ -2317,14 +2340,16 @@ class SepsisProteomicsProteinDatabaseMetadata(BaseSepsisAnalysedMetadata):
         # we have one package per Zip of analysed data, and we take the common
         # meta-data for each bpa-id
         folder_rows = defaultdict(list)
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info("Processing Sepsis metadata file {0}".format(fname))
             xlsx_info = self.metadata_info[os.path.basename(fname)]
             ticket = xlsx_info["ticket"]
             if not ticket:
                 continue
             folder_name = self.google_track_meta.get(ticket).folder_name
-            for row in self.parse_spreadsheet(fname, self.metadata_info):
+            for row in rows:
                 folder_rows[(ticket, folder_name)].append(row)
         packages = []
         for (ticket, folder_name), rows in list(folder_rows.items()):
@@ -2388,9 +2413,11 @@ class SepsisProteomicsProteinDatabaseMetadata(BaseSepsisAnalysedMetadata):
 
     def _get_resources(self):
         rows = []
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, sheet_rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             xlsx_info = self.metadata_info[os.path.basename(fname)]
-            rows += self.parse_spreadsheet(fname, self.metadata_info)
+            rows += sheet_rows
         by_filename = dict((t.file_name.strip(), t) for t in rows)
         self._logger.info(
             "Ingesting Sepsis md5 file information from {0}".format(self.path)
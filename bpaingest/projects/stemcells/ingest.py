@@ -81,11 +81,13 @@ class StemcellsTranscriptomeMetadata(BaseMetadata):
         # duplicate rows are an issue in this project. we filter them out by uniquifying
         # this is harmless as they have to precisly match, and sample_id is the primary key
         all_rows = set()
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info(
                 "Processing Stemcells Transcriptomics metadata file {0}".format(fname)
             )
-            all_rows.update(self.parse_spreadsheet(fname, self.metadata_info))
+            all_rows.update(rows)
         for row in all_rows:
             sample_id = row.sample_id
             if sample_id is None:
@@ -201,11 +203,13 @@ class StemcellsSmallRNAMetadata(BaseMetadata):
         # duplicate rows are an issue in this project. we filter them out by uniquifying
         # this is harmless as they have to precisly match, and sample_id is the primary key
         all_rows = set()
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info(
                 "Processing Stemcells SmallRNA metadata file {0}".format(fname)
             )
-            all_rows.update(self.parse_spreadsheet(fname, self.metadata_info))
+            all_rows.update(rows)
         for row in all_rows:
             sample_id = row.sample_id
             if sample_id is None:
@@ -336,11 +340,12 @@ class StemcellsSingleCellRNASeqMetadata(BaseMetadata):
         # duplicate rows are an issue in this project. we filter them out by uniquifying
         # this is harmless as they have to precisly match, and sample_id is the primary key
         all_rows = set()
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, next_rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info(
                 "Processing Stemcells SingleCellRNASeq metadata file {0}".format(fname)
             )
-            next_rows = self.parse_spreadsheet(fname, self.metadata_info)
             file_info = files.singlecell_raw_xlsx_filename_re.match(
                 os.path.basename(fname)
             ).groupdict()
@@ -502,11 +507,13 @@ class StemcellsMetabolomicsMetadata(BaseMetadata):
         # duplicate rows are an issue in this project. we filter them out by uniquifying
         # this is harmless as they have to precisly match, and sample_id is the primary key
         all_rows = set()
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info(
                 "Processing Stemcells Metabolomics metadata file {0}".format(fname)
             )
-            all_rows.update(self.parse_spreadsheet(fname, self.metadata_info))
+            all_rows.update(rows)
         for row in all_rows:
             sample_id = row.sample_id
             if sample_id is None:
@@ -981,13 +988,15 @@ class StemcellsProteomicsAnalysedMetadata(BaseMetadata):
         # we have one package per Zip of analysed data, and we take the common
         # meta-data for each bpa-id
         ticket_rows = defaultdict(list)
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info("Processing Stemcells metadata file {0}".format(fname))
             xlsx_info = self.metadata_info[os.path.basename(fname)]
             ticket = xlsx_info["ticket"]
             if not ticket:
                 continue
-            for row in self.parse_spreadsheet(fname, self.metadata_info):
+            for row in rows:
                 ticket_rows[ticket].append(row)
         packages = []
         for ticket, rows in list(ticket_rows.items()):
@@ -1126,14 +1135,16 @@ class StemcellsMetabolomicsAnalysedMetadata(BaseMetadata):
         # we have one package per Zip of analysed data, and we take the common
         # meta-data for each bpa-id
         folder_rows = defaultdict(list)
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info("Processing Stemcells metadata file {0}".format(fname))
             xlsx_info = self.metadata_info[os.path.basename(fname)]
             ticket = xlsx_info["ticket"]
             if not ticket:
                 continue
             folder_name = self.track_meta.get(ticket).folder_name
-            for row in self.parse_spreadsheet(fname, self.metadata_info):
+            for row in rows:
                 folder_rows[(ticket, folder_name)].append(row)
         packages = []
         for (ticket, folder_name), rows in list(folder_rows.items()):
@@ -1281,14 +1292,16 @@ class StemcellsTranscriptomeAnalysedMetadata(BaseMetadata):
         # we have one package per Zip of analysed data, and we take the common
         # meta-data for each bpa-id
         folder_rows = defaultdict(list)
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info("Processing Stemcells metadata file {0}".format(fname))
             xlsx_info = self.metadata_info[os.path.basename(fname)]
             ticket = xlsx_info["ticket"]
             if not ticket:
                 continue
             folder_name = self.track_meta.get(ticket).folder_name
-            for row in self.parse_spreadsheet(fname, self.metadata_info):
+            for row in rows:
                 folder_rows[(ticket, folder_name)].append(row)
         packages = []
         for (ticket, folder_name), rows in list(folder_rows.items()):
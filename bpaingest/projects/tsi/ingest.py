@@ -233,11 +233,13 @@ class TSINovaseqMetadata(TSIBaseMetadata):
     def _get_packages(self):
         self._logger.info("Ingesting TSI metadata from {0}".format(self.path))
         packages = []
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info(
                 "Processing TSI metadata file {0}".format(os.path.basename(fname))
             )
-            for row in self.parse_spreadsheet(fname, self.metadata_info):
+            for row in rows:
                 track_meta = self.track_meta.get(row.ticket)
 
                 def track_get(k):
@@ -435,10 +437,11 @@ class TSIIlluminaShortreadMetadata(TSIBaseMetadata):
     def _get_packages(self):
         self._logger.info("Ingesting TSI metadata from {0}".format(self.path))
         packages = []
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info("Processing GAP metadata file {0}".format(fname))
             flow_cell_id = re.match(r"^.*_([^_]+)_metadata.*\.xlsx", fname).groups()[0]
-            rows = self.parse_spreadsheet(fname, self.metadata_info)
             xlsx_info = self.metadata_info[os.path.basename(fname)]
             ticket = xlsx_info["ticket"]
             track_meta = self.google_track_meta.get(ticket)
@@ -605,12 +608,13 @@ class TSIIlluminaFastqMetadata(TSIBaseMetadata):
     def _get_packages(self):
         self._logger.info("Ingesting TSI metadata from {0}".format(self.path))
         packages = []
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info("Processing TSI metadata file {0}".format(fname))
             metadata_sheet_flowcell_id = re.match(
                 r"^.*_([^_]+)_metadata.*\.xlsx", fname
             ).groups()[0]
-            rows = self.parse_spreadsheet(fname, self.metadata_info)
             xlsx_info = self.metadata_info[os.path.basename(fname)]
             ticket = xlsx_info["ticket"]
             track_meta = self.google_track_meta.get(ticket)
@@ -799,7 +803,9 @@ class TSIPacbioHifiMetadata(TSIBaseMetadata):
         filename_re = files.pacbio_hifi_metadata_sheet_re
 
         objs = []
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info(
                 "Processing TSI metadata file {0}".format(os.path.basename(fname))
             )
@@ -812,7 +818,6 @@ class TSIPacbioHifiMetadata(TSIBaseMetadata):
                 if f in metadata_sheet_dict:
                     metadata_sheet_flowcell_ids.append(metadata_sheet_dict[f])
 
-            rows = self.parse_spreadsheet(fname, self.metadata_info)
             xlsx_info = self.metadata_info[os.path.basename(fname)]
             ticket = xlsx_info["ticket"]
             track_meta = self.google_track_meta.get(ticket)
@@ -1053,13 +1058,15 @@ class TSIGenomicsDDRADMetadata(TSIBaseMetadata):
 
         self._logger.info("Ingesting TSI metadata from {0}".format(self.path))
         packages = []
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info(
                 "Processing TSI metadata file {0}".format(os.path.basename(fname))
             )
             flow_id = get_flow_id(fname)
             objs = defaultdict(list)
-            for row in self.parse_spreadsheet(fname, self.metadata_info):
+            for row in rows:
                 obj = row._asdict()
                 obj.pop("file")
                 if not obj["dataset_id"] or not obj["flowcell_id"]:
@@ -57,11 +57,13 @@ class WheatCultivarsMetadata(BaseMetadata):
 
     def _get_packages(self):
         packages = []
-        for fname in glob(self.path + "/*.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/*.xlsx"), self.metadata_info
+        ):
             self._logger.info(
                 "Processing Stemcells Transcriptomics metadata file {0}".format(fname)
             )
-            for row in self.parse_spreadsheet(fname, self.metadata_info):
+            for row in rows:
                 sample_id = row.sample_id
                 if sample_id is None:
                     continue
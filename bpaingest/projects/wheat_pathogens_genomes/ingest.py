@@ -71,14 +71,17 @@ class WheatPathogensGenomesMetadata(BaseMetadata):
 
     def _get_packages(self):
         packages = []
-        for fname in glob(self.path + "/Wheat_pathogens_genomic_metadata.xlsx"):
+        for fname, sheet_rows in self.parse_spreadsheets(
+            glob(self.path + "/Wheat_pathogens_genomic_metadata.xlsx"),
+            self.metadata_info,
+        ):
             self._logger.info(
                 "Processing Stemcells Transcriptomics metadata file {0}".format(fname)
             )
             # there are duplicates by BPA ID -- the spreadsheet is per-file data
             # including MD5s. Common values per BPA ID extracted to be package metadata
             by_bpaid = defaultdict(list)
-            for row in self.parse_spreadsheet(fname, self.metadata_info):
+            for row in sheet_rows:
                 by_bpaid[row.sample_id].append(row)
             for sample_id, rows in list(by_bpaid.items()):
                 data = common_values([t._asdict() for t in rows])
@@ -125,9 +128,12 @@ class WheatPathogensGenomesMetadata(BaseMetadata):
             return os.path.split(s)[1].strip()
 
         resources = []
-        for fname in glob(self.path + "/Wheat_pathogens_genomic_metadata.xlsx"):
+        for fname, rows in self.parse_spreadsheets(
+            glob(self.path + "/Wheat_pathogens_genomic_metadata.xlsx"),
+            self.metadata_info,
+        ):
             xlsx_info = self.metadata_info[os.path.basename(fname)]
-            for row in self.parse_spreadsheet(fname, self.metadata_info):
+            for row in rows:
                 sample_id = row.sample_id
                 resource = {
                     "flowcell": row.flow_cell_id,
@@ -3,7 +3,7 @@ import os
 import re
 from collections import defaultdict
 from .projects import ProjectInfo
-from .metadata import DownloadMetadata
+from .metadata import DownloadMetadata, download_metadata_options
 from .util import make_logger
 from copy import deepcopy
 
@@ -187,7 +187,10 @@ def generate_schemas(args):
         )
         dlpath = os.path.join(args.download_path, class_info["slug"])
         with DownloadMetadata(
-            make_logger(class_info["slug"]), project_cls, path=dlpath
+            make_logger(class_info["slug"]),
+            project_cls,
+            path=dlpath,
+            **download_metadata_options(args),
         ) as dlmeta:
             meta = dlmeta.meta
             data_type = meta.ckan_data_type
@@ -1,6 +1,7 @@
 import os
 import pickle
 import re
+import time
 
 from .ops import (
     ckan_method,
@@ -12,6 +13,7 @@ from .ops import (
     CKANArchiveInfo,
     ApacheArchiveInfo,
 )
+from .ops import logger as ops_logger
 from .pkgcache import build_package_cache
 import ckanapi
 
@@ -22,10 +24,35 @@ from .resource_metadata import (
 from .util import make_logger
 from .util import prune_dict
 from .libs.multihash import S3_HASH_FIELDS
-from collections import Counter
+from .libs.ordered_map import ordered_map
+from .libs.s3_inventory import S3Inventory
+from .libs.verification_cache import VerificationCache, verified_at_now
+from collections import Counter, defaultdict
 
 logger = make_logger(__name__)
 
+DEFAULT_SYNC_CONCURRENCY = 8
+DEFAULT_CHECK_CONCURRENCY = 8
+# seconds between reports of resource check progress
+CHECK_PROGRESS_INTERVAL = 30
+# `probe` checks each resource through its CKAN download link; `inventory` lists
+# the uploaded resources on S3, and probes only those not listed
+RESOURCE_CHECK_MODES = ("probe", "inventory")
+DEFAULT_RESOURCE_CHECK_MODE = "probe"
+
+
+class SyncException(Exception):
+    pass
+
+
+def report_failures(what, failures):
+    "log a summary of the objects (name, exception) which couldn't be synced"
+    if not failures:
+        return
+    logger.error("%d %s failed to sync:" % (len(failures), what))
+    for name, e in failures:
+        logger.error("   %s: %s" % (name, e))
+
 
 def get_or_create_package(ckan, obj):
     try:
@@ -72,12 +99,12 @@ def sync_package(ckan, obj, cached_obj):
     return ckan_obj
 
 
-def delete_dangling_packages(ckan, packages, cache, do_delete):
+def delete_dangling_packages(ckan, packages, cache, do_delete, concurrency=1):
     extant_ids = set(cache.keys())
     continuing_ids = set(t["id"] for t in packages)
     to_delete = extant_ids - continuing_ids
 
-    for delete_id in to_delete:
+    def delete(delete_id):
         delete_obj = cache[delete_id]
         logger.info(
             "package for deletion: %s/%s (do_delete=%s)"
@@ -87,10 +114,33 @@ def delete_dangling_packages(ckan, packages, cache, do_delete):
             ckan_method(ckan, "package", "delete")(id=delete_id)
             logger.info("deleted package: %s/%s" % (delete_obj["id"], delete_id))
 
+    failures = []
+    for delete_id, _, e in ordered_map(
+        delete, sorted(to_delete), concurrency, (logger, ops_logger)
+    ):
+        if e is not None:
+            logger.error("package deletion failed: %s: %s" % (delete_id, e))
+            failures.append((delete_id, e))
+    report_failures("package deletions", failures)
+    return failures
+
 
-def sync_packages(ckan, ckan_data_type, packages, org, group, do_delete):
+def sync_packages(
+    ckan,
+    ckan_data_type,
+    packages,
+    org,
+    group,
+    do_delete,
+    concurrency=DEFAULT_SYNC_CONCURRENCY,
+):
+    """
+    create or patch each of `packages`, `concurrency` at a time. returns the CKAN
+    packages, in name order, and the (name, exception) of each package which
+    failed to sync or be deleted; those are logged and left out.
+    """
     # FIXME: we don't check if there are any packages we should remove (unpublish)
-    logger.info("syncing %d packages" % (len(packages)))
+    logger.info("syncing %d packages (concurrency=%d)" % (len(packages), concurrency))
     # we have to post the group back in package objects, send a minimal version of it
     api_group_obj = prune_dict(
         group,
@@ -100,24 +150,91 @@ def sync_packages(ckan, ckan_data_type, packages, org, group, do_delete):
 
     cache = build_package_cache(ckan, ckan_data_type, packages)
 
-    delete_dangling_packages(ckan, packages, cache, do_delete)
+    failures = delete_dangling_packages(ckan, packages, cache, do_delete, concurrency)
 
-    for package in sorted(packages, key=lambda p: p["name"]):
+    def sync(package):
         obj = package.copy()
         obj["owner_org"] = org["id"]
         if api_group_obj is not None:
             obj["groups"] = [api_group_obj]
-        ckan_packages.append(sync_package(ckan, obj, cache.get(obj["id"])))
-    return ckan_packages
+        return sync_package(ckan, obj, cache.get(obj["id"]))
+
+    sync_failures = []
+    for package, ckan_obj, e in ordered_map(
+        sync,
+        sorted(packages, key=lambda p: p["name"]),
+        concurrency,
+        (logger, ops_logger),
+    ):
+        if e is not None:
+            logger.error("package sync failed: %s: %s" % (package["name"], e))
+            sync_failures.append((package["name"], e))
+            continue
+        ckan_packages.append(ckan_obj)
+    report_failures("packages", sync_failures)
+    return ckan_packages, failures + sync_failures
+
+
+def write_verified_at(ckan, verified, concurrency):
+    """
+    set `s3_etag_verified_at` on the resources in `verified`, a list of
+    (ckan_obj, verified_at), with one package_revise per package. returns the
+    set of packages which couldn't be revised.
+    """
+    by_package = defaultdict(dict)
+    for ckan_obj, verified_at in verified:
+        by_package[ckan_obj["package_id"]][
+            "update__resources__%s" % (ckan_obj["id"])
+        ] = {"s3_etag_verified_at": verified_at}
+
+    def revise(package_id):
+        ckan_method(ckan, "package", "revise")(
+            match={"id": package_id}, **by_package[package_id]
+        )
 
+    logger.info(
+        "recording verification of %d resources, in %d packages"
+        % (len(verified), len(by_package))
+    )
+    failures = []
+    for package_id, _, e in ordered_map(
+        revise, sorted(by_package), concurrency, (logger, ops_logger)
+    ):
+        if e is not None:
+            failures.append((package_id, e))
+    report_failures("verification timestamps (packages)", failures)
+    return set(package_id for package_id, _ in failures)
 
-def check_resources(ckan, current_resources, resource_id_legacy_url, auth, num_threads):
-    ckan_archive_info = CKANArchiveInfo(ckan)
-    apache_archive_info = ApacheArchiveInfo(auth)
-    to_reupload = []
 
-    def check(current_ckan_obj, legacy_url, current_url):
+def check_resources(
+    ckan,
+    current_resources,
+    resource_id_legacy_url,
+    auth,
+    num_threads,
+    listing_index=None,
+    inventory=None,
+    verification_cache=None,
+):
+    ckan_archive_info = CKANArchiveInfo(
+        ckan, inventory=inventory, pool_size=num_threads
+    )
+    apache_archive_info = ApacheArchiveInfo(
+        auth, listing_index=listing_index, pool_size=num_threads
+    )
+    to_reupload = []
+    # (ckan_obj, verified_at, (legacy size, S3 size, etag)) to write back to CKAN;
+    # a failed check clears verified_at
+    write_back = []
+
+    def check(current_ckan_obj):
+        """
+        returns (resource_issue, (legacy size, S3 size, etag)); the sizes and
+        etag are only given if the check passed
+        """
         obj_id = current_ckan_obj["id"]
+        current_url = current_ckan_obj.get("url")
+        legacy_url = resource_id_legacy_url.get(obj_id)
         resource_issue = check_resource(
             ckan_archive_info,
             apache_archive_info,
@@ -130,27 +247,101 @@ def check_resources(ckan, current_resources, resource_id_legacy_url, auth, num_t
                 "resource check failed (%s) queued for re-upload: %s"
                 % (resource_issue, obj_id)
             )
-            to_reupload.append((current_ckan_obj, legacy_url))
-        else:
-            logger.info("resource check OK: %s" % (obj_id))
-
-    logger.info("%d resources to be checked" % (len(current_resources)))
-    for current_ckan_obj in current_resources:
+            return resource_issue, None
+        logger.info("resource check OK: %s" % (obj_id))
+        # both are cached by the check
+        probe = ckan_archive_info.probe(current_url)
+        return None, (apache_archive_info.get_size(legacy_url), probe.size, probe.etag)
+
+    if verification_cache is not None:
+        to_check = [
+            t for t in current_resources if not verification_cache.is_verified(t)
+        ]
+        skipped = len(current_resources) - len(to_check)
+        logger.warning(
+            "%d of %d resource checks skipped: verified in the last %g days "
+            "(%d in the local cache, %d in CKAN), and unchanged"
+            % (
+                skipped,
+                len(current_resources),
+                verification_cache.max_age.total_seconds() / 86400,
+                skipped - verification_cache.ckan_hits,
+                verification_cache.ckan_hits,
+            )
+        )
+        current_resources = to_check
+
+    total = len(current_resources)
+    logger.info("%d resources to be checked (concurrency=%d)" % (total, num_threads))
+    start = last_report = time.monotonic()
+    for checked, (current_ckan_obj, result, e) in enumerate(
+        ordered_map(check, current_resources, num_threads, (logger, ops_logger)),
+        1,
+    ):
+        if e is not None:
+            raise e
+        resource_issue, verification = result
         obj_id = current_ckan_obj["id"]
-        legacy_url = resource_id_legacy_url.get(obj_id)
-        current_url = current_ckan_obj.get("url")
-        check(current_ckan_obj, legacy_url, current_url)
+        if resource_issue:
+            to_reupload.append((current_ckan_obj, resource_id_legacy_url.get(obj_id)))
+            if verification_cache is not None:
+                verification_cache.forget(obj_id)
+                if current_ckan_obj.get("s3_etag_verified_at"):
+                    write_back.append((current_ckan_obj, "", None))
+        elif verification_cache is not None:
+            write_back.append((current_ckan_obj, verified_at_now(), verification))
+        now = time.monotonic()
+        if now - last_report >= CHECK_PROGRESS_INTERVAL or checked == total:
+            last_report = now
+            logger.info(
+                "resource check progress: %d/%d (%.1f checks/second)"
+                % (checked, total, checked / max(now - start, 1e-6))
+            )
+            if verification_cache is not None:
+                verification_cache.commit()
+    if inventory is not None:
+        logger.info(
+            "S3 inventory: %d resources found, %d probed"
+            % (inventory.hits, inventory.misses)
+        )
+    if write_back:
+        failed = write_verified_at(
+            ckan, [(t, verified_at) for t, verified_at, _ in write_back], num_threads
+        )
+        # a verification is only remembered once CKAN has it too
+        for ckan_obj, verified_at, verification in write_back:
+            if verification is not None and ckan_obj["package_id"] not in failed:
+                verification_cache.record(ckan_obj, *verification, verified_at)
+        verification_cache.commit()
 
     return to_reupload
 
 
-def check_package_resources(ckan, ckan_packages, resource_id_legacy_url, auth):
+def check_package_resources(
+    ckan,
+    ckan_packages,
+    resource_id_legacy_url,
+    auth,
+    listing_index=None,
+    concurrency=DEFAULT_CHECK_CONCURRENCY,
+    inventory=None,
+    verification_cache=None,
+):
     all_resources = []
     for package_obj in sorted(ckan_packages, key=lambda p: p["name"]):
         current_resources = package_obj["resources"]
         all_resources += current_resources
 
-    return check_resources(ckan, all_resources, resource_id_legacy_url, auth, 8)
+    return check_resources(
+        ckan,
+        all_resources,
+        resource_id_legacy_url,
+        auth,
+        concurrency,
+        listing_index=listing_index,
+        inventory=inventory,
+        verification_cache=verification_cache,
+    )
 
 
 def sync_package_resources(
@@ -208,6 +399,13 @@ def sync_package_resources(
             logger.debug("skipping patch of unknown resource: {}".format(obj_id))
             continue
         legacy_url = resource_id_legacy_url[obj_id]
+        if any(
+            t in resource_obj and resource_obj[t] != current_ckan_obj.get(t)
+            for t in ("url", "md5")
+        ):
+            # the resource must be checked again (it may have been verified in
+            # this run, since package_obj was fetched)
+            resource_obj = dict(resource_obj, s3_etag_verified_at="")
         was_patched, ckan_obj = patch_if_required(
             ckan, "resource", current_ckan_obj, resource_obj
         )
@@ -217,12 +415,36 @@ def sync_package_resources(
     return to_reupload
 
 
+def reupload_destination(ckan):
+    "the S3 bucket and path that resources are uploaded to"
+    if re.search("staging.bioplatforms", getattr(ckan, "address", "")):
+        return "bpa-ckan-devel/staging"
+    return "bpa-ckan-prod/prodenv"
+
+
+def load_inventory(ckan, endpoint_url=None):
+    "the S3Inventory of uploaded resources, or None if it can't be listed"
+    destination = reupload_destination(ckan)
+    logger.info("Listing uploaded resources under: {}".format(destination))
+    try:
+        inventory = S3Inventory.from_destination(
+            destination, endpoint_url=endpoint_url
+        ).load()
+    except Exception as e:
+        logger.error(
+            "unable to list uploaded resources, probing each resource: {}".format(e)
+        )
+        return None
+    logger.info(
+        "S3 inventory: %d objects, in %d pages" % (len(inventory), inventory.pages)
+    )
+    return inventory
+
+
 def reupload_resources(ckan, to_reupload, resource_id_legacy_url, auth, num_threads):
     total_reuploads = len(to_reupload)
     logger.info("%d objects to be re-uploaded" % (total_reuploads))
-    destination = "bpa-ckan-prod/prodenv"
-    if re.search("staging.bioplatforms", getattr(ckan, "address", "")):
-        destination = "bpa-ckan-devel/staging"
+    destination = reupload_destination(ckan)
     logger.info("Resources will be reuploaded under: {}".format(destination))
     # copy list and loop that, so can remove safely from original during loop
     for indx, (reupload_obj, legacy_url) in enumerate(to_reupload[:]):
@@ -295,10 +517,31 @@ def sync_resources(
             to_reupload = pickle.load(reader)
         logger.info(f"Reuploads disk cache read completed.")
     else:
+        inventory = None
+        if kwargs.get("resource_check_mode") == "inventory":
+            inventory = load_inventory(ckan, kwargs.get("s3_endpoint_url"))
+        verification_cache = None
+        if kwargs.get("verification_cache_path"):
+            verification_cache = VerificationCache(
+                kwargs["verification_cache_path"],
+                kwargs["verification_max_age"],
+                trust_ckan=kwargs.get("trust_ckan_verification", False),
+            )
         # check all existing resources on all existing packages, in parallel
-        to_reupload = check_package_resources(
-            ckan, ckan_packages, resource_id_legacy_url, auth
-        )
+        try:
+            to_reupload = check_package_resources(
+                ckan,
+                ckan_packages,
+                resource_id_legacy_url,
+                auth,
+                listing_index=kwargs.get("listing_index"),
+                concurrency=kwargs.get("check_concurrency", DEFAULT_CHECK_CONCURRENCY),
+                inventory=inventory,
+                verification_cache=verification_cache,
+            )
+        finally:
+            if verification_cache is not None:
+                verification_cache.close()
 
     logger.info(
         f"Before the package resources sync, reupload count is: {len(to_reupload)}"
@@ -354,8 +597,14 @@ def sync_metadata(
         logger, ckan, meta, packages, resources
     )
     validate_raw_resources_file_metadata(logger, raw_resources_metadata, auth)
-    ckan_packages = sync_packages(
-        ckan, meta.ckan_data_type, packages, organization, None, do_delete
+    ckan_packages, failures = sync_packages(
+        ckan,
+        meta.ckan_data_type,
+        packages,
+        organization,
+        None,
+        do_delete,
+        kwargs.get("sync_concurrency", DEFAULT_SYNC_CONCURRENCY),
     )
     sync_resources(
         ckan,
@@ -369,3 +618,9 @@ def sync_metadata(
         do_delete,
         **kwargs,
     )
+    # the packages which failed were left out, so that the rest could be synced
+    if failures:
+        raise SyncException(
+            "%d packages failed to sync: %s"
+            % (len(failures), ", ".join(name for name, _ in failures))
+        )
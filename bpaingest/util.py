@@ -10,6 +10,8 @@ from hashlib import md5
 import ckanapi
 from dateutil.relativedelta import relativedelta
 
+from .libs.http_client import make_session
+
 
 def one(l):
     if len(l) != 1:
@@ -87,9 +89,13 @@ def make_logger(name, level=logging.INFO):
     return logger
 
 
-def make_ckan_api(args):
+def make_ckan_api(args, pool_size=None):
+    "`pool_size` is the number of threads which will share the CKAN session"
     ckan = ckanapi.RemoteCKAN(
-        args.ckan_url, apikey=args.api_key, verify_ssl=args.verify_ssl
+        args.ckan_url,
+        apikey=args.api_key,
+        verify_ssl=args.verify_ssl,
+        session=make_session(pool_size),
     )
     return ckan
 